@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+1BIP Access Log Writer
+Batches access log rows into multi-row INSERTs in a background thread, and spills them to a journal file while the
+database is unreachable, so frame processing never waits on Postgres. Rows the database rejects are set aside
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple, Type
+
+from journal import Journal, PartialDeliveryError, Row
+from pipeline import StageStats
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLogWriter(threading.Thread):
+    """
+    Collects rows from a bounded queue and writes them every `flush_seconds` or `batch_size` rows. When a write
+    fails, the batch goes to the journal and the database is retried every `retry_seconds`; the journal is replayed
+    before new rows, so rows stay in order. Rows submitted while the queue is full go straight to the journal.
+    Only `transient_errors` mean an outage: a batch failing with another error is written row by row, and the rows
+    still failing go to `rejected`, so one bad row cannot block the journal
+    """
+
+    def __init__(self, write: Callable[[List[Row]], None], journal: Journal, rejected: Journal, stats: StageStats,
+                 transient_errors: Tuple[Type[Exception], ...] = (ConnectionError,), batch_size: int = 100,
+                 flush_seconds: float = 0.5, maxsize: int = 10000, retry_seconds: float = 5.0):
+        super().__init__(name='access-log-writer', daemon=True)
+        self.write = write  # inserts rows of access_logs column -> JSON serializable value
+        self.journal = journal
+        self.rejected = rejected
+        self.transient_errors = transient_errors
+        self.stats = stats
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retry_seconds = retry_seconds
+        self.queue = queue.Queue(maxsize)
+        self.retry_at = 0.0  # During an outage, rows are journaled without trying the database until then
+        self.stopping = threading.Event()
+
+    def submit(self, row: Row):
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            logger.warning("Access log queue is full, journaling the row")
+            self.stats.drop()
+            self.journal.append([row])
+
+    def run(self):
+        while True:
+            rows = self._collect()
+            if rows is None:
+                return
+            if rows or self.journal.pending():
+                self._flush(rows)
+
+    def stop(self, timeout: float = None):
+        """Write the queued rows, to the journal if the database is still unreachable, and stop"""
+        self.stopping.set()
+        self.queue.put(None)
+        self.join(timeout)
+
+    def _collect(self) -> Optional[List[Row]]:
+        """Rows of the next batch, None once stopped and the queue is empty"""
+        rows = []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(rows) < self.batch_size:
+            try:
+                row = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if row is None:
+                if rows:
+                    self._flush(rows)
+                return None
+            rows.append(row)
+        return rows
+
+    def _flush(self, rows: List[Row]):
+        now = time.monotonic()
+        if now < self.retry_at and not self.stopping.is_set():
+            if rows and not self.journal.append(rows):
+                self.stats.drop(len(rows))
+            return
+
+        started = now
+        try:
+            if self.journal.pending():
+                # keeps the order: older journaled rows first
+                if rows and not self.journal.append(rows):
+                    self.stats.drop(len(rows))
+                rows = []
+                replayed = self.journal.replay(self._write, self.batch_size)
+                if replayed:
+                    logger.info(f"✓ Database reachable again, wrote {replayed} journaled access log row(s)")
+            if rows:
+                self._write(rows)
+        except (PartialDeliveryError,) + self.transient_errors as e:
+            self.stats.error()
+            self.retry_at = time.monotonic() + self.retry_seconds
+            if isinstance(e, PartialDeliveryError):
+                rows = rows[e.delivered:]
+            if rows and not self.journal.append(rows):
+                self.stats.drop(len(rows))
+            logger.error(f"Failed to write access logs, journaling them and retrying in {self.retry_seconds}s: {e}")
+        else:
+            self.retry_at = 0.0
+            self.stats.record(time.monotonic() - started)
+
+    def _write(self, rows: List[Row]):
+        """
+        Write the rows, one by one if the database rejects the batch, setting aside the rows it rejects.
+        Raises the transient errors, as PartialDeliveryError once some rows are written
+        """
+        try:
+            self.write(rows)
+            return
+        except self.transient_errors:
+            raise
+        except Exception as e:
+            if len(rows) == 1:
+                self._reject(rows, e)
+                return
+            logger.warning(f"Database rejected a batch of {len(rows)} access log rows, writing them one by one: {e}")
+        for idx, row in enumerate(rows):
+            try:
+                self.write([row])
+            except self.transient_errors as e:
+                raise PartialDeliveryError(idx, e) from e
+            except Exception as e:
+                self._reject([row], e)
+
+    def _reject(self, rows: List[Row], error: Exception):
+        logger.error(f"Database rejected an access log row, moving it to {self.rejected.path}: {error}")
+        self.stats.drop(len(rows))
+        self.rejected.append(rows)
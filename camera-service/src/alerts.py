@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+1BIP Alert Engine
+Decides in memory which unauthorized access alerts are sent (deduplication and rate limit), and delivers them to
+the webhook from a background thread through a persistent outbox
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from journal import Journal
+from pipeline import StageStats
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` events on average, in bursts of up to `burst`"""
+
+    def __init__(self, rate_per_minute: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self) -> bool:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AlertEngine:
+    """
+    An alert is sent unless one of its keys (camera + track, subject) was alerted during the last
+    `cooldown_seconds`, and within the token bucket of its camera, so one intruder is alerted once and a crowd
+    cannot flood the webhook. At most `max_keys` keys are remembered, the oldest are evicted first
+    """
+
+    def __init__(self, cooldown_seconds: float, rate_per_minute: float, burst: int, max_keys: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.cooldown_seconds = cooldown_seconds
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.last_alert = OrderedDict()  # key -> time of its last alert, oldest first
+        self.buckets = {}  # camera id -> TokenBucket
+        self.suppressed = 0
+        self.rate_limited = 0
+
+    def should_alert(self, camera_id: str, track_id: Optional[int], subject_name: Optional[str]) -> bool:
+        keys = self.alert_keys(camera_id, track_id, subject_name)
+        with self.lock:
+            now = self.clock()
+            self._evict(now)
+            if any(key in self.last_alert for key in keys):
+                self.suppressed += 1
+                return False
+            bucket = self.buckets.setdefault(camera_id, TokenBucket(self.rate_per_minute, self.burst, self.clock))
+            if not bucket.take():
+                self.rate_limited += 1
+                return False
+            for key in keys:
+                self.last_alert[key] = now
+                self.last_alert.move_to_end(key)
+            while len(self.last_alert) > self.max_keys:
+                self.last_alert.popitem(last=False)
+            return True
+
+    @staticmethod
+    def alert_keys(camera_id: str, track_id: Optional[int], subject_name: Optional[str]) -> Iterable[str]:
+        """Unknown people have no subject, their alerts are deduplicated by track only"""
+        keys = [f'track:{camera_id}:{track_id}' if track_id is not None else f'camera:{camera_id}']
+        if subject_name:
+            keys.append(f'subject:{subject_name}')
+        return keys
+
+    def _evict(self, now: float):
+        while self.last_alert:
+            key, alerted_at = next(iter(self.last_alert.items()))
+            if now - alerted_at <= self.cooldown_seconds:
+                return
+            self.last_alert.popitem(last=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'keys': len(self.last_alert), 'suppressed': self.suppressed, 'rate_limited': self.rate_limited}
+
+
+class WebhookError(Exception):
+    pass
+
+
+class WebhookDispatcher(threading.Thread):
+    """
+    Posts the alerts of the outbox to the webhook, `batch_size` alerts per request (one alert is posted as is,
+    several as {"alerts": [...]}). Alerts stay in the outbox until the webhook accepts them, also across restarts;
+    failed requests are retried with exponential backoff and jitter, up to `max_backoff_seconds` apart
+    """
+
+    def __init__(self, url: str, outbox: Journal, stats: StageStats, batch_size: int = 1, timeout: float = 5.0,
+                 backoff_seconds: float = 1.0, max_backoff_seconds: float = 60.0):
+        super().__init__(name='webhook', daemon=True)
+        self.url = url
+        self.outbox = outbox
+        self.stats = stats
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.session = requests.Session()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.failures = 0
+
+    def submit(self, alert: Dict[str, Any]) -> bool:
+        """Add the alert to the outbox, False if the outbox is full"""
+        if not self.outbox.append([alert]):
+            self.stats.drop()
+            return False
+        self.wakeup.set()
+        return True
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.clear()
+            delay = None
+            if self.outbox.pending():
+                try:
+                    self.outbox.replay(self._post, self.batch_size)
+                    self.failures = 0
+                except WebhookError as e:
+                    self.failures += 1
+                    delay = random.uniform(0, min(self.max_backoff_seconds,
+                                                  self.backoff_seconds * 2 ** (self.failures - 1)))
+                    logger.error(f"Webhook alert failed, retrying in {delay:.1f}s: {e}")
+            # wakes up on new alerts, or for the retry
+            if delay is not None:
+                self.stopped.wait(delay)
+            else:
+                self.wakeup.wait(1.0)
+
+    def stop(self, timeout: float = None):
+        """Stop, the alerts not delivered yet stay in the outbox"""
+        self.stopped.set()
+        self.wakeup.set()
+        self.join(timeout)
+
+    def _post(self, alerts: List[Dict[str, Any]]):
+        started = time.monotonic()
+        payload = alerts[0] if len(alerts) == 1 else {'alerts': alerts}
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.stats.error()
+            raise WebhookError(e)
+        if response.status_code >= 500 or response.status_code == 429:
+            self.stats.error()
+            raise WebhookError(f"{response.status_code} - {response.text[:200]}")
+        if response.status_code >= 400:
+            # retrying a rejected payload would block the outbox forever
+            logger.error(f"Webhook rejected {len(alerts)} alert(s), dropping them: {response.status_code}")
+            self.stats.drop(len(alerts))
+            return
+        logger.info(f"{len(alerts)} alert(s) sent to webhook successfully")
+        self.stats.record(time.monotonic() - started)
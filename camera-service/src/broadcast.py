@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+1BIP MJPEG Broadcaster
+Encodes each new frame of a camera once, at preview size and quality, and fans the JPEG out to all stream viewers
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, Optional
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class StreamClient:
+    """A viewer of the stream: the parts not sent yet, the oldest dropped when the viewer is slow"""
+
+    def __init__(self, queue_size: int):
+        self.parts = deque(maxlen=queue_size)
+        self.closed = False
+
+
+class MjpegBroadcaster:
+    """
+    One encoding thread per camera, running while someone watches. A frame is encoded when it is new, at most
+    `fps` times per second, downscaled to `max_width`. Each viewer gets the same bytes through its own queue of
+    `queue_size` parts, so a slow viewer only drops its own frames
+    """
+
+    def __init__(self, camera, max_width: int = 1280, jpeg_quality: int = 70, fps: float = 15.0,
+                 queue_size: int = 2, keepalive_seconds: float = 2.0):
+        self.camera = camera
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.queue_size = queue_size
+        self.keepalive_seconds = keepalive_seconds
+        self.condition = threading.Condition()
+        self.clients = []
+        self.thread = None
+        self.last_part = None
+        self.encoded = 0
+        self.dropped = 0
+
+    def subscribe(self) -> StreamClient:
+        with self.condition:
+            client = StreamClient(self.queue_size)
+            self.clients.append(client)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f'mjpeg-{self.camera.camera_id}',
+                                               daemon=True)
+                self.thread.start()
+            return client
+
+    def unsubscribe(self, client: StreamClient):
+        with self.condition:
+            client.closed = True
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def parts(self, client: StreamClient) -> Iterator[bytes]:
+        """
+        MJPEG parts for the viewer, as they are encoded. Without new frames the last part is repeated every
+        `keepalive_seconds`, the server only notices disconnected viewers when writing to them
+        """
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: client.parts or client.closed, self.keepalive_seconds)
+                if client.closed:
+                    return
+                part = client.parts.popleft() if client.parts else self.last_part
+            if part is not None:
+                yield part
+
+    def _run(self):
+        sequence = 0
+        next_time = 0.0
+        while True:
+            with self.condition:
+                if not self.clients:
+                    self.thread = None  # a new viewer starts a new thread
+                    return
+            # sleeps until a new frame, at most `fps` per second, checking for viewers every second
+            time.sleep(max(next_time - time.monotonic(), 0))
+            sequence, frame = self.camera.frames.wait_next(sequence, timeout=1.0)
+            if frame is None:
+                continue
+            next_time = time.monotonic() + self.interval
+            part = self._encode(frame)
+            if part is not None:
+                self._publish(part)
+
+    def _encode(self, frame) -> Optional[bytes]:
+        if self.max_width and frame.shape[1] > self.max_width:
+            height = round(frame.shape[0] * self.max_width / frame.shape[1])
+            frame = cv2.resize(frame, (self.max_width, height), interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ret:
+            return None
+        self.encoded += 1
+        return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n'
+
+    def _publish(self, part: bytes):
+        with self.condition:
+            self.last_part = part
+            for client in self.clients:
+                if len(client.parts) == client.parts.maxlen:
+                    self.dropped += 1
+                client.parts.append(part)
+            self.condition.notify_all()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.condition:
+            return {'clients': len(self.clients), 'encoded': self.encoded, 'dropped': self.dropped}
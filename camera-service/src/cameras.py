@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+1BIP Camera Configuration
+Cameras of a camera service process, from the environment (one camera) or from a cameras file (several cameras)
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+
+from motion import MotionGate
+from pipeline import Frame, FrameExchange, FrameGrabber, StageStats
+from preprocessing import FramePreprocessor
+from tracking import FaceTracker
+
+logger = logging.getLogger(__name__)
+
+
+class CameraConfig:
+    """Settings of one camera, the ones missing in the cameras file default to the service Config"""
+
+    def __init__(self, camera_id: str, name: str, location: str, rtsp_url: str,
+                 frame_skip: int, frame_width: int, frame_height: int, max_fps: float = 0.0,
+                 motion: Dict[str, Any] = None, tracking: Dict[str, Any] = None,
+                 preprocessing: Dict[str, Any] = None):
+        self.camera_id = camera_id
+        self.name = name
+        self.location = location
+        self.rtsp_url = rtsp_url
+        self.frame_skip = frame_skip
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.max_fps = max_fps  # Frames per second sent to recognition, 0 - no limit
+        self.motion = motion or {}  # MotionGate arguments: enabled, roi, threshold, keepalive_seconds...
+        self.tracking = tracking or {}  # FaceTracker arguments: iou_threshold, timeout_seconds...
+        self.preprocessing = preprocessing or {}  # FramePreprocessor arguments: crop, max_side, jpeg_quality
+
+    @classmethod
+    def from_env(cls, config) -> 'CameraConfig':
+        """The single camera of CAMERA_* environment variables"""
+        return cls(camera_id=slugify(config.CAMERA_NAME), name=config.CAMERA_NAME,
+                   location=config.CAMERA_LOCATION, rtsp_url=config.CAMERA_RTSP_URL,
+                   frame_skip=config.FRAME_SKIP, frame_width=config.FRAME_WIDTH,
+                   frame_height=config.FRAME_HEIGHT, max_fps=config.MAX_FPS_PER_CAMERA,
+                   motion=motion_settings({}, config), tracking=tracking_settings({}, config),
+                   preprocessing=preprocessing_settings({}, config))
+
+    @classmethod
+    def from_dict(cls, data: Dict, config) -> 'CameraConfig':
+        """A camera of the cameras file"""
+        if not data.get('rtsp_url') or not data.get('name'):
+            raise ValueError(f"Camera needs 'name' and 'rtsp_url': {data}")
+        return cls(camera_id=data.get('id') or slugify(data['name']), name=data['name'],
+                   location=data.get('location', ''), rtsp_url=data['rtsp_url'],
+                   frame_skip=int(data.get('frame_skip', config.FRAME_SKIP)),
+                   frame_width=int(data.get('frame_width', config.FRAME_WIDTH)),
+                   frame_height=int(data.get('frame_height', config.FRAME_HEIGHT)),
+                   max_fps=float(data.get('max_fps', config.MAX_FPS_PER_CAMERA)),
+                   motion=motion_settings(data.get('motion', {}), config),
+                   tracking=tracking_settings(data.get('tracking', {}), config),
+                   preprocessing=preprocessing_settings(data.get('preprocessing', {}), config))
+
+
+def motion_settings(data: Dict, config) -> Dict[str, Any]:
+    """MotionGate arguments of a camera, the missing ones default to MOTION_* variables"""
+    return {
+        'enabled': bool(data.get('enabled', config.MOTION_GATE)),
+        'roi': data.get('roi', config.MOTION_ROI),
+        'threshold': float(data.get('threshold', config.MOTION_THRESHOLD)),
+        'pixel_threshold': int(data.get('pixel_threshold', config.MOTION_PIXEL_THRESHOLD)),
+        'keepalive_seconds': float(data.get('keepalive_seconds', config.MOTION_KEEPALIVE_SECONDS)),
+    }
+
+
+def tracking_settings(data: Dict, config) -> Dict[str, Any]:
+    """FaceTracker arguments of a camera, the missing ones default to TRACK_* variables"""
+    return {
+        'iou_threshold': float(data.get('iou_threshold', config.TRACK_IOU_THRESHOLD)),
+        'max_centroid_distance': float(data.get('max_centroid_distance', config.TRACK_MAX_CENTROID_DISTANCE)),
+        'timeout_seconds': float(data.get('timeout_seconds', config.TRACK_TIMEOUT_SECONDS)),
+        'max_seconds': float(data.get('max_seconds', config.TRACK_MAX_SECONDS)),
+        'confirm_frames': int(data.get('confirm_frames', config.TRACK_CONFIRM_FRAMES)),
+    }
+
+
+def preprocessing_settings(data: Dict, config) -> Dict[str, Any]:
+    """FramePreprocessor arguments of a camera, the missing ones default to RECOGNITION_* variables"""
+    return {
+        'crop': data.get('crop', config.RECOGNITION_CROP),
+        'max_side': int(data.get('max_side', config.RECOGNITION_MAX_SIDE)),
+        'jpeg_quality': int(data.get('jpeg_quality', config.RECOGNITION_JPEG_QUALITY)),
+    }
+
+
+def slugify(name: str) -> str:
+    """Camera id for URLs and file names, e.g. 'Main Entrance Gate' -> 'main-entrance-gate'"""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'camera'
+
+
+def load_cameras(config) -> List[CameraConfig]:
+    """Cameras of CAMERAS_CONFIG file if it exists, otherwise the single camera of the environment"""
+    if not config.CAMERAS_CONFIG or not os.path.exists(config.CAMERAS_CONFIG):
+        return [CameraConfig.from_env(config)]
+
+    with open(config.CAMERAS_CONFIG) as f:
+        data = json.load(f)
+    cameras = [CameraConfig.from_dict(camera, config) for camera in data.get('cameras', [])]
+    if not cameras:
+        raise ValueError(f"No cameras in {config.CAMERAS_CONFIG}")
+
+    ids = [camera.camera_id for camera in cameras]
+    duplicates = sorted({camera_id for camera_id in ids if ids.count(camera_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate camera ids in {config.CAMERAS_CONFIG}: {duplicates}")
+    logger.info(f"Loaded {len(cameras)} camera(s) from {config.CAMERAS_CONFIG}")
+    return cameras
+
+
+class FpsBudget:
+    """Admits at most `max_fps` frames per second, 0 - every frame"""
+
+    def __init__(self, max_fps: float, clock: Callable[[], float] = time.monotonic):
+        self.interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.clock = clock
+        self.next_time = 0.0
+
+    def admit(self) -> bool:
+        if not self.interval:
+            return True
+        now = self.clock()
+        if now < self.next_time:
+            return False
+        # keeps the average rate when frames arrive slightly late, restarts from now after a pause
+        start = self.next_time if now - self.next_time < self.interval else now
+        self.next_time = start + self.interval
+        return True
+
+
+class Camera:
+    """Capture state of one camera: its grabber, the latest frame for streaming and its counters"""
+
+    def __init__(self, config: CameraConfig, stats: StageStats,
+                 connect: Callable[['Camera'], Optional[cv2.VideoCapture]],
+                 on_frame: Callable[['Camera', Frame], None], reconnect_delay: float):
+        self.config = config
+        self.camera_id = config.camera_id
+        self.stats = stats
+        self.budget = FpsBudget(config.max_fps)
+        self.motion_gate = MotionGate(**config.motion)
+        self.tracker = FaceTracker(**config.tracking)
+        self.preprocessor = FramePreprocessor(**config.preprocessing)
+        self.frame_count = 0
+        self.frames = FrameExchange()  # Latest frame, raw or annotated, for streaming
+        self.grabber = FrameGrabber(lambda: connect(self), reconnect_delay, stats,
+                                    lambda frame: on_frame(self, frame), source=config.camera_id)
+
+    @property
+    def streaming(self) -> bool:
+        return self.frames.sequence > 0
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+1BIP Journal
+Append-only JSON lines file of rows waiting for delivery: access logs while the database is unreachable,
+webhook alerts until the webhook accepts them
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+
+
+class PartialDeliveryError(Exception):
+    """Raised by a replay `write` that failed after delivering the first `delivered` rows of its batch"""
+
+    def __init__(self, delivered: int, error: Exception):
+        super().__init__(str(error))
+        self.delivered = delivered
+        self.error = error
+
+
+class Journal:
+    """Rows not yet delivered, one JSON object per line, kept across restarts"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.replay_lock = threading.Lock()
+        self.dropped = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def append(self, rows: List[Row]) -> bool:
+        """False if the journal is full and the rows were dropped"""
+        with self.lock:
+            if self.size() >= self.max_bytes:
+                self.dropped += len(rows)
+                logger.error(f"Journal {self.path} is full ({self.max_bytes} bytes), dropping {len(rows)} row(s)")
+                return False
+            with open(self.path, 'a') as f:
+                f.writelines(json.dumps(row) + '\n' for row in rows)
+            return True
+
+    def replay(self, write: Callable[[List[Row]], None], batch_size: int) -> int:
+        """
+        Deliver the journal rows in batches, oldest first. Delivered batches are removed from the journal even if a
+        later batch fails, so no row is delivered twice. Rows can be appended meanwhile, `write` runs without the
+        lock. Returns the number of rows delivered
+        """
+        with self.replay_lock:
+            with self.lock:
+                rows, offset = self._read()
+            written = 0
+            try:
+                while written < len(rows):
+                    batch = rows[written:written + batch_size]
+                    try:
+                        write(batch)
+                    except PartialDeliveryError as e:
+                        written += e.delivered
+                        raise
+                    written += len(batch)
+            finally:
+                with self.lock:
+                    appended, _ = self._read(offset)
+                    self._rewrite(rows[written:] + appended)
+            return written
+
+    def pending(self) -> bool:
+        return self.size() > 0
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _read(self, offset: int = 0) -> Tuple[List[Row], int]:
+        """Rows from the byte `offset` on, and the offset of the end of the file"""
+        rows = []
+        if not os.path.exists(self.path):
+            return rows, 0
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    logger.error(f"Skipping corrupted line of {self.path}: {line[:100]!r}")
+            return rows, f.tell()
+
+    def _rewrite(self, rows: List[Row]):
+        if not rows:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+        os.replace(tmp_path, self.path)
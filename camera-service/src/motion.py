@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+1BIP Motion Gate
+Sends a frame to face recognition only when something moves in the region of interest of the camera
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+# Polygon of (x, y) points relative to the frame size, from (0, 0) top-left to (1, 1) bottom-right
+Polygon = Sequence[Sequence[float]]
+
+
+class MotionGate:
+    """
+    Compares a small grayscale copy of each frame with a running-average background, so the check costs a few
+    milliseconds even for 2560x1440 frames and slow lighting changes are absorbed into the background.
+    A frame passes when the share of changed pixels inside the ROI reaches `threshold`, and at least every
+    `keepalive_seconds` without motion (0 - never).
+    """
+
+    def __init__(self, roi: Optional[List[Polygon]] = None, threshold: float = 0.01, pixel_threshold: int = 25,
+                 keepalive_seconds: float = 10.0, width: int = 160, learning_rate: float = 0.05,
+                 enabled: bool = True, clock: Callable[[], float] = time.monotonic):
+        self.roi = roi or []
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.keepalive_seconds = keepalive_seconds
+        self.width = width
+        self.learning_rate = learning_rate
+        self.enabled = enabled
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.background = None
+        self.mask = None
+        self.mask_pixels = 0
+        self.last_passed = None
+        self.last_motion = 0.0
+        self.passed = 0
+        self.skipped = 0
+
+    def check(self, image: np.ndarray) -> bool:
+        """True if the frame should be sent to recognition"""
+        if not self.enabled:
+            return True
+        with self.lock:
+            small = self._preprocess(image)
+            if self.background is None or self.background.shape != small.shape:
+                self.background = small.astype(np.float32)
+                self.mask, self.mask_pixels = self._roi_mask(small.shape)
+                self.last_motion = 1.0
+            else:
+                self.last_motion = self._motion(small)
+                cv2.accumulateWeighted(small, self.background, self.learning_rate)
+
+            now = self.clock()
+            keepalive = (self.keepalive_seconds > 0 and self.last_passed is not None
+                         and now - self.last_passed >= self.keepalive_seconds)
+            if self.last_passed is None or self.last_motion >= self.threshold or keepalive:
+                self.last_passed = now
+                self.passed += 1
+                return True
+            self.skipped += 1
+            return False
+
+    def _preprocess(self, image: np.ndarray) -> np.ndarray:
+        height = max(1, round(image.shape[0] * self.width / image.shape[1]))
+        small = cv2.resize(image, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # removes sensor noise and compression artifacts, which would otherwise count as motion
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _roi_mask(self, shape):
+        if not self.roi:
+            return None, shape[0] * shape[1]
+        mask = np.zeros(shape, dtype=np.uint8)
+        size = np.array([shape[1] - 1, shape[0] - 1], dtype=np.float32)
+        polygons = [np.round(np.array(polygon, dtype=np.float32) * size).astype(np.int32) for polygon in self.roi]
+        cv2.fillPoly(mask, polygons, 1)
+        return mask.astype(bool), max(int(np.count_nonzero(mask)), 1)
+
+    def _motion(self, small: np.ndarray) -> float:
+        """Share of ROI pixels that differ from the background"""
+        changed = cv2.absdiff(small, cv2.convertScaleAbs(self.background)) > self.pixel_threshold
+        if self.mask is not None:
+            changed &= self.mask
+        return np.count_nonzero(changed) / self.mask_pixels
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'passed': self.passed,
+            'skipped': self.skipped,
+            'last_motion': round(self.last_motion, 4)
+        }
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+1BIP Camera Pipeline
+Capture, inference and writer stages of the camera service, each running in its own threads
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# camera - id of the source camera, number - sequence number of the frame since start,
+# captured_at - time.monotonic() of the read
+Frame = namedtuple('Frame', 'camera number image captured_at')
+
+
+class FrameExchange:
+    """
+    Latest frame of a camera, shared with any number of readers without copies. Each published frame gets the next
+    sequence number, readers wait for a newer one instead of polling. Readers get read-only views, so a reader that
+    needs to draw on a frame has to copy it, and the publisher must not modify a frame after publishing it
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.image = None
+
+    def publish(self, image: np.ndarray) -> int:
+        """Replace the latest frame, returns its sequence number"""
+        view = image.view()
+        view.flags.writeable = False
+        with self.condition:
+            self.sequence += 1
+            self.image = view
+            self.condition.notify_all()
+            return self.sequence
+
+    def latest(self) -> Tuple[int, Optional[np.ndarray]]:
+        """Sequence number and view of the latest frame, (0, None) before the first frame"""
+        with self.condition:
+            return self.sequence, self.image
+
+    def wait_next(self, after: int, timeout: float = None) -> Tuple[int, Optional[np.ndarray]]:
+        """The first frame newer than sequence number `after`, (after, None) on timeout"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence > after, timeout):
+                return after, None
+            return self.sequence, self.image
+
+
+class StageStats:
+    """Throughput and latency counters of a pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.window_started = time.monotonic()
+        self._reset_window()
+        self.last_window = {'fps': 0.0, 'avg_latency_ms': 0.0, 'max_latency_ms': 0.0, 'avg_wait_ms': 0.0}
+
+    def _reset_window(self):
+        self.window = {'count': 0, 'latency': 0.0, 'max_latency': 0.0, 'wait': 0.0}
+
+    def record(self, latency: float, wait: float = 0.0):
+        """Count an item processed in `latency` seconds after waiting `wait` seconds in the queue"""
+        with self.lock:
+            self.processed += 1
+            self.window['count'] += 1
+            self.window['latency'] += latency
+            self.window['max_latency'] = max(self.window['max_latency'], latency)
+            self.window['wait'] += wait
+
+    def drop(self, count: int = 1):
+        with self.lock:
+            self.dropped += count
+
+    def error(self):
+        with self.lock:
+            self.errors += 1
+
+    def roll(self) -> Dict[str, Any]:
+        """Close the current window: throughput and latencies since the previous call"""
+        with self.lock:
+            now = time.monotonic()
+            count = self.window['count']
+            elapsed = max(now - self.window_started, 1e-6)
+            self.last_window = {
+                'fps': round(count / elapsed, 2),
+                'avg_latency_ms': round(self.window['latency'] / count * 1000, 1) if count else 0.0,
+                'max_latency_ms': round(self.window['max_latency'] * 1000, 1),
+                'avg_wait_ms': round(self.window['wait'] / count * 1000, 1) if count else 0.0,
+            }
+            self.window_started = now
+            self._reset_window()
+            return self.to_dict()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(processed=self.processed, dropped=self.dropped, errors=self.errors, **self.last_window)
+
+
+class PipelineStats:
+    """Counters of all pipeline stages"""
+
+    def __init__(self, stages: Iterable[str]):
+        self.stages = {name: StageStats(name) for name in stages}
+
+    def __getitem__(self, name: str) -> StageStats:
+        return self.stages[name]
+
+    def roll(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stage.roll() for name, stage in self.stages.items()}
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stage.to_dict() for name, stage in self.stages.items()}
+
+    def format(self, stats: Dict[str, Dict[str, Any]]) -> str:
+        return ' | '.join(
+            f"{name}: {s['fps']} fps, {s['avg_latency_ms']} ms avg, {s['max_latency_ms']} ms max, "
+            f"{s['avg_wait_ms']} ms queued, {s['dropped']} dropped, {s['errors']} errors"
+            for name, s in stats.items())
+
+
+class FrameGrabber(threading.Thread):
+    """Reads the camera continuously and keeps only the latest frame, so the RTSP buffer never backs up"""
+
+    def __init__(self, connect: Callable[[], Optional[cv2.VideoCapture]], reconnect_delay: float,
+                 stats: StageStats, on_frame: Callable[[Frame], None], source: str = ''):
+        super().__init__(name=f'capture-{source}' if source else 'capture', daemon=True)
+        self.source = source
+        self.connect = connect
+        self.reconnect_delay = reconnect_delay
+        self.stats = stats
+        self.on_frame = on_frame
+        self.stopped = threading.Event()
+
+    def run(self):
+        cap = None
+        frame_number = 0
+        while not self.stopped.is_set():
+            try:
+                # Connect/reconnect to camera
+                if cap is None or not cap.isOpened():
+                    cap = self.connect()
+                    if cap is None:
+                        logger.error(f"Retrying connection in {self.reconnect_delay}s...")
+                        self.stopped.wait(self.reconnect_delay)
+                        continue
+
+                started = time.monotonic()
+                ret, image = cap.read()
+                if not ret:
+                    logger.error("Failed to read frame")
+                    self.stats.error()
+                    cap.release()
+                    cap = None
+                    self.stopped.wait(self.reconnect_delay)
+                    continue
+
+                frame_number += 1
+                # read-only: the frame is shared by the stream, the motion gate and the inference workers
+                image.flags.writeable = False
+                frame = Frame(self.source, frame_number, image, time.monotonic())
+                self.stats.record(frame.captured_at - started)
+                self.on_frame(frame)
+
+            except Exception as e:
+                logger.error(f"Error in capture loop: {e}", exc_info=True)
+                self.stats.error()
+                self.stopped.wait(1)
+
+        if cap:
+            cap.release()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class FairQueue:
+    """
+    Bounded queues of several sources served round-robin, so a busy source cannot starve the others.
+    Each source keeps at most `maxsize` items, its oldest item is dropped instead of blocking the producer
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.queues = OrderedDict()  # source -> items, in the serving order
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, source, item) -> bool:
+        """Add the item, returns True if the oldest item of the source was dropped for it"""
+        with self.condition:
+            items = self.queues.setdefault(source, deque(maxlen=self.maxsize))
+            dropped = len(items) == items.maxlen
+            items.append(item)
+            self.condition.notify()
+            return dropped
+
+    def get(self, timeout: float = None):
+        """The oldest item of the next source in turn, None once the queue is closed and empty"""
+        with self.condition:
+            self.condition.wait_for(lambda: any(self.queues.values()) or self.closed, timeout)
+            for source, items in self.queues.items():
+                if items:
+                    self.queues.move_to_end(source)
+                    return items.popleft()
+            return None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class InferencePool:
+    """
+    Worker threads processing frames of all cameras, taking turns between cameras.
+    The oldest waiting frame of a camera is dropped when all workers are busy
+    """
+
+    def __init__(self, process: Callable[[Frame], Any], workers: int, queue_size: int, stats: StageStats):
+        self.process = process
+        self.queue = FairQueue(queue_size)
+        self.stats = stats
+        self.threads = [threading.Thread(target=self._work, name=f'inference-{i}', daemon=True)
+                        for i in range(workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, frame: Frame) -> bool:
+        """Queue the frame, returns True if an older frame of its camera was dropped"""
+        dropped = self.queue.put(frame.camera, frame)
+        if dropped:
+            self.stats.drop()
+        return dropped
+
+    def stop(self, timeout: float = None):
+        self.queue.close()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                return
+            started = time.monotonic()
+            try:
+                self.process(frame)
+            except Exception as e:
+                logger.error(f"Error processing frame #{frame.number} of {frame.camera}: {e}", exc_info=True)
+                self.stats.error()
+            else:
+                self.stats.record(time.monotonic() - started, wait=started - frame.captured_at)
+
+
+class AsyncWriter(threading.Thread):
+    """Runs database and alert jobs one by one, in order, off the inference path"""
+
+    def __init__(self, maxsize: int, stats: StageStats):
+        super().__init__(name='writer', daemon=True)
+        self.queue = queue.Queue(maxsize)
+        self.stats = stats
+
+    def submit(self, job: Callable, *args, **kwargs):
+        try:
+            self.queue.put_nowait((time.monotonic(), job, args, kwargs))
+        except queue.Full:
+            logger.error(f"Writer queue is full, dropping {getattr(job, '__name__', job)}")
+            self.stats.drop()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            submitted, job, args, kwargs = item
+            started = time.monotonic()
+            try:
+                job(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Error in writer job: {e}", exc_info=True)
+                self.stats.error()
+            else:
+                self.stats.record(time.monotonic() - started, wait=started - submitted)
+
+    def stop(self, timeout: float = None):
+        """Finish the submitted jobs and stop"""
+        self.queue.put(None)
+        self.join(timeout)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+1BIP Frame Preprocessing
+Crops and downscales frames before they are JPEG-encoded for CompreFace, and maps the returned boxes back to the frame
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+class FrameTransform:
+    """Where the encoded image is in the frame: the crop offset and the downscale factor"""
+
+    def __init__(self, x_offset: int, y_offset: int, scale: float, width: int, height: int):
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        self.scale = scale  # encoded size / frame size
+        self.width = width  # frame size, to clamp the boxes
+        self.height = height
+
+    def to_frame(self, box: Dict[str, Any]) -> Dict[str, Any]:
+        """Box of the encoded image in frame coordinates, other fields (probability) are kept"""
+        box = dict(box)
+        for key, offset, limit in (('x_min', self.x_offset, self.width), ('x_max', self.x_offset, self.width),
+                                   ('y_min', self.y_offset, self.height), ('y_max', self.y_offset, self.height)):
+            if key in box:
+                box[key] = min(max(int(round(box[key] / self.scale)) + offset, 0), limit)
+        return box
+
+
+class FramePreprocessor:
+    """
+    The recognition API downscales images to IMG_LENGTH_LIMIT (640 px) for detection anyway, so encoding the full
+    2560x1440 frame wastes encoding CPU, upload bytes and server decoding time. Faces are cropped from the uploaded
+    image for the embeddings though, so `max_side` should stay well above 640 to keep small faces recognizable.
+    """
+
+    def __init__(self, crop: Optional[Sequence[float]] = None, max_side: int = 1280, jpeg_quality: int = 85):
+        self.crop = crop  # x_min, y_min, x_max, y_max relative to the frame size, None - whole frame
+        self.max_side = max_side  # 0 - no downscale
+        self.jpeg_quality = jpeg_quality
+        if crop is not None and not (len(crop) == 4 and 0 <= crop[0] < crop[2] <= 1 and 0 <= crop[1] < crop[3] <= 1):
+            raise ValueError(f"Recognition crop must be [x_min, y_min, x_max, y_max] within 0..1: {crop}")
+
+    def prepare(self, image: np.ndarray) -> Tuple[np.ndarray, FrameTransform]:
+        """Cropped and downscaled image"""
+        height, width = image.shape[:2]
+        x_offset, y_offset = 0, 0
+        if self.crop:
+            x_offset, y_offset = int(self.crop[0] * width), int(self.crop[1] * height)
+            image = image[y_offset:int(round(self.crop[3] * height)), x_offset:int(round(self.crop[2] * width))]
+
+        scale = 1.0
+        longest = max(image.shape[:2])
+        if self.max_side and longest > self.max_side:
+            scale = self.max_side / longest
+            size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return image, FrameTransform(x_offset, y_offset, scale, width, height)
+
+    def encode(self, image: np.ndarray) -> Tuple[Optional[bytes], FrameTransform]:
+        """JPEG bytes of the prepared image, None if encoding failed"""
+        prepared, transform = self.prepare(image)
+        success, buffer = cv2.imencode('.jpg', prepared, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return (buffer.tobytes() if success else None), transform
+
+    def to_frame(self, results: List[Dict[str, Any]], transform: FrameTransform) -> List[Dict[str, Any]]:
+        """Recognition results with boxes in frame coordinates"""
+        return [dict(result, box=transform.to_frame(result['box'])) if 'box' in result else result
+                for result in results]
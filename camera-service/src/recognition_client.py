@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+1BIP Recognition Client
+Asynchronous CompreFace client: pooled connections, a limit of requests in flight, per-request deadlines,
+retries with jitter and a circuit breaker. Submitting never blocks, a frame that cannot be sent is dropped
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+
+from pipeline import StageStats
+
+logger = logging.getLogger(__name__)
+
+# Overloaded or restarting server, worth another attempt
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class RecognitionError(Exception):
+    def __init__(self, message: str, retry: bool):
+        super().__init__(message)
+        self.retry = retry
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` failed requests in a row, so an overloaded CompreFace is not flooded with
+    retries. After `reset_seconds` one probe request is let through: its success closes the breaker, its
+    failure opens it again
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+    DENIED, ALLOWED, PROBE = 0, 1, 2  # answers of allow()
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def allow(self) -> int:
+        """
+        DENIED (falsy) if no request may be sent now, PROBE if the request is the probe of the half-open breaker:
+        the probe has to end with record_success, record_failure or release_probe
+        """
+        with self.lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN:
+                if self.probing:
+                    return self.DENIED
+                self.probing = True
+                return self.PROBE
+            return self.ALLOWED if self.state == self.CLOSED else self.DENIED
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info("✓ CompreFace recovered, circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                                                and self.failures >= self.failure_threshold):
+                self._open()
+
+    def release_probe(self):
+        """End a probe that got neither a success nor a failure (deadline, rejected request): it counts as failed"""
+        with self.lock:
+            if self.state == self.HALF_OPEN and self.probing:
+                self._open()
+
+    def _open(self):
+        logger.error(f"✗ CompreFace failing, circuit breaker open for {self.reset_seconds}s")
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        self.probing = False
+        self.trips += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'state': self.state, 'failures': self.failures, 'trips': self.trips}
+
+
+class AsyncRecognitionClient:
+    """
+    Sends images to the recognition endpoint from an asyncio event loop running in its own thread.
+    At most `max_in_flight` requests are pending, over `pool_size` pooled connections. A request is abandoned at
+    its deadline, failed attempts are retried with full jitter backoff while the deadline allows.
+    Results are handed to the callbacks in `callback_workers` threads, off the event loop
+    """
+
+    def __init__(self, url: str, api_key: str, params: Dict[str, Any], stats: StageStats,
+                 pool_size: int = 8, max_in_flight: int = 4, retries: int = 2, backoff_seconds: float = 0.05,
+                 breaker: Optional[CircuitBreaker] = None, callback_workers: int = 2):
+        self.url = url
+        self.api_key = api_key
+        self.params = params
+        self.stats = stats
+        self.pool_size = pool_size
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.callbacks = ThreadPoolExecutor(callback_workers, thread_name_prefix='recognition-results')
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.thread = threading.Thread(target=self._run_loop, name='recognition-client', daemon=True)
+        self.ready = threading.Event()
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+
+    def submit(self, image: bytes, deadline: float,
+               callback: Callable[[Optional[List[Dict[str, Any]]]], None]) -> bool:
+        """
+        Send the JPEG image, `callback` gets the results, or None if the request failed or missed the
+        `deadline` (time.monotonic()). Returns False without sending when the limit of requests in flight is
+        reached or the circuit breaker is open
+        """
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            permit = self.breaker.allow()
+            if not permit:
+                return False
+            self.in_flight += 1
+        probe = permit == CircuitBreaker.PROBE
+        asyncio.run_coroutine_threadsafe(self._recognize(image, deadline, callback, time.monotonic(), probe),
+                                         self.loop)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        """Wait for the requests in flight, then close the connections"""
+        if self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self._close(timeout), self.loop).result(timeout + 1)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+        self.callbacks.shutdown(wait=True)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+            headers={'x-api-key': self.api_key})
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def _close(self, timeout: float):
+        started = time.monotonic()
+        while self.in_flight and time.monotonic() - started < timeout:
+            await asyncio.sleep(0.05)
+        await self.session.close()
+
+    async def _recognize(self, image: bytes, deadline: float, callback, submitted: float, probe: bool = False):
+        results = None
+        try:
+            results = await self._post_with_retries(image, deadline, probe)
+        except RecognitionError as e:
+            logger.error(f"Face recognition failed: {e}")
+            self.stats.error()
+        except Exception as e:
+            logger.error(f"Face recognition failed: {e}", exc_info=True)
+            self.stats.error()
+        else:
+            self.stats.record(time.monotonic() - submitted)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        self.callbacks.submit(self._call, callback, results)
+
+    @staticmethod
+    def _call(callback, results):
+        try:
+            callback(results)
+        except Exception as e:
+            logger.error(f"Error handling recognition results: {e}", exc_info=True)
+
+    async def _post_with_retries(self, image: bytes, deadline: float, probe: bool = False) -> List[Dict[str, Any]]:
+        """`probe` - the request is the probe of the half-open circuit breaker, it always settles the probe"""
+        attempt = 0
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RecognitionError("deadline exceeded", retry=False)
+                try:
+                    results = await self._post(image, remaining)
+                    self.breaker.record_success()
+                    probe = False
+                    return results
+                except RecognitionError as e:
+                    if e.retry:
+                        self.breaker.record_failure()
+                    if not e.retry or attempt >= self.retries:
+                        raise
+                    # full jitter, so the retries of several cameras do not hit the server at the same moment
+                    delay = random.uniform(0, self.backoff_seconds * 2 ** attempt)
+                    if time.monotonic() + delay >= deadline:
+                        raise RecognitionError(f"{e}, no time left to retry", retry=False)
+                    attempt += 1
+                    logger.warning(f"Retrying recognition ({attempt}/{self.retries}) after: {e}")
+                    await asyncio.sleep(delay)
+                    permit = self.breaker.allow()
+                    if not permit:
+                        raise RecognitionError(f"{e}, circuit breaker open", retry=False)
+                    probe = probe or permit == CircuitBreaker.PROBE
+        finally:
+            if probe:
+                # no-op if the probe already failed and opened the breaker again
+                self.breaker.release_probe()
+
+    async def _post(self, image: bytes, timeout: float) -> List[Dict[str, Any]]:
+        form = aiohttp.FormData()
+        form.add_field('file', image, filename='frame.jpg', content_type='image/jpeg')
+        try:
+            async with self.session.post(self.url, data=form, params=self.params,
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    return data.get('result', [])
+                text = await response.text()
+                # CompreFace answers 400 when there is no face in the image
+                if response.status == 400 and 'No face is found' in text:
+                    return []
+                raise RecognitionError(f"CompreFace API error: {response.status} - {text[:200]}",
+                                       retry=response.status in RETRY_STATUSES)
+        except asyncio.TimeoutError:
+            raise RecognitionError("request timed out", retry=True)
+        except aiohttp.ClientError as e:
+            raise RecognitionError(f"connection error: {e}", retry=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'in_flight': self.in_flight, 'max_in_flight': self.max_in_flight,
+                'circuit_breaker': self.breaker.to_dict()}
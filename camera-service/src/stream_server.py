@@ -4,10 +4,11 @@
 Serves MJPEG stream from camera service for dashboard viewing
 """
 
-from flask import Flask, Response, jsonify
+from flask import Flask, Response, abort, jsonify
 import cv2
 import logging
-import time
+
+from broadcast import MjpegBroadcaster
 
 logger = logging.getLogger(__name__)
 
@@ -17,37 +18,67 @@ class StreamServer:
     def __init__(self, camera_service, port=5001):
         self.camera_service = camera_service
         self.port = port
+        config = camera_service.config
+        # One encoder per camera, shared by all its viewers
+        self.broadcasters = {
+            camera_id: MjpegBroadcaster(camera, config.STREAM_MAX_WIDTH, config.STREAM_JPEG_QUALITY,
+                                        config.STREAM_FPS, config.STREAM_CLIENT_QUEUE_SIZE)
+            for camera_id, camera in camera_service.cameras.items()
+        }
         self.app = Flask(__name__)
         self.setup_routes()
 
+    def get_camera(self, camera_id=None):
+        """Camera by id, the first camera without id"""
+        cameras = self.camera_service.cameras
+        if camera_id is None:
+            return next(iter(cameras.values()))
+        if camera_id not in cameras:
+            abort(404, f"Unknown camera: {camera_id}")
+        return cameras[camera_id]
+
     def setup_routes(self):
         """Setup Flask routes"""
 
         @self.app.route('/stream/video.mjpeg')
-        def video_feed():
+        @self.app.route('/stream/<camera_id>/video.mjpeg')
+        def video_feed(camera_id=None):
             """MJPEG video stream endpoint"""
             return Response(
-                self.generate_mjpeg_stream(),
+                self.generate_mjpeg_stream(self.get_camera(camera_id)),
                 mimetype='multipart/x-mixed-replace; boundary=frame'
             )
 
         @self.app.route('/stream/health')
         def health():
             """Health check endpoint"""
+            camera = self.get_camera()
             return jsonify({
                 'status': 'ok',
-                'streaming': self.camera_service.latest_frame is not None,
-                'frame_count': self.camera_service.frame_count
+                'streaming': camera.streaming,
+                'frame_count': camera.frame_count,
+                'cameras': [{
+                    'id': camera.camera_id,
+                    'name': camera.config.name,
+                    'streaming': camera.streaming,
+                    'frame_count': camera.frame_count,
+                    'motion': camera.motion_gate.to_dict(),
+                    'active_tracks': len(camera.tracker),
+                    'stream': self.broadcasters[camera.camera_id].to_dict()
+                } for camera in self.camera_service.cameras.values()],
+                'pipeline': self.camera_service.stats.to_dict(),
+                'recognition': self.camera_service.recognition_service.client.to_dict(),
+                'alerts': self.camera_service.alert_manager.engine.to_dict()
             })
 
         @self.app.route('/stream/snapshot.jpg')
-        def snapshot():
+        @self.app.route('/stream/<camera_id>/snapshot.jpg')
+        def snapshot(camera_id=None):
             """Get latest frame as JPEG"""
-            with self.camera_service.frame_lock:
-                if self.camera_service.latest_frame is None:
-                    return "No frame available", 503
-
-                frame = self.camera_service.latest_frame.copy()
+            camera = self.get_camera(camera_id)
+            _, frame = camera.frames.latest()
+            if frame is None:
+                return "No frame available", 503
 
             ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
             if not ret:
@@ -55,38 +86,16 @@ class StreamServer:
 
             return Response(buffer.tobytes(), mimetype='image/jpeg')
 
-    def generate_mjpeg_stream(self):
-        """Generate MJPEG stream"""
-        logger.info("New client connected to MJPEG stream")
-
-        while True:
-            try:
-                # Get latest frame
-                with self.camera_service.frame_lock:
-                    if self.camera_service.latest_frame is None:
-                        time.sleep(0.1)
-                        continue
-
-                    frame = self.camera_service.latest_frame.copy()
-
-                # Encode frame as JPEG
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                if not ret:
-                    continue
-
-                # Yield frame in MJPEG format
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-
-                # Limit frame rate to ~15 FPS
-                time.sleep(0.066)
-
-            except GeneratorExit:
-                logger.info("Client disconnected from MJPEG stream")
-                break
-            except Exception as e:
-                logger.error(f"Error in MJPEG stream: {e}")
-                break
+    def generate_mjpeg_stream(self, camera):
+        """Generate MJPEG stream of a camera, sent as new frames are encoded"""
+        logger.info(f"New client connected to MJPEG stream of {camera.camera_id}")
+        broadcaster = self.broadcasters[camera.camera_id]
+        client = broadcaster.subscribe()
+        try:
+            yield from broadcaster.parts(client)
+        finally:
+            broadcaster.unsubscribe(client)
+            logger.info(f"Client disconnected from MJPEG stream of {camera.camera_id}")
 
     def run(self):
         """Run the streaming server"""
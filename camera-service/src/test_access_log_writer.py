@@ -0,0 +1,102 @@
+import pytest
+
+from access_log_writer import AccessLogWriter
+from journal import Journal
+from pipeline import StageStats
+
+
+class DataError(Exception):
+    pass
+
+
+class FakeDatabase:
+    """write() of the writer: fails with ConnectionError while down, with DataError for batches with a bad row"""
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+        self.down_after = None  # goes down after this number of writes
+        self.writes = 0
+
+    def write(self, rows):
+        if self.down_after is not None and self.writes >= self.down_after:
+            self.down = True
+        if self.down:
+            raise ConnectionError("connection refused")
+        self.writes += 1
+        if any(row['subject_name'] == 'x' * 300 for row in rows):
+            raise DataError("value too long for type character varying(255)")
+        self.rows.extend(rows)
+
+
+def row(name):
+    return {'subject_name': name}
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase()
+
+
+@pytest.fixture
+def writer(database, tmp_path):
+    return AccessLogWriter(database.write, Journal(str(tmp_path / 'journal.jsonl'), 1024 * 1024),
+                           Journal(str(tmp_path / 'rejected.jsonl'), 1024 * 1024), StageStats('database'),
+                           transient_errors=(ConnectionError,), batch_size=2, retry_seconds=60.0)
+
+
+def names(rows):
+    return [row['subject_name'] for row in rows]
+
+
+def test__given_outage__when_database_back__then_journaled_rows_written_first_in_order(writer, database):
+    database.down = True
+    writer._flush([row('a'), row('b')])
+    writer._flush([row('c')])  # during the retry delay, journaled without trying the database
+    assert database.rows == []
+    assert names(writer.journal._read()[0]) == ['a', 'b', 'c']
+
+    database.down = False
+    writer.retry_at = 0.0
+    writer._flush([row('d')])
+
+    assert names(database.rows) == ['a', 'b', 'c', 'd']
+    assert not writer.journal.pending()
+    assert writer.retry_at == 0.0
+
+
+def test__given_poison_row__when_flushing__then_other_rows_written_and_row_rejected(writer, database):
+    writer._flush([row('a'), row('x' * 300), row('b')])
+
+    assert names(database.rows) == ['a', 'b']
+    assert names(writer.rejected._read()[0]) == ['x' * 300]
+    assert not writer.journal.pending()
+    assert writer.retry_at == 0.0
+
+
+def test__given_poison_row_in_journal__when_replaying__then_journal_is_not_blocked(writer, database):
+    database.down = True
+    writer._flush([row('a'), row('x' * 300), row('b')])
+    database.down = False
+    writer.retry_at = 0.0
+
+    writer._flush([row('c')])
+
+    assert names(database.rows) == ['a', 'b', 'c']
+    assert names(writer.rejected._read()[0]) == ['x' * 300]
+    assert not writer.journal.pending()
+
+
+def test__given_outage_while_writing_row_by_row__when_database_back__then_no_row_written_twice(writer, database):
+    database.down_after = 2  # the rejected batch, then row 'a'
+    writer._flush([row('a'), row('x' * 300), row('b')])
+    assert names(database.rows) == ['a']
+    assert names(writer.journal._read()[0]) == ['x' * 300, 'b']
+
+    database.down_after = None
+    database.down = False
+    writer.retry_at = 0.0
+    writer._flush([])
+
+    assert names(database.rows) == ['a', 'b']
+    assert names(writer.rejected._read()[0]) == ['x' * 300]
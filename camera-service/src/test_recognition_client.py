@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import pytest
+
+from pipeline import StageStats
+from recognition_client import AsyncRecognitionClient, CircuitBreaker, RecognitionError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(breaker, responses, retries=2):
+    """A client whose requests get `responses` in order: a result list, or a RecognitionError to raise"""
+    client = AsyncRecognitionClient('http://compreface/recognize', 'key', {}, StageStats('recognition'),
+                                    retries=retries, backoff_seconds=0.0, breaker=breaker)
+    client.loop.close()  # not started, the tests run the coroutines with asyncio.run
+    client.posted = 0
+
+    async def post(image, timeout):
+        client.posted += 1
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    client._post = post
+    return client
+
+
+def post_with_retries(client, deadline_seconds=10.0):
+    probe = client.breaker.allow() == CircuitBreaker.PROBE
+    return asyncio.run(client._post_with_retries(b'jpeg', time.monotonic() + deadline_seconds, probe))
+
+
+def test__given_failures__when_threshold_reached__then_opens_then_probe_closes_it():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10.0, clock=clock)
+
+    assert breaker.allow() == CircuitBreaker.ALLOWED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock.now = 10.0
+    assert breaker.allow() == CircuitBreaker.PROBE
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() == CircuitBreaker.ALLOWED
+    assert breaker.trips == 1
+
+
+def test__given_half_open__when_probe_fails__then_opens_again():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 10.0
+    assert breaker.allow() == CircuitBreaker.PROBE
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    clock.now = 20.0
+    assert breaker.allow() == CircuitBreaker.PROBE
+
+
+def test__given_retryable_errors__when_posting__then_retries_and_records_success():
+    breaker = CircuitBreaker(failure_threshold=5)
+    client = make_client(breaker, [RecognitionError("503", retry=True), [{'subjects': []}]])
+
+    assert post_with_retries(client) == [{'subjects': []}]
+    assert client.posted == 2
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test__given_retryable_errors__when_threshold_reached__then_stops_retrying():
+    breaker = CircuitBreaker(failure_threshold=2)
+    client = make_client(breaker, [RecognitionError("503", retry=True)] * 3, retries=2)
+
+    with pytest.raises(RecognitionError) as e:
+        post_with_retries(client)
+    assert 'circuit breaker open' in str(e.value)
+    assert client.posted == 2
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test__given_probe__when_non_retryable_error__then_breaker_opens_and_probes_again_later():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 10.0
+    client = make_client(breaker, [RecognitionError("500", retry=False), [{'subjects': []}]])
+
+    with pytest.raises(RecognitionError):
+        post_with_retries(client)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.probing
+
+    clock.now = 20.0
+    assert post_with_retries(client) == [{'subjects': []}]
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test__given_probe__when_deadline_already_exceeded__then_probe_is_released():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 10.0
+    client = make_client(breaker, [])
+
+    with pytest.raises(RecognitionError) as e:
+        post_with_retries(client, deadline_seconds=-1.0)
+    assert 'deadline exceeded' in str(e.value)
+    assert client.posted == 0
+    clock.now = 20.0
+    assert breaker.allow() == CircuitBreaker.PROBE
+
+
+def test__given_probe__when_unexpected_exception__then_probe_is_released():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 10.0
+    client = make_client(breaker, [ValueError("bad JSON")])
+
+    with pytest.raises(ValueError):
+        post_with_retries(client)
+    clock.now = 20.0
+    assert breaker.allow() == CircuitBreaker.PROBE
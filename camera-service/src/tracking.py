@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+1BIP Face Tracking
+Associates recognized faces across frames of a camera, so a person walking through a gate is one track:
+one access log entry, one alert and one saved image, from the frame where the face was recognized best
+"""
+
+import itertools
+import threading
+from typing import Any, Dict, List, Tuple
+
+Face = Dict[str, Any]  # recognition result: subject_name, similarity, box..., plus 'authorized'
+
+
+def box_iou(a: Dict[str, int], b: Dict[str, int]) -> float:
+    """Intersection over union of two CompreFace boxes"""
+    width = min(a['x_max'], b['x_max']) - max(a['x_min'], b['x_min'])
+    height = min(a['y_max'], b['y_max']) - max(a['y_min'], b['y_min'])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = box_area(a) + box_area(b) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def box_area(box: Dict[str, int]) -> int:
+    return max(box['x_max'] - box['x_min'], 0) * max(box['y_max'] - box['y_min'], 0)
+
+
+def centroid_distance(a: Dict[str, int], b: Dict[str, int]) -> float:
+    """Distance between box centers, in widths of box `a`"""
+    dx = (a['x_min'] + a['x_max'] - b['x_min'] - b['x_max']) / 2
+    dy = (a['y_min'] + a['y_max'] - b['y_min'] - b['y_max']) / 2
+    return (dx ** 2 + dy ** 2) ** 0.5 / max(a['x_max'] - a['x_min'], 1)
+
+
+def face_score(face: Face) -> Tuple[float, int]:
+    """Faces recognized with a higher similarity are better, then larger faces"""
+    return face.get('similarity') or 0.0, box_area(face['box'])
+
+
+class Track:
+    """A face followed through frames, with the best recognition so far"""
+
+    def __init__(self, track_id: int, face: Face, frame, now: float):
+        self.track_id = track_id
+        self.box = face['box']
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.best_face = face
+        self.best_frame = frame
+        self.face_count = 1  # Unauthorized faces in the frame, for the alert
+        self.alert_requested = False
+        self.alert_sent = False
+
+    @property
+    def authorized(self) -> bool:
+        return self.best_face['authorized']
+
+    def update(self, face: Face, frame, now: float):
+        self.box = face['box']
+        # results of concurrent requests can arrive out of order
+        self.last_seen = max(self.last_seen, now)
+        self.hits += 1
+        # identity is re-decided only when a frame recognizes the face better
+        if face_score(face) > face_score(self.best_face):
+            self.best_face = face
+            self.best_frame = frame
+
+
+class FaceTracker:
+    """
+    Greedy IoU tracker of the faces of one camera. A face continues the track with the highest box IoU, or, when the
+    face moved too far between processed frames for the boxes to overlap, the track with the nearest box center
+    (up to `max_centroid_distance` box widths). Tracks end `timeout_seconds` after they were last seen,
+    or after `max_seconds` so people staying in front of the camera are logged periodically.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_centroid_distance: float = 1.0,
+                 timeout_seconds: float = 2.0, max_seconds: float = 300.0, confirm_frames: int = 3):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.timeout_seconds = timeout_seconds
+        self.max_seconds = max_seconds
+        self.confirm_frames = confirm_frames
+        self.tracks: List[Track] = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def update(self, faces: List[Face], frame, now: float) -> Tuple[List[Track], List[Track]]:
+        """
+        Add the faces of a frame.
+        Returns the ended tracks and the tracks confirmed unauthorized by this frame (alert them now)
+        """
+        with self.lock:
+            ended = self._expire(now)
+            unmatched = list(range(len(faces)))
+            seen = []
+            for track, face_idx in self._match(faces):
+                track.update(faces[face_idx], frame, now)
+                unmatched.remove(face_idx)
+                seen.append(track)
+            for face_idx in unmatched:
+                seen.append(Track(next(self.ids), faces[face_idx], frame, now))
+                self.tracks.append(seen[-1])
+
+            unauthorized_count = sum(not face['authorized'] for face in faces)
+            confirmed = []
+            for track in seen:
+                if not track.authorized and not track.alert_requested and track.hits >= self.confirm_frames:
+                    track.alert_requested = True
+                    track.face_count = unauthorized_count
+                    confirmed.append(track)
+            return ended, confirmed
+
+    def expire(self, now: float) -> List[Track]:
+        """End the tracks not seen for `timeout_seconds`"""
+        with self.lock:
+            return self._expire(now)
+
+    def flush(self) -> List[Track]:
+        """End all tracks"""
+        with self.lock:
+            tracks, self.tracks = self.tracks, []
+            return tracks
+
+    def _expire(self, now: float) -> List[Track]:
+        ended = [track for track in self.tracks if now - track.last_seen > self.timeout_seconds
+                 or now - track.first_seen > self.max_seconds]
+        self.tracks = [track for track in self.tracks if track not in ended]
+        return ended
+
+    def _match(self, faces: List[Face]) -> List[Tuple[Track, int]]:
+        candidates = []
+        for track in self.tracks:
+            for face_idx, face in enumerate(faces):
+                iou = box_iou(track.box, face['box'])
+                distance = centroid_distance(track.box, face['box'])
+                if iou >= self.iou_threshold or distance <= self.max_centroid_distance:
+                    candidates.append((-iou, distance, track.track_id, track, face_idx))
+
+        matches, used_tracks, used_faces = [], set(), set()
+        for _, _, track_id, track, face_idx in sorted(candidates, key=lambda c: c[:3]):
+            if track_id in used_tracks or face_idx in used_faces:
+                continue
+            used_tracks.add(track_id)
+            used_faces.add(face_idx)
+            matches.append((track, face_idx))
+        return matches
+
+    def __len__(self):
+        return len(self.tracks)
@@ -11,7 +11,8 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 #  or implied. See the License for the specific language governing
 #  permissions and limitations under the License.
-from typing import List, Optional
+import itertools
+from typing import List, Optional, Union
 
 from flask import request
 from flask.json import jsonify
@@ -21,8 +22,10 @@ from src.constants import ENV
 from src.exceptions import NoFaceFoundError
 from src.services.facescan.plugins import base, managers
 from src.services.facescan.scanner.facescanners import scanner
-from src.services.flask_.constants import ARG
+from src.services.flask_.constants import ARG, CACHE_STATUS_HEADER
+from src.services.flask_.ndjson import ndjson_response
 from src.services.flask_.needs_attached_file import needs_attached_file
+from src.services.flask_.response_cache import cached_response, response_cache
 from src.services.imgtools.read_img import read_img
 from src.services.utils.pyutils import Constants
 from src.services.imgtools.test.files import IMG_DIR
@@ -75,52 +78,103 @@ def endpoints(app):
             available_plugins=available_plugins
         )
 
+    @app.route('/cache_status')
+    def cache_status_get():
+        return jsonify(response_cache=response_cache.stats.to_json())
+
     @app.route('/find_faces_base64', methods=['POST'])
     def find_faces_base64_post():
-        detector = managers.plugin_manager.detector
-        face_plugins = managers.plugin_manager.filter_face_plugins(
-            _get_face_plugin_names()
-        )
-        face_plugins = face_detection_skip_check(face_plugins)
         rawfile = base64.b64decode(request.get_json()["file"])
-
-        faces = detector(
-            img=read_img(rawfile),
-            det_prob_threshold=_get_det_prob_threshold(),
-            face_plugins=face_plugins
-        )
-        plugins_versions = {p.slug: str(p) for p in [detector] + face_plugins}
-        faces = _limit(faces, request.values.get(ARG.LIMIT))
-        FaceDetection.SKIPPING_FACE_DETECTION = False
-        return jsonify(plugins_versions=plugins_versions, result=faces)
+        return _find_faces_response(read_img(rawfile))
 
     @app.route('/find_faces', methods=['POST'])
     @needs_attached_file
     def find_faces_post():
+        return _find_faces_response(read_img(request.files['file']))
+
+    @app.route('/scan_faces', methods=['POST'])
+    @needs_attached_file
+    def scan_faces_post():
+        img = read_img(request.files['file'])
+
+        def create_response():
+            limit = _parse_limit(request.values.get(ARG.LIMIT))
+            faces = scanner.scan(
+                img=img,
+                det_prob_threshold=_get_det_prob_threshold(),
+                limit=limit
+            )
+            faces = _limit(faces, limit)
+            return jsonify(calculator_version=scanner.ID, result=faces)
+
+        return cached_response(img, {'scanner': scanner.ID}, create_response)
+
+    @app.route('/track_faces', methods=['POST'])
+    @needs_attached_file
+    def track_faces_post():
+        frames = [read_img(file) for file in request.files.getlist('file')]
         detector = managers.plugin_manager.detector
         face_plugins = managers.plugin_manager.filter_face_plugins(
             _get_face_plugin_names()
         )
-        face_plugins = face_detection_skip_check(face_plugins)
-        faces = detector(
-            img=read_img(request.files['file']),
+        plugins_versions = {p.slug: str(p) for p in [detector] + face_plugins}
+        limit = _parse_limit(request.values.get(ARG.LIMIT))
+        tracks = detector.track_faces(
+            frames=frames,
             det_prob_threshold=_get_det_prob_threshold(),
-            face_plugins=face_plugins
+            face_plugins=face_plugins,
+            limit=limit,
+            quality_threshold=_get_quality_threshold()
         )
+        tracks = _limit(tracks, limit)
+        return jsonify(plugins_versions=plugins_versions, result=tracks)
+
+
+def _find_faces_response(img):
+    detector = managers.plugin_manager.detector
+    face_plugins = managers.plugin_manager.filter_face_plugins(
+        _get_face_plugin_names()
+    )
+    try:
+        face_plugins = face_detection_skip_check(face_plugins)
         plugins_versions = {p.slug: str(p) for p in [detector] + face_plugins}
-        faces = _limit(faces, request.values.get(ARG.LIMIT))
+        limit = _parse_limit(request.values.get(ARG.LIMIT))
+
+        if request.values.get(ARG.STREAM) == 'true':
+            return _stream_faces_response(img, detector, face_plugins, limit)
+
+        def create_response():
+            faces = detector(
+                img=img,
+                det_prob_threshold=_get_det_prob_threshold(),
+                face_plugins=face_plugins,
+                limit=limit,
+                quality_threshold=_get_quality_threshold()
+            )
+            faces = _limit(faces, limit)
+            return jsonify(plugins_versions=plugins_versions, result=faces)
+
+        return cached_response(img, plugins_versions, create_response)
+    finally:
         FaceDetection.SKIPPING_FACE_DETECTION = False
-        return jsonify(plugins_versions=plugins_versions, result=faces)
 
-    @app.route('/scan_faces', methods=['POST'])
-    @needs_attached_file
-    def scan_faces_post():
-        faces = scanner.scan(
-            img=read_img(request.files['file']),
-            det_prob_threshold=_get_det_prob_threshold()
-        )
-        faces = _limit(faces, request.values.get(ARG.LIMIT))
-        return jsonify(calculator_version=scanner.ID, result=faces)
+
+def _stream_faces_response(img, detector, face_plugins, limit: int):
+    """ One NDJSON record per face, largest face first, each is sent as soon as its plugins finish """
+    faces = detector.iter_faces(
+        img=img,
+        det_prob_threshold=_get_det_prob_threshold(),
+        face_plugins=face_plugins,
+        limit=limit,
+        quality_threshold=_get_quality_threshold()
+    )
+    # detection runs before the response starts, so its errors still get an error status
+    first_face = next(faces, None)
+    if first_face is None:
+        raise NoFaceFoundError
+    response = ndjson_response(itertools.chain([first_face], faces))
+    response.headers[CACHE_STATUS_HEADER] = 'BYPASS'
+    return response
 
 
 def _get_det_prob_threshold():
@@ -133,6 +187,16 @@ def _get_det_prob_threshold():
     return det_prob_threshold
 
 
+def _get_quality_threshold() -> Optional[float]:
+    quality_threshold_val = request.values.get(ARG.QUALITY_THRESHOLD)
+    if quality_threshold_val is None:
+        return None
+    quality_threshold = float(quality_threshold_val)
+    if not (0 <= quality_threshold <= 1):
+        raise BadRequest('Quality threshold incorrect (0 <= quality_threshold <= 1)')
+    return quality_threshold
+
+
 def _get_face_plugin_names() -> Optional[List[str]]:
     if ARG.FACE_PLUGINS not in request.values:
         return []
@@ -141,7 +205,21 @@ def _get_face_plugin_names() -> Optional[List[str]]:
     ]
 
 
-def _limit(faces: List, limit: str = None) -> List:
+def _parse_limit(limit: Union[str, int, None]) -> int:
+    """
+    >>> _parse_limit(None), _parse_limit(''), _parse_limit('2')
+    (0, 0, 2)
+    """
+    try:
+        limit = int(limit or 0)
+    except ValueError as e:
+        raise BadRequest('Limit format is invalid (limit >= 0)') from e
+    if not (limit >= 0):
+        raise BadRequest('Limit value is invalid (limit >= 0)')
+    return limit
+
+
+def _limit(faces: List, limit: Union[str, int, None] = None) -> List:
     """
     >>> _limit([1, 2, 3], None)
     [1, 2, 3]
@@ -157,11 +235,5 @@ def _limit(faces: List, limit: str = None) -> List:
     if len(faces) == 0:
         raise NoFaceFoundError
 
-    try:
-        limit = int(limit or 0)
-    except ValueError as e:
-        raise BadRequest('Limit format is invalid (limit >= 0)') from e
-    if not (limit >= 0):
-        raise BadRequest('Limit value is invalid (limit >= 0)')
-
+    limit = _parse_limit(limit)
     return faces[:limit] if limit else faces
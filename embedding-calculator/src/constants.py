@@ -36,6 +36,25 @@ class ENV(Constants):
 
     RUN_MODE = get_env_bool('RUN_MODE', False)
 
+    GALLERY_INDEX = get_env('GALLERY_INDEX', 'auto')
+    GALLERY_APPROX_MIN_SIZE = int(get_env('GALLERY_APPROX_MIN_SIZE', '50000'))
+
+    RESPONSE_CACHE_SIZE_MB = int(get_env('RESPONSE_CACHE_SIZE_MB', '64'))
+    RESPONSE_CACHE_TTL_SECONDS = int(get_env('RESPONSE_CACHE_TTL_SECONDS', '300'))
+    FACE_PLUGIN_CACHE_SIZE_MB = int(get_env('FACE_PLUGIN_CACHE_SIZE_MB', '32'))
+    # reusable preprocessing buffers kept by each thread, 0 - allocated per request
+    BUFFER_POOL_SIZE_MB = int(get_env('BUFFER_POOL_SIZE_MB', '64'))
+
+    # only the largest faces of an image are cropped and processed by face plugins, 0 - all
+    MAX_FACES = int(get_env('MAX_FACES', '0'))
+
+    # 0 - a thread per CPU of the worker (one inter-op thread)
+    INTRA_OP_THREADS = int(get_env('INTRA_OP_THREADS', '0'))
+    INTER_OP_THREADS = int(get_env('INTER_OP_THREADS', '0'))
+    OPENCV_THREADS = int(get_env('OPENCV_THREADS', '0'))
+    BLAS_THREADS = int(get_env('BLAS_THREADS', '0'))
+    CPU_AFFINITY = get_env_bool('CPU_AFFINITY')
+
 
 LOGGING_LEVEL = logging._nameToLevel[ENV.LOGGING_LEVEL_NAME]
 ENV_MAIN = ENV
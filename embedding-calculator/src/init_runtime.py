@@ -20,6 +20,7 @@ from PIL import ImageFile
 
 from src._logging import init_logging
 from src.constants import ENV
+from src.services.utils.cpu_threads import init_threads
 
 
 def _check_ci_build_args():
@@ -35,4 +36,15 @@ def init_runtime(logging_level):
     ImageFile.LOAD_TRUNCATED_IMAGES = True
     _check_ci_build_args()
     ENV.RUN_MODE = True
-    init_logging(logging_level)
\ No newline at end of file
+    init_logging(logging_level)
+    init_threads()
+    _init_worker_threads()
+
+
+def _init_worker_threads():
+    """ uWSGI forks workers after loading the app, each of them gets its own CPUs and thread pools """
+    try:
+        from uwsgidecorators import postfork
+    except ImportError:
+        return
+    postfork(init_threads)
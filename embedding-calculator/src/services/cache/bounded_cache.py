@@ -0,0 +1,109 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import attr
+
+MISSING = object()
+
+
+@attr.s(auto_attribs=True)
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    bytes: int = 0
+    max_bytes: int = 0
+
+    def to_json(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return dict(attr.asdict(self), hit_ratio=self.hits / lookups if lookups else 0.0)
+
+
+class BoundedCache:
+    """
+    Thread-safe LRU cache bounded by the total size of the values in bytes.
+    Entries older than `ttl_seconds` are treated as missing (0 - never expire).
+    >>> cache = BoundedCache(max_bytes=10)
+    >>> cache.put('a', b'12345'); cache.put('b', b'12345'); cache.get('a')
+    b'12345'
+    >>> cache.put('c', b'12345'); cache.get('b') is None
+    True
+    >>> cache.stats.evictions, cache.stats.hits, cache.stats.misses
+    (1, 1, 1)
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float = 0,
+                 size_of: Callable[[Any], int] = len, clock: Callable[[], float] = monotonic):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._size_of = size_of
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats(max_bytes=max_bytes)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return attr.evolve(self._stats, entries=len(self._entries))
+
+    def get(self, key: Hashable, default=None) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key, MISSING)
+            if entry is not MISSING and self._is_expired(entry):
+                self._remove(key)
+                self._stats.expirations += 1
+                entry = MISSING
+            if entry is MISSING:
+                self._stats.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        size = self._size_of(value)
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, self._clock())
+            self._stats.bytes += size
+            while self._stats.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.bytes = 0
+
+    def _is_expired(self, entry) -> bool:
+        return bool(self.ttl_seconds) and self._clock() - entry[2] > self.ttl_seconds
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._stats.bytes -= size
@@ -0,0 +1,31 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from hashlib import blake2b
+
+import numpy as np
+
+
+def hash_img(img: np.ndarray) -> str:
+    """
+    Fast content hash of a decoded image (pixels, shape and dtype).
+    >>> hash_img(np.zeros((2, 2, 3), dtype=np.uint8)) == hash_img(np.zeros((2, 2, 3), dtype=np.uint8))
+    True
+    >>> hash_img(np.zeros((2, 2, 3), dtype=np.uint8)) == hash_img(np.zeros((3, 2, 2), dtype=np.uint8))
+    False
+    """
+    digest = blake2b(digest_size=16)
+    digest.update(f'{img.shape}{img.dtype}'.encode())
+    digest.update(np.ascontiguousarray(img).data)
+    return digest.hexdigest()
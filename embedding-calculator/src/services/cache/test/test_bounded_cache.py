@@ -0,0 +1,70 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from src.services.cache.bounded_cache import BoundedCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test__given_expired_entry__when_getting__then_returns_default_and_counts_expiration():
+    clock = FakeClock()
+    cache = BoundedCache(max_bytes=100, ttl_seconds=10, clock=clock)
+    cache.put('key', b'value')
+    clock.now = 5
+    assert cache.get('key') == b'value'
+
+    clock.now = 11
+    assert cache.get('key', 'default') == 'default'
+
+    stats = cache.stats
+    assert (stats.hits, stats.misses, stats.expirations, stats.entries, stats.bytes) == (1, 1, 1, 0, 0)
+
+
+def test__given_full_cache__when_putting__then_evicts_least_recently_used():
+    cache = BoundedCache(max_bytes=10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    cache.get('a')
+
+    cache.put('c', b'cccc')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa' and cache.get('c') == b'cccc'
+    assert cache.stats.bytes == 8
+
+
+def test__given_value_larger_than_cache__when_putting__then_it_is_not_stored():
+    cache = BoundedCache(max_bytes=4)
+    cache.put('small', b'abc')
+
+    cache.put('big', b'abcde')
+
+    assert cache.get('big') is None
+    assert cache.get('small') == b'abc'
+
+
+def test__given_disabled_cache__when_putting__then_nothing_is_stored():
+    cache = BoundedCache(max_bytes=0)
+
+    cache.put('key', b'value')
+
+    assert not cache.enabled
+    assert cache.get('key') is None
+    assert cache.stats.to_json()['hit_ratio'] == 0.0
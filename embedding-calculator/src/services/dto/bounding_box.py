@@ -104,6 +104,20 @@ class BoundingBoxDTO(JSONEncodable):
                 return True
         return False
 
+    def iou(self, other: 'BoundingBoxDTO') -> float:
+        """
+        Intersection over union of two boxes
+        >>> BoundingBoxDTO(0,0,10,10,1).iou(BoundingBoxDTO(5,0,15,10,1))
+        0.3333333333333333
+        >>> BoundingBoxDTO(0,0,10,10,1).iou(BoundingBoxDTO(20,20,30,30,1))
+        0.0
+        """
+        width = min(self.x_max, other.x_max) - max(self.x_min, other.x_min)
+        height = min(self.y_max, other.y_max) - max(self.y_min, other.y_min)
+        intersection = max(width, 0) * max(height, 0)
+        union = self.width * self.height + other.width * other.height - intersection
+        return intersection / union if union else 0.0
+
     def is_point_inside(self, xy: Tuple[int, int]) -> bool:
         """
         >>> BoundingBoxDTO(100,700,150,750,1).is_point_inside((125,725))
@@ -44,6 +44,17 @@ class PoseDTO(JSONEncodable):
         }
 
 
+class QualityDTO(JSONEncodable):
+    def __init__(self, score, size, sharpness, pose, illumination):
+        self.quality = {
+            'score': float(score),
+            'size': float(size),
+            'sharpness': float(sharpness),
+            'pose': float(pose),
+            'illumination': float(illumination)
+        }
+
+
 @attr.s(auto_attribs=True, frozen=True)
 class LandmarksDTO(JSONEncodable):
     """ 5-points facial landmarks: eyes, nose, mouth """
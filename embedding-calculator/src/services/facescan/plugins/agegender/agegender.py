@@ -12,46 +12,132 @@
 #  or implied. See the License for the specific language governing
 #  permissions and limitations under the License.
 
-from typing import Tuple, Union
+import functools
+from typing import Dict, List, Tuple, Union
 
 import numpy as np
 import tensorflow.compat.v1 as tf1
 from cached_property import cached_property
 
+from src.services.imgtools import preprocessing
+from src.services.imgtools.proc_img import prewhiten
 from src.services.imgtools.types import Array3D
-from src.services.facescan.plugins import base, managers
+from src.services.facescan.plugins import base, managers, tflite
+from src.services.facescan.plugins.precision import FLOAT32, FLOAT16, INT8
 from src.services.facescan.plugins.agegender import helpers
 from src.services.dto import plugin_result
+from src.services.utils.cpu_threads import tf_session_config
+
+
+FUSED_PLUGINS_FIELD = '_agegender_fused_plugins'
+FUSED_RESULTS_FIELD = '_agegender_fused_results'
+
+
+def restore_graph(plugins: Tuple['BaseAgeGender', ...]):
+    """
+    Returns a session with restored weights of the plugins' models on a shared input,
+    the input and softmax outputs of the models
+    """
+    IMAGE_SIZE = managers.plugin_manager.detector.IMAGE_SIZE
+
+    g = tf1.Graph()
+    with g.as_default():
+        sess = tf1.Session(config=tf_session_config(allow_soft_placement=True))
+
+        images = tf1.placeholder(tf1.float32, [None, IMAGE_SIZE, IMAGE_SIZE, 3])
+        softmax_outputs = []
+        for plugin in plugins:
+            if len(plugins) == 1:
+                logits = helpers.inception_v3(len(plugin.LABELS), images)
+                var_list = None
+            else:
+                # checkpoints of both models have the same variable names
+                with tf1.variable_scope(plugin.slug):
+                    logits = helpers.inception_v3(len(plugin.LABELS), images)
+                var_list = {var.op.name[len(plugin.slug) + 1:]: var
+                            for var in tf1.global_variables(scope=f'{plugin.slug}/')}
+            softmax_outputs.append(tf1.nn.softmax(logits))
+            tf1.global_variables_initializer()
+
+            checkpoint = tf1.train.get_checkpoint_state(plugin.ml_model.path)
+            saver = tf1.train.Saver(var_list=var_list)
+            saver.restore(sess, checkpoint.model_checkpoint_path)
+        return sess, images, softmax_outputs
+
+
+@functools.lru_cache(maxsize=1)
+def _fused_model(plugins: Tuple['BaseAgeGender', ...]):
+    """ Runs the models of several plugins in one session call """
+    sess, images, softmax_outputs = restore_graph(plugins)
+
+    def get_values(prewhitened_imgs: np.ndarray) -> Dict[str, List[Tuple[Union[str, Tuple], float]]]:
+        outputs = sess.run(softmax_outputs, feed_dict={images: prewhitened_imgs})
+        return {plugin.slug: plugin.decode(output) for plugin, output in zip(plugins, outputs)}
+    return get_values
 
 
 class BaseAgeGender(base.BasePlugin):
     LABELS: Tuple[Tuple[int, int], ...]
+    CACHE_BY_FACE_IMG = True
+    supported_precisions = (FLOAT32, FLOAT16, INT8)
 
-    @cached_property
+    def _restore_graph(self):
+        """ Returns a session with restored weights, its input and softmax output tensors """
+        sess, images, (softmax_output,) = restore_graph((self,))
+        return sess, images, softmax_output
+
+    @property
     def _model(self):
-        labels = self.LABELS
-        model_dir = self.ml_model.path
-        IMAGE_SIZE = managers.plugin_manager.detector.IMAGE_SIZE
+        return self._converted_model if self.is_reduced_precision else self._float32_model
 
-        g = tf1.Graph()
-        with g.as_default():
-            sess = tf1.Session(config=tf1.ConfigProto(allow_soft_placement=True))
+    @cached_property
+    def _float32_model(self):
+        sess, images, softmax_output = self._restore_graph()
+        return self._get_values_fn(lambda imgs: sess.run(softmax_output, feed_dict={images: imgs}))
 
-            images = tf1.placeholder(tf1.float32, [None, IMAGE_SIZE, IMAGE_SIZE, 3])
-            logits = helpers.inception_v3(len(labels), images)
-            tf1.global_variables_initializer()
+    @cached_property
+    def _converted_model(self):
+        return self._get_values_fn(tflite.TFLiteModel(self.ml_model.converted_path(self.precision)))
+
+    def _get_values_fn(self, run):
+        def get_values(prewhitened_imgs: np.ndarray) -> List[Tuple[Union[str, Tuple], float]]:
+            return self.decode(run(prewhitened_imgs))
+        return get_values
+
+    def decode(self, outputs: np.ndarray) -> List[Tuple[Union[str, Tuple], float]]:
+        """ The most probable label and its probability for each softmax output """
+        best = np.argmax(outputs, axis=1)
+        return [(self.LABELS[best_i], output[best_i]) for best_i, output in zip(best, outputs)]
+
+    def prepare_faces(self, faces: List[plugin_result.FaceDTO], face_plugins: List[base.BasePlugin]):
+        """ Age and gender requested together run in one session call """
+        fused = tuple(sorted((plugin for plugin in face_plugins
+                              if isinstance(plugin, BaseAgeGender) and not plugin.is_reduced_precision),
+                             key=lambda plugin: plugin.slug))
+        if len(fused) > 1:
+            for face in faces:
+                setattr(face, FUSED_PLUGINS_FIELD, fused)
+
+    def _evaluate_model(self, faces: List[plugin_result.FaceDTO]) -> List[Tuple[Union[str, Tuple], float]]:
+        fused = getattr(faces[0], FUSED_PLUGINS_FIELD, ())
+        if self not in fused:
+            return self._model(preprocessing.normalized_faces(faces, preprocessing.PREWHITEN))
+        missing = [face for face in faces if self.slug not in getattr(face, FUSED_RESULTS_FIELD, {})]
+        if missing:
+            results = _fused_model(fused)(preprocessing.normalized_faces(missing, preprocessing.PREWHITEN))
+            for i, face in enumerate(missing):
+                setattr(face, FUSED_RESULTS_FIELD, {slug: values[i] for slug, values in results.items()})
+        return [getattr(face, FUSED_RESULTS_FIELD)[self.slug] for face in faces]
 
-            checkpoint = tf1.train.get_checkpoint_state(model_dir)
-            saver = tf1.train.Saver()
-            saver.restore(sess, checkpoint.model_checkpoint_path)
-            softmax_output = tf1.nn.softmax(logits)
+    def __call__(self, face: plugin_result.FaceDTO):
+        return self.process_faces([face])[0]
 
-            def get_value(img: Array3D) -> Tuple[Union[str, Tuple], float]:
-                img = np.expand_dims(helpers.prewhiten(img), 0)
-                output = sess.run(softmax_output, feed_dict={images: img})[0]
-                best_i = int(np.argmax(output))
-                return labels[best_i], output[best_i]
-            return get_value
+    def convert_precision(self, calibration_faces: List[Array3D]):
+        sess, images, softmax_output = self._restore_graph()
+        with sess:
+            tflite.convert_session(sess, images, softmax_output, self.precision,
+                                   [prewhiten(img) for img in calibration_faces],
+                                   self.ml_model.converted_path(self.precision))
 
 
 class AgeDetector(BaseAgeGender):
@@ -61,9 +147,9 @@ class AgeDetector(BaseAgeGender):
         ('22801', '1PxK72O-NROEz8pUGDDFRDYF4AABbvWiC'),
     )
 
-    def __call__(self, face: plugin_result.FaceDTO):
-        value, probability = self._model(face._face_img)
-        return plugin_result.AgeDTO(age=value, age_probability=probability)
+    def process_faces(self, faces: List[plugin_result.FaceDTO]):
+        return [plugin_result.AgeDTO(age=value, age_probability=probability)
+                for value, probability in self._evaluate_model(faces)]
 
 
 class GenderDetector(BaseAgeGender):
@@ -73,7 +159,6 @@ class GenderDetector(BaseAgeGender):
         ('21936', '1j9B76U3b4_F9e8-OKlNdOBQKa2ziGe_-'),
     )
 
-    def __call__(self, face: plugin_result.FaceDTO):
-        value, probability = self._model(face._face_img)
-        return plugin_result.GenderDTO(gender=value, gender_probability=probability)
-
+    def process_faces(self, faces: List[plugin_result.FaceDTO]):
+        return [plugin_result.GenderDTO(gender=value, gender_probability=probability)
+                for value, probability in self._evaluate_model(faces)]
@@ -12,22 +12,12 @@
 #  or implied. See the License for the specific language governing
 #  permissions and limitations under the License.
 
-import numpy as np
 import tensorflow.compat.v1 as tf1
 import re
 import tf_slim
 from tf_slim.nets.inception_v3 import inception_v3_base
 
 
-def prewhiten(img):
-    """ Normalize image."""
-    mean = np.mean(img)
-    std = np.std(img)
-    std_adj = np.maximum(std, 1.0 / np.sqrt(img.size))
-    y = np.multiply(np.subtract(img, mean), 1 / std_adj)
-    return y
-
-
 def inception_v3(nlabels, images):
     batch_norm_params = {
         "is_training": False, "trainable": True, "decay": 0.9997,
@@ -17,7 +17,7 @@ import logging
 import tempfile
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, Tuple, Optional
+from typing import Any, List, Tuple, Optional
 from zipfile import ZipFile
 
 import attr
@@ -26,6 +26,8 @@ from cached_property import cached_property
 
 from src.services.dto.json_encodable import JSONEncodable
 from src.services.dto import plugin_result
+from src.services.facescan.plugins.precision import FLOAT32, PRECISION_SEPARATOR
+from src.services.imgtools.types import Array3D
 
 
 logger = logging.getLogger(__name__)
@@ -48,6 +50,10 @@ class MLModel:
     def exists(self):
         return os.path.exists(self.path)
 
+    def converted_path(self, precision: str) -> Path:
+        """ Location of the model converted to reduced precision, next to the original one """
+        return self.path.parent / f'{self.name}{PRECISION_SEPARATOR}{precision}'
+
     def download_if_not_exists(self):
         """
         Download a zipped model from url and extract it to models directory.
@@ -55,6 +61,9 @@ class MLModel:
         if self.exists():
             logger.debug(f'Already exists {self.plugin} model {self.name}')
             return
+        if not self.google_drive_id:
+            logger.warning(f'{self.plugin} model {self.name} is not downloadable, it has to be converted locally')
+            return
         logger.debug(f'Getting {self.plugin} model {self.name}')
         with tempfile.NamedTemporaryFile() as tmpfile:
             self._download(self.url, tmpfile)
@@ -98,8 +107,15 @@ class BasePlugin(ABC):
     # args for init MLModel: model name, Goodle Drive fileID
     ml_models: Tuple[Tuple[str, str], ...] = ()
     ml_model_name: str = None
-
-    def __new__(cls, ml_model_name: str = None):
+    precision: str = FLOAT32
+    # models in other precisions are created by tools/calibrate_precision
+    supported_precisions: Tuple[str, ...] = (FLOAT32,)
+    # the result depends only on the cropped face, so it can be reused for the same crop
+    CACHE_BY_FACE_IMG: bool = False
+    # cheap plugins also run on faces below the requested quality threshold
+    RUNS_ON_LOW_QUALITY_FACES: bool = False
+
+    def __new__(cls, ml_model_name: str = None, precision: str = FLOAT32):
         """
         Plugins might cache pre-trained models and neural networks in properties
         so it has to be Singleton.
@@ -107,6 +123,7 @@ class BasePlugin(ABC):
         if not hasattr(cls, 'instance'):
             cls.instance = super(BasePlugin, cls).__new__(cls)
             cls.instance.ml_model_name = ml_model_name
+            cls.instance.precision = precision
         return cls.instance
 
     @property
@@ -137,12 +154,30 @@ class BasePlugin(ABC):
     def retain_folder_structure(self) -> bool:
         return False
 
+    @property
+    def is_reduced_precision(self) -> bool:
+        return self.precision != FLOAT32
+
+    def convert_precision(self, calibration_faces: List[Array3D]):
+        """ Converts the float32 model to `self.precision`, calibrating it on cropped faces """
+        raise NotImplementedError
+
     def __str__(self):
         if self.ml_model and self.ml_model_name:
-            return f'{self.name}@{self.ml_model_name}'
+            name = f'{self.name}@{self.ml_model_name}'
         else:
-            return self.name
+            name = self.name
+        if self.is_reduced_precision:
+            name += f'{PRECISION_SEPARATOR}{self.precision}'
+        return name
 
     @abstractmethod
     def __call__(self, face: plugin_result.FaceDTO) -> JSONEncodable:
         raise NotImplementedError
+
+    def prepare_faces(self, faces: List[plugin_result.FaceDTO], face_plugins: List['BasePlugin']):
+        """ Called with all requested plugins before any of them runs, e.g. to share a model pass between plugins """
+
+    def process_faces(self, faces: List[plugin_result.FaceDTO]) -> List[JSONEncodable]:
+        """ Results for all faces of an image, plugins override it to process the faces at once """
+        return [self(face) for face in faces]
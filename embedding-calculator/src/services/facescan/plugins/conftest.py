@@ -16,8 +16,9 @@ import os
 from importlib.util import find_spec
 
 modules_by_lib = {
-    'tensorflow': ('facenet', 'agegender'),
-    'mxnet': ('insightface',)
+    'tensorflow': ('facenet', 'agegender', 'tflite'),
+    'mxnet': ('insightface',),
+    'onnxruntime': ('onnx',)
 }
 modules_to_skip = []
 for lib, modules in modules_by_lib.items():
@@ -29,3 +29,8 @@ def get_mxnet() -> Tuple[str, ...]:
         mxnet_lib += f"-cu{117 if 117 <int(cuda_version) else cuda_version}"
     mxnet_lib = mxnet_lib.rstrip('-')
     return (f'{mxnet_lib}==1.9.1',)
+
+
+def get_onnxruntime(version='1.10.0') -> Tuple[str, ...]:
+    onnxruntime_lib = 'onnxruntime-gpu' if ENV.GPU_IDX > -1 else 'onnxruntime'
+    return (f'{onnxruntime_lib}=={version}',)
@@ -0,0 +1,74 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from typing import Any, Callable, Hashable, List
+
+import numpy as np
+
+from src.constants import ENV
+from src.services.cache.bounded_cache import BoundedCache
+from src.services.cache.hashing import hash_img
+from src.services.dto import plugin_result
+
+HASH_FIELD = '_face_img_hash'
+ENTRY_OVERHEAD_BYTES = 256
+
+# Results of plugins computed from the face crop only, shared across requests
+face_plugin_cache = BoundedCache(max_bytes=ENV.FACE_PLUGIN_CACHE_SIZE_MB * 1024 * 1024,
+                                 size_of=lambda value: _size_of(value) + ENTRY_OVERHEAD_BYTES)
+
+
+def _size_of(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_size_of(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return _size_of(list(vars(value).values()))
+    return 0
+
+
+def face_img_hash(face: plugin_result.FaceDTO) -> str:
+    """ Hash of the cropped face, calculated once per FaceDTO """
+    cached_hash = getattr(face, HASH_FIELD, None)
+    if not cached_hash:
+        cached_hash = hash_img(face._face_img)
+        setattr(face, HASH_FIELD, cached_hash)
+    return cached_hash
+
+
+def get_or_compute(faces: List[plugin_result.FaceDTO], name: Hashable,
+                   compute: Callable[[List[plugin_result.FaceDTO]], List[Any]]) -> List[Any]:
+    """
+    Returns values cached for the same face crops, the missing ones are computed
+    for all faces at once and cached
+    """
+    if not face_plugin_cache.enabled:
+        return compute(faces)
+    keys = [(face_img_hash(face), name) if face._face_img is not None else None for face in faces]
+    values = [face_plugin_cache.get(key) if key else None for key in keys]
+    missing = [i for i, value in enumerate(values) if value is None]
+    if missing:
+        for i, value in zip(missing, compute([faces[i] for i in missing])):
+            values[i] = value
+            if keys[i]:
+                face_plugin_cache.put(keys[i], value)
+    return values
+
+
+def apply_plugin(plugin, faces: List[plugin_result.FaceDTO]) -> List[Any]:
+    """ Runs the plugin on all faces at once or reuses its results if the plugin depends only on the face crop """
+    if not plugin.CACHE_BY_FACE_IMG:
+        return plugin.process_faces(faces)
+    return get_or_compute(faces, str(plugin), plugin.process_faces)
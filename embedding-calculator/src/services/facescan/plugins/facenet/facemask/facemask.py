@@ -27,6 +27,7 @@ import cv2
 
 class MaskDetector(base.BasePlugin):
     slug = 'mask'
+    CACHE_BY_FACE_IMG = True
     LABELS = ('without_mask', 'with_mask', 'mask_weared_incorrect')
     ml_models = (
         ('inception_v3_on_mafa_kaggle123', '1nhmv4Pd8nnV8XHv6vlf6RCpwQLow78zS'),
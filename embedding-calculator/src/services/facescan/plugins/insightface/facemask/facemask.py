@@ -33,6 +33,7 @@ if ENV.RUN_MODE:
 
 class MaskDetector(InsightFaceMixin, base.BasePlugin):
     slug = 'mask'
+    CACHE_BY_FACE_IMG = True
     LABELS = ('without_mask', 'with_mask', 'mask_weared_incorrect')
     ml_models = (
         ('mobilenet_v2_on_mafa_kaggle123', '1DYUIroNXkuYKQypYtCxQvAItLnrTTt5E'),
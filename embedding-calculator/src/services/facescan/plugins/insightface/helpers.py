@@ -12,38 +12,103 @@
 #  or implied. See the License for the specific language governing
 #  permissions and limitations under the License.
 
-from typing import Tuple
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Tuple
 import numpy as np
 import cv2
 from skimage import transform as trans
 
 from src.constants import ENV
+from src.services.facescan.plugins import exceptions
+from src.services.facescan.plugins.precision import INT8
+from src.services.imgtools.types import Array3D
+from src.services.utils.buffer_pool import buffer_pool
 
 
 if ENV.RUN_MODE:
     import mxnet as mx
+    from mxnet.contrib import amp, quantization
 
+CONVERTED_MODEL_PREFIX = 'model'
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
 
-def predict_landmark2d106(model, img,
-                          crop_size:  Tuple[int, int],
-                          box_center: Tuple[int, int],
-                          box_size: Tuple[int, int]):
-    rotate = 0
-    _scale = crop_size[0] * 2 / 3.0 / max(box_size)
-    rimg, M = transform(img, box_center, crop_size[0], _scale, rotate)
 
-    input_blob = np.zeros((1, 3) + crop_size, dtype=np.float32)
-    input_blob[0] = np.transpose(rimg, (2, 0, 1))  # 3*112*112, RGB
+def bucket_size(count: int, buckets: Tuple[int, ...] = BATCH_BUCKETS) -> int:
+    """
+    The smallest bound batch size for `count` items, larger batches are split by the largest size.
+    >>> bucket_size(1), bucket_size(3), bucket_size(100)
+    (1, 4, 32)
+    """
+    return next((size for size in buckets if size >= count), buckets[-1])
 
-    data = mx.nd.array(input_blob)
-    db = mx.io.DataBatch(data=(data,))
-    model.forward(db, is_train=False)
-    pred = model.get_outputs()[-1].asnumpy()[0].reshape((-1, 2))
-    pred[:, 0:2] += 1
-    pred[:, 0:2] *= (crop_size[0] // 2)
 
-    IM = cv2.invertAffineTransform(M)
-    return trans_points2d(pred, IM)
+def load_bucketed_model(param_file: str, output_layer: str, ctx_id: int,
+                        item_shape: Tuple[int, ...]) -> 'BucketedModel':
+    prefix, epoch = param_file.rsplit('.', 1)[0].rsplit('-', 1)
+    sym, arg_params, aux_params = mx.model.load_checkpoint(prefix, int(epoch))
+    ctx = mx.gpu(ctx_id) if ctx_id >= 0 else mx.cpu()
+    return BucketedModel(sym.get_internals()[output_layer], arg_params, aux_params, ctx, item_shape)
+
+
+class BucketedModel:
+    """
+    MXNet modules bound for a few batch sizes, sharing the parameters.
+    Batches are padded to the nearest bound size, so a module is never re-bound for a new face count.
+    """
+
+    def __init__(self, sym, arg_params, aux_params, ctx, item_shape: Tuple[int, ...],
+                 buckets: Tuple[int, ...] = BATCH_BUCKETS):
+        self._sym = sym
+        self._ctx = ctx
+        self._item_shape = item_shape
+        self._buckets = buckets
+        self._modules = {}
+        self._module(buckets[0]).set_params(arg_params, aux_params)
+
+    def _module(self, batch_size: int):
+        if batch_size not in self._modules:
+            module = mx.mod.Module(symbol=self._sym, context=self._ctx, label_names=None)
+            module.bind(for_training=False, data_shapes=[('data', (batch_size, *self._item_shape))],
+                        shared_module=self._modules.get(self._buckets[0]))
+            self._modules[batch_size] = module
+        return self._modules[batch_size]
+
+    def __call__(self, data: np.ndarray) -> np.ndarray:
+        outputs = []
+        for start in range(0, len(data), self._buckets[-1]):
+            chunk = data[start:start + self._buckets[-1]]
+            batch = buffer_pool.acquire((bucket_size(len(chunk), self._buckets), *self._item_shape))
+            try:
+                batch[:len(chunk)] = chunk
+                batch[len(chunk):] = 0
+                module = self._module(len(batch))
+                module.forward(mx.io.DataBatch(data=(mx.nd.array(batch),)), is_train=False)
+            finally:
+                buffer_pool.release(batch)
+            outputs.append(module.get_outputs()[-1].asnumpy()[:len(chunk)])
+        return np.concatenate(outputs)
+
+
+def predict_landmark2d106(model: BucketedModel, imgs: List[Array3D],
+                          crop_size: Tuple[int, int],
+                          box_centers: List[Tuple[int, int]],
+                          box_sizes: List[Tuple[int, int]]) -> np.ndarray:
+    """ Landmarks of all faces (N, 106, 2), their warps are inferred in one batch """
+    warps = buffer_pool.acquire((len(imgs), 3, *crop_size))
+    inverse_transforms = []
+    try:
+        for i, (img, box_center, box_size) in enumerate(zip(imgs, box_centers, box_sizes)):
+            scale = crop_size[0] * 2 / 3.0 / max(box_size)
+            rimg, M = transform(img, box_center, crop_size[0], scale, 0)
+            warps[i] = np.transpose(rimg, (2, 0, 1))  # 3*192*192, RGB
+            inverse_transforms.append(cv2.invertAffineTransform(M))
+        pred = model(warps).reshape((len(warps), -1, 2))
+    finally:
+        buffer_pool.release(warps)
+    pred += 1
+    pred *= (crop_size[0] // 2)
+    return trans_points2d(pred, np.stack(inverse_transforms))
 
 
 def transform(data, center, output_size, scale, rotation):
@@ -64,11 +129,89 @@ def transform(data, center, output_size, scale, rotation):
 
 
 def trans_points2d(pts, M):
-    new_pts = np.zeros(shape=pts.shape, dtype=np.float32)
-    for i in range(pts.shape[0]):
-        pt = pts[i]
-        new_pt = np.array([pt[0], pt[1], 1.], dtype=np.float32)
-        new_pt = np.dot(M, new_pt)
-        #print('new_pt', new_pt.shape, new_pt)
-        new_pts[i] = new_pt[0:2]
-    return new_pts
\ No newline at end of file
+    """
+    Applies affine transforms (..., 2, 3) to points (..., P, 2).
+    >>> trans_points2d(np.array([[[1, 2], [3, 4]]]), np.array([[[1, 0, 10], [0, 2, 0]]])).tolist()
+    [[[11.0, 4.0], [13.0, 8.0]]]
+    """
+    M = np.asarray(M)
+    new_pts = np.matmul(pts, np.swapaxes(M[..., :2], -1, -2)) + M[..., None, :, 2]
+    return new_pts.astype(np.float32)
+
+def decode_genderage(outputs: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Gender index and age from `fc1_output` of the genderage model, as insightface FaceGenderage.get does.
+    >>> age_bits = np.tile([1.0, 0.0], 100); age_bits[:60] = np.tile([0.0, 1.0], 30)
+    >>> decode_genderage(np.array([np.concatenate([[0.2, 0.8], age_bits])]))
+    [(1, 30)]
+    """
+    genders = np.argmax(outputs[:, 0:2], axis=1)
+    ages = np.argmax(outputs[:, 2:202].reshape((len(outputs), 100, 2)), axis=2).sum(axis=1)
+    return [(int(gender), int(age)) for gender, age in zip(genders, ages)]
+
+
+@contextmanager
+def nchw_batch(imgs: List[Array3D]) -> Iterator[np.ndarray]:
+    """
+    The same input as in insightface FaceRecognition.get_embedding: swapped color channels, NCHW.
+    The batch is borrowed from the buffer pool until the end of the block.
+    >>> with nchw_batch([np.arange(12, dtype=np.uint8).reshape((2, 2, 3))]) as batch:
+    ...     batch.shape, batch.dtype, batch[0, :, 0, 0].tolist()
+    ((1, 3, 2, 2), dtype('float32'), [2.0, 1.0, 0.0])
+    """
+    batch = buffer_pool.acquire((len(imgs), imgs[0].shape[2], *imgs[0].shape[:2]))
+    try:
+        for i, img in enumerate(imgs):
+            batch[i] = np.transpose(img[:, :, ::-1], (2, 0, 1))
+        yield batch
+    finally:
+        buffer_pool.release(batch)
+
+
+def to_nchw_batch(imgs: List[Array3D]) -> np.ndarray:
+    with nchw_batch(imgs) as batch:
+        return batch.copy()
+
+
+def _get_context(ctx_id: int, precision: str):
+    # quantized MKLDNN operators run only on CPU
+    return mx.gpu(ctx_id) if ctx_id >= 0 and precision != INT8 else mx.cpu()
+
+
+def convert_model(param_file: str, output_layer: str, precision: str, calibration_data: np.ndarray,
+                  path: Path, ctx_id: int):
+    """
+    Converts an MXNet checkpoint to reduced precision:
+    int8 - MKLDNN quantization, ranges of activations are calibrated on `calibration_data`,
+    float16 - AMP conversion; on CPU bfloat16 is used as CPU kernels do not support float16.
+    """
+    prefix, epoch = param_file.rsplit('.', 1)[0].rsplit('-', 1)
+    sym, arg_params, aux_params = mx.model.load_checkpoint(prefix, int(epoch))
+    sym = sym.get_internals()[output_layer]
+    if precision == INT8:
+        calib_data = mx.io.NDArrayIter(data=calibration_data, batch_size=1, data_name='data')
+        sym, arg_params, aux_params = quantization.quantize_model_mkldnn(
+            sym, arg_params, aux_params, ctx=mx.cpu(), calib_mode='naive', calib_data=calib_data,
+            num_calib_examples=len(calibration_data), quantized_dtype='auto')
+        sym = sym.get_backend_symbol('MKLDNN_QUANTIZE')
+    else:
+        target_dtype = 'float16' if ctx_id >= 0 else 'bfloat16'
+        sym, arg_params, aux_params = amp.convert_model(
+            sym, arg_params, aux_params, target_dtype=target_dtype, cast_optional_params=True)
+    path.mkdir(parents=True, exist_ok=True)
+    mx.model.save_checkpoint(str(path / CONVERTED_MODEL_PREFIX), 0, sym, arg_params, aux_params)
+
+
+class ConvertedModel:
+    def __init__(self, path: Path, ctx_id: int, precision: str, data_shape: Tuple[int, ...]):
+        if not path.exists():
+            raise exceptions.ModelImportException(
+                f'Converted model {path} does not exist, run `python -m tools.calibrate_precision`')
+        sym, arg_params, aux_params = mx.model.load_checkpoint(str(path / CONVERTED_MODEL_PREFIX), 0)
+        self._model = mx.mod.Module(symbol=sym, context=_get_context(ctx_id, precision), label_names=None)
+        self._model.bind(data_shapes=[('data', data_shape)], for_training=False)
+        self._model.set_params(arg_params, aux_params)
+
+    def __call__(self, data: np.ndarray) -> np.ndarray:
+        self._model.forward(mx.io.DataBatch(data=(mx.nd.array(data),)), is_train=False)
+        return self._model.get_outputs()[0].asnumpy().astype(np.float32)
@@ -13,7 +13,6 @@
 #  permissions and limitations under the License.
 
 import logging
-import ctypes
 from typing import List, Tuple
 import attr
 import numpy as np
@@ -23,8 +22,9 @@ from src.constants import ENV
 from src.services.dto.bounding_box import BoundingBoxDTO
 from src.services.dto.json_encodable import JSONEncodable
 from src.services.facescan.imgscaler.imgscaler import ImgScaler
-from src.services.facescan.plugins import base, mixins, exceptions
+from src.services.facescan.plugins import base, mixins, exceptions, face_cache
 from src.services.facescan.plugins.insightface import helpers as insight_helpers
+from src.services.facescan.plugins.precision import FLOAT32, FLOAT16, INT8
 from src.services.dto import plugin_result
 from src.services.imgtools.types import Array3D
 import collections
@@ -32,14 +32,13 @@ from src._endpoints import FaceDetection
 
 
 logger = logging.getLogger(__name__)
-libc = ctypes.CDLL("libc.so.6")
 
 if ENV.RUN_MODE:
     import mxnet as mx
 
     from insightface.app import FaceAnalysis
     from insightface.model_zoo import (model_store, face_detection,
-                                    face_recognition, face_genderage)
+                                    face_recognition)
     from insightface.utils import face_align
 
     class DetectionOnlyFaceAnalysis(FaceAnalysis):
@@ -67,8 +66,6 @@ class FaceDetector(InsightFaceMixin, mixins.FaceDetectorMixin, base.BasePlugin):
         ('retinaface_mnet025_v2', '1EYTMxgcNdlvoL1fSC8N1zkaWrX75ZoNL'),
         ('retinaface_r50_v1', '1LZ5h9f_YC5EdbIZAqVba9TKHipi90JBj'),
     )
-    call_counter = 0
-    MAX_CALL_COUNTER = 1000
     IMG_LENGTH_LIMIT = ENV.IMG_LENGTH_LIMIT
     IMAGE_SIZE = 112
     det_prob_threshold = 0.8
@@ -104,12 +101,6 @@ class FaceDetector(InsightFaceMixin, mixins.FaceDetectorMixin, base.BasePlugin):
             results = model.get(img, det_thresh=det_prob_threshold)
 
         boxes = []
-
-        self.call_counter +=1
-        if self.call_counter % self.MAX_CALL_COUNTER == 0:
-            libc.malloc_trim(0)
-            self.call_counter = 0
-            
         for result in results:
             downscaled_box_array = result.bbox.astype(np.int).flatten()
             downscaled_box = BoundingBoxDTO(x_min=downscaled_box_array[0],
@@ -142,10 +133,27 @@ class Calculator(InsightFaceMixin, mixins.CalculatorMixin, base.BasePlugin):
         # CASIA-WebFace-Masked, 0.9840 LFW, 0.9667 LFW-Masked (orig mobilefacenet has 0.9482 on LFW-Masked)
         ('arcface_mobilefacenet_casia_masked', '1ltcJChTdP1yQWF9e1ESpTNYAVwxLSNLP', (1.22507105, 7.321198934), 200),
     )
+    supported_precisions = (FLOAT32, FLOAT16, INT8)
+    EMBEDDING_LAYER = 'fc1_output'
 
     def calc_embedding(self, face_img: Array3D) -> Array3D:
+        if self.is_reduced_precision:
+            with insight_helpers.nchw_batch([face_img]) as batch:
+                return self._converted_model(batch).flatten()
         return self._calculation_model.get_embedding(face_img).flatten()
 
+    @cached_property
+    def _converted_model(self):
+        return insight_helpers.ConvertedModel(
+            self.ml_model.converted_path(self.precision), self._CTX_ID, self.precision,
+            data_shape=(1, 3, FaceDetector.IMAGE_SIZE, FaceDetector.IMAGE_SIZE))
+
+    def convert_precision(self, calibration_faces: List[Array3D]):
+        insight_helpers.convert_model(
+            self.get_model_file(self.ml_model), self.EMBEDDING_LAYER, self.precision,
+            insight_helpers.to_nchw_batch(calibration_faces),
+            self.ml_model.converted_path(self.precision), self._CTX_ID)
+
     @cached_property
     def _calculation_model(self):
         model_file = self.get_model_file(self.ml_model)
@@ -166,38 +174,50 @@ class BaseGenderAge(InsightFaceMixin, base.BasePlugin):
         ('genderage_v1', '1J9hqSWqZz6YvMMNrDrmrzEW9anhvdKuC'),
     )
     CACHE_FIELD = '_genderage_cached_result'
-
-    def _evaluate_model(self, face: plugin_result.FaceDTO):
-        cached_result = getattr(face, self.CACHE_FIELD, None)
-        if not cached_result:
-            cached_result = self._genderage_model.get(face._face_img)
-            setattr(face, self.CACHE_FIELD, cached_result)
-        return cached_result
+    CACHE_BY_FACE_IMG = True
+    OUTPUT_LAYER = 'fc1_output'
+
+    def _evaluate_model(self, faces: List[plugin_result.FaceDTO]) -> List[Tuple[int, int]]:
+        """
+        Gender and age of all faces, the shared model runs once for faces that have no result yet,
+        so the second of Age and Gender detectors reuses the results of the first one
+        """
+        missing = [face for face in faces if getattr(face, self.CACHE_FIELD, None) is None]
+        if missing:
+            results = face_cache.get_or_compute(
+                missing, f'{self.backend}.genderage@{self.ml_model.name}', self._run_genderage_model)
+            for face, result in zip(missing, results):
+                setattr(face, self.CACHE_FIELD, result)
+        return [getattr(face, self.CACHE_FIELD) for face in faces]
+
+    def _run_genderage_model(self, faces: List[plugin_result.FaceDTO]) -> List[Tuple[int, int]]:
+        with insight_helpers.nchw_batch([face._face_img for face in faces]) as batch:
+            outputs = self._genderage_model(batch)
+        return insight_helpers.decode_genderage(outputs)
 
     @cached_property
     def _genderage_model(self):
-        model_file = self.get_model_file(self.ml_model)
-        model = face_genderage.FaceGenderage(
-            self.ml_model.name, True, model_file)
-        model.prepare(ctx_id=self._CTX_ID)
-        return model
+        return insight_helpers.load_bucketed_model(
+            self.get_model_file(self.ml_model), self.OUTPUT_LAYER, self._CTX_ID,
+            item_shape=(3, FaceDetector.IMAGE_SIZE, FaceDetector.IMAGE_SIZE))
+
+    def __call__(self, face: plugin_result.FaceDTO):
+        return self.process_faces([face])[0]
 
 
 class GenderDetector(BaseGenderAge):
     slug = "gender"
     GENDERS = ('female', 'male')
 
-    def __call__(self, face: plugin_result.FaceDTO):
-        gender, age = self._evaluate_model(face)
-        return plugin_result.GenderDTO(gender=self.GENDERS[int(gender)])
+    def process_faces(self, faces: List[plugin_result.FaceDTO]):
+        return [plugin_result.GenderDTO(gender=self.GENDERS[gender]) for gender, age in self._evaluate_model(faces)]
 
 
 class AgeDetector(BaseGenderAge):
     slug = "age"
 
-    def __call__(self, face: plugin_result.FaceDTO):
-        gender, age = self._evaluate_model(face)
-        return plugin_result.AgeDTO(age=(age, age))
+    def process_faces(self, faces: List[plugin_result.FaceDTO]):
+        return [plugin_result.AgeDTO(age=(age, age)) for gender, age in self._evaluate_model(faces)]
 
 
 class LandmarksDetector(mixins.LandmarksDetectorMixin, base.BasePlugin):
@@ -219,13 +239,17 @@ class Landmarks2d106Detector(InsightFaceMixin, mixins.LandmarksDetectorMixin,
         ('2d106det', '18cL35hF2exZ8u4pfLKWjJGxF0ySuYM2o'),
     )
     CROP_SIZE = (192, 192) # model requirements
+    RUNS_ON_LOW_QUALITY_FACES = False
 
     def __call__(self, face: plugin_result.FaceDTO):
+        return self.process_faces([face])[0]
+
+    def process_faces(self, faces: List[plugin_result.FaceDTO]) -> List[Landmarks2d106DTO]:
         landmarks = insight_helpers.predict_landmark2d106(
-            self._landmark_model, face._img, self.CROP_SIZE,
-            face.box.center, (face.box.width, face.box.height),
+            self._landmark_model, [face._img for face in faces], self.CROP_SIZE,
+            [face.box.center for face in faces], [(face.box.width, face.box.height) for face in faces],
         )
-        return Landmarks2d106DTO(landmarks=landmarks.astype(int).tolist())
+        return [Landmarks2d106DTO(landmarks=face_landmarks.astype(int).tolist()) for face_landmarks in landmarks]
 
     @cached_property
     def _landmark_model(self):
@@ -234,11 +258,7 @@ class Landmarks2d106Detector(InsightFaceMixin, mixins.LandmarksDetectorMixin,
         ctx = mx.gpu(self._CTX_ID) if self._CTX_ID >= 0 else mx.cpu()
         all_layers = sym.get_internals()
         sym = all_layers['fc1_output']
-        model = mx.mod.Module(symbol=sym, context=ctx, label_names=None)
-        model.bind(for_training=False,
-                   data_shapes=[('data', (1, 3, *self.CROP_SIZE))])
-        model.set_params(arg_params, aux_params)
-        return model
+        return insight_helpers.BucketedModel(sym, arg_params, aux_params, ctx, item_shape=(3, *self.CROP_SIZE))
 
 
 class PoseEstimator(mixins.PoseEstimatorMixin, base.BasePlugin):
@@ -19,7 +19,8 @@ from types import ModuleType
 from cached_property import cached_property
 
 from src import constants
-from src.services.facescan.plugins import base, mixins
+from src.services.facescan.plugins import base, exceptions, mixins
+from src.services.facescan.plugins.precision import split_precision
 
 
 ML_MODEL_SEPARATOR = '@'
@@ -30,6 +31,21 @@ def import_classes(class_path: str):
     return getattr(import_module(module, __package__), class_name)
 
 
+def create_plugin(plugin_name: str) -> base.BasePlugin:
+    """ Creates a plugin by its full name, e.g. `insightface.Calculator@arcface_r100_v1:int8` """
+    plugin_name, precision = split_precision(plugin_name)
+    mlmodel_name = None
+    if ML_MODEL_SEPARATOR in plugin_name:
+        plugin_name, mlmodel_name = plugin_name.split(ML_MODEL_SEPARATOR)
+    package, class_name = plugin_name.rsplit('.', 1)
+    # plugins live in a module named after their package, e.g. facenet.facemask.facemask.MaskDetector
+    pl_class = import_classes(f'{__package__}.{package}.{package.rsplit(".", 1)[-1]}.{class_name}')
+    if precision not in pl_class.supported_precisions:
+        raise exceptions.PluginError(f'{plugin_name} does not support {precision} precision, '
+                                     f'supported: {pl_class.supported_precisions}')
+    return pl_class(ml_model_name=mlmodel_name, precision=precision)
+
+
 class PluginManager:
     plugins_modules: Dict[ModuleType, List[str]]
 
@@ -56,17 +72,7 @@ class PluginManager:
 
     @cached_property
     def plugins(self):
-        plugins = []
-        for module, plugins_names in self.plugins_modules.items():
-            for pl_name in plugins_names:
-                mlmodel_name = None
-                if ML_MODEL_SEPARATOR in pl_name:
-                    pl_name, mlmodel_name = pl_name.split(ML_MODEL_SEPARATOR)
-                pl_path = f'{module.__package__}.{pl_name}'
-                pl_class = import_classes(pl_path)
-                plugin = pl_class(ml_model_name=mlmodel_name)
-                plugins.append(plugin)
-        return plugins
+        return [create_plugin(plugin_name) for plugin_name in self.get_plugins_names()]
 
     @cached_property
     def detector(self) -> mixins.FaceDetectorMixin:
@@ -12,17 +12,22 @@
 #  or implied. See the License for the specific language governing
 #  permissions and limitations under the License.
 
-import cv2
 import numpy as np
 from time import time, sleep
 from abc import ABC, abstractmethod
+from collections import defaultdict
 from contextlib import contextmanager
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
 
+from cached_property import cached_property
+
+from src.constants import ENV
 from src.services.dto.bounding_box import BoundingBoxDTO
 from src.services.dto import plugin_result
+from src.services.imgtools import preprocessing
 from src.services.imgtools.types import Array3D
-from src.services.facescan.plugins import base, exceptions
+from src.services.facescan.plugins import base, exceptions, face_cache, pose, quality
+from src.services.facescan.tracking.tracker import FaceTracker, FaceTrackDTO
 
 
 @contextmanager
@@ -35,43 +40,121 @@ def elapsed_time_contextmanager() -> int:
     elapsed = int((time() - start) * 1000)
 
 
+def faces_limit(limit: int, max_faces: int) -> int:
+    """
+    The stricter of two face count limits, 0 - no limit.
+    >>> faces_limit(0, 0), faces_limit(3, 0), faces_limit(0, 5), faces_limit(3, 5), faces_limit(7, 5)
+    (0, 3, 5, 3, 5)
+    """
+    return min(limit or max_faces, max_faces or limit)
+
+
 class FaceDetectorMixin(ABC):
     slug = 'detector'
     IMAGE_SIZE: int
+    MAX_FACES = ENV.MAX_FACES
     face_plugins: List[base.BasePlugin] = []
 
     def __call__(self, img: Array3D, det_prob_threshold: float = None,
-                 face_plugins: Tuple[base.BasePlugin] = ()) -> List[plugin_result.FaceDTO]:
-        """ Returns cropped and normalized faces."""
-        faces = self._fetch_faces(img, det_prob_threshold)
-        for face in faces:
-            self._apply_face_plugins(face, face_plugins)
+                 face_plugins: Tuple[base.BasePlugin] = (), limit: int = 0,
+                 quality_threshold: float = None) -> List[plugin_result.FaceDTO]:
+        """
+        Returns cropped and normalized faces. Only the `limit` (and `MAX_FACES`) largest faces
+        are cropped and processed, 0 - all. With `quality_threshold` faces get a quality score,
+        and only cheap plugins run on faces scored below the threshold.
+        """
+        faces = self._fetch_faces(img, det_prob_threshold, limit)
+        self._apply_face_plugins(faces, face_plugins, quality_threshold)
         return faces
 
-    def _fetch_faces(self, img: Array3D, det_prob_threshold: float = None):
+    def iter_faces(self, img: Array3D, det_prob_threshold: float = None,
+                   face_plugins: Tuple[base.BasePlugin] = (), limit: int = 0,
+                   quality_threshold: float = None) -> Iterator[plugin_result.FaceDTO]:
+        """ Same as `__call__`, but yields each face as soon as the face plugins are applied to it """
+        for face in self._fetch_faces(img, det_prob_threshold, limit):
+            self._apply_face_plugins([face], face_plugins, quality_threshold)
+            yield face
+
+    def track_faces(self, frames: List[Array3D], det_prob_threshold: float = None,
+                    face_plugins: Tuple[base.BasePlugin] = (), limit: int = 0,
+                    quality_threshold: float = None) -> List[FaceTrackDTO]:
+        """
+        Tracks faces through frames of the same scene. Face plugins run once per track,
+        on the face of its best frame. Only the `limit` (and `MAX_FACES`) largest tracks are processed.
+        """
+        tracker = FaceTracker()
+        with elapsed_time_contextmanager() as get_elapsed_time:
+            for frame_idx, frame in enumerate(frames):
+                tracker.update(frame_idx, self.find_faces(frame, det_prob_threshold))
+        tracks = sorted(tracker.tracks, key=lambda t: t.best_box.width * t.best_box.height, reverse=True)
+
+        limit = faces_limit(limit, self.MAX_FACES)
+        tracks = tracks[:limit] if limit else tracks
+        faces = [
+            plugin_result.FaceDTO(
+                img=frames[track.best_frame], face_img=self.crop_face(frames[track.best_frame], track.best_box),
+                box=track.best_box, execution_time={self.slug: get_elapsed_time() // len(tracks)}
+            ) for track in tracks
+        ]
+        self._apply_face_plugins(faces, face_plugins, quality_threshold)
+        return [FaceTrackDTO(track_id=track.track_id, best_frame=track.best_frame,
+                             frames=track.frames, boxes=track.boxes, face=face)
+                for track, face in zip(tracks, faces)]
+
+    def _fetch_faces(self, img: Array3D, det_prob_threshold: float = None, limit: int = 0):
         with elapsed_time_contextmanager() as get_elapsed_time:
             boxes = self.find_faces(img, det_prob_threshold)
             # sort by face area
             boxes = sorted(boxes, key=lambda x: x.width * x.height, reverse=True)
 
+        limit = faces_limit(limit, self.MAX_FACES)
         return [
             plugin_result.FaceDTO(
                 img=img, face_img=self.crop_face(img, box), box=box,
                 execution_time={self.slug: get_elapsed_time() // len(boxes)}
-            ) for box in boxes
+            ) for box in (boxes[:limit] if limit else boxes)
         ]
 
-    def _apply_face_plugins(self, face: plugin_result.FaceDTO,
-                            face_plugins: Tuple[base.BasePlugin]):
-        for plugin in face_plugins:
-            try:
-                with elapsed_time_contextmanager() as get_elapsed_time:
-                    result_dto = plugin(face)
-                face._plugins_dto.append(result_dto)
-            except Exception as e:
-                raise exceptions.PluginError(f'{plugin} error - {e}')
-            else:
-                face.execution_time[plugin.slug] = get_elapsed_time()
+    def _apply_face_plugins(self, faces: List[plugin_result.FaceDTO], face_plugins: Tuple[base.BasePlugin],
+                            quality_threshold: float = None):
+        if not faces:
+            return
+        usable_faces = faces
+        if quality_threshold is not None:
+            scores = self._apply_quality(faces)
+            usable_faces = [face for face, score in zip(faces, scores) if score >= quality_threshold]
+
+        plugin_faces = [(plugin, faces if plugin.RUNS_ON_LOW_QUALITY_FACES else usable_faces)
+                        for plugin in face_plugins]
+        with preprocessing.face_preprocessing(faces):
+            for plugin, faces_to_process in plugin_faces:
+                if faces_to_process:
+                    plugin.prepare_faces(faces_to_process, face_plugins)
+            for plugin, faces_to_process in plugin_faces:
+                if faces_to_process:
+                    self._apply_face_plugin(faces_to_process, plugin)
+
+    def _apply_quality(self, faces: List[plugin_result.FaceDTO]) -> List[float]:
+        """ Adds quality scores to the faces, returns the scores """
+        with elapsed_time_contextmanager() as get_elapsed_time:
+            face_quality = quality.face_quality([face._face_img for face in faces], [face.box for face in faces])
+        for i, face in enumerate(faces):
+            face._plugins_dto.append(plugin_result.QualityDTO(
+                score=face_quality.score[i], size=face_quality.size[i], sharpness=face_quality.sharpness[i],
+                pose=face_quality.pose[i], illumination=face_quality.illumination[i]))
+            face.execution_time['quality'] = get_elapsed_time() // len(faces)
+        return face_quality.score.tolist()
+
+    def _apply_face_plugin(self, faces: List[plugin_result.FaceDTO], plugin: base.BasePlugin):
+        """ Runs the plugin on all faces of the image at once """
+        try:
+            with elapsed_time_contextmanager() as get_elapsed_time:
+                results = face_cache.apply_plugin(plugin, faces)
+        except Exception as e:
+            raise exceptions.PluginError(f'{plugin} error - {e}')
+        for face, result_dto in zip(faces, results):
+            face._plugins_dto.append(result_dto)
+            face.execution_time[plugin.slug] = get_elapsed_time() // len(faces)
 
     @abstractmethod
     def find_faces(self, img: Array3D, det_prob_threshold: float = None) -> List[BoundingBoxDTO]:
@@ -86,6 +169,7 @@ class FaceDetectorMixin(ABC):
 
 class CalculatorMixin(ABC):
     slug = 'calculator'
+    CACHE_BY_FACE_IMG = True
     # args for init MLModel: model name, Goodle Drive fileID, similarity coefficients
     ml_models: Tuple[Tuple[str, str, str], ...] = ()
 
@@ -107,6 +191,7 @@ class CalculatorMixin(ABC):
 
 class LandmarksDetectorMixin:
     slug = "landmarks"
+    RUNS_ON_LOW_QUALITY_FACES = True
 
     def __call__(self, face: plugin_result.FaceDTO) -> plugin_result.LandmarksDTO:
         return plugin_result.LandmarksDTO(landmarks=face.box.landmarks)
@@ -114,6 +199,7 @@ class LandmarksDetectorMixin:
 
 class PoseEstimatorMixin:
     slug = 'pose'
+    RUNS_ON_LOW_QUALITY_FACES = True
     FOCAL_COEF = 1
     KEYPOINTS_3D = {
         'left_eye': [-8.0, 9.0, -8.0],
@@ -124,57 +210,38 @@ class PoseEstimatorMixin:
         'chin': [0.0, -11.0, -4.0]
     }
 
-    @staticmethod
-    def add_chin_point(keypoints):
-        keypoints['nose_bridge'] = (
-            (keypoints['left_eye'][0] + keypoints['right_eye'][0]) // 2,
-            (keypoints['left_eye'][1] + keypoints['right_eye'][1]) // 2
-        )
-        keypoints['mouth_center'] = (
-            (keypoints['mouth_left'][0] + keypoints['mouth_right'][0]) // 2,
-            (keypoints['mouth_left'][1] + keypoints['mouth_right'][1]) // 2
-        )
-        keypoints['chin'] = (
-            keypoints['mouth_center'][0] + (keypoints['mouth_center'][0] - keypoints['nose_bridge'][0]) // 2,
-            keypoints['mouth_center'][1] + (keypoints['mouth_center'][1] - keypoints['nose_bridge'][1]) // 2
-        )
-        return keypoints
-
-    @staticmethod
-    def camera_matrix(focal_length, optical_center):
-        return np.array(
-            [[focal_length, 1, optical_center[0]],
-            [0, focal_length, optical_center[1]],
-            [0, 0, 1]],
-            dtype=np.float)
+    @cached_property
+    def _keypoints_3d_array(self) -> np.ndarray:
+        return np.array(list(self.KEYPOINTS_3D.values()), dtype=np.float64)
 
     @staticmethod
     def landmarks_names_ordered():
         """ List of lanmarks names orderred as in detector """
         raise NotImplementedError
 
-    def __call__(self, face: plugin_result.FaceDTO) -> plugin_result.PoseDTO:
-        keypoints_on_image = dict(zip(self.landmarks_names_ordered(), face.box.landmarks))
-        keypoints_on_image = self.add_chin_point(keypoints_on_image)
-        
-        keypoints_on_image_array = np.array([keypoints_on_image[point_name] \
-             for point_name in self.KEYPOINTS_3D.keys()], dtype=np.float)
-        keypoints_3d_array = np.array(list(self.KEYPOINTS_3D.values()), dtype=np.float)
-
-        image_height, image_width, channels_count = face._img.shape
-        focal_length = self.FOCAL_COEF * image_width
-        camera_matrix = self.camera_matrix(focal_length, (image_height / 2, image_width / 2))
-
-        success, rotation_vector, translation_vector = cv2.solvePnP(
-            keypoints_3d_array,
-            keypoints_on_image_array,
-            camera_matrix,
-            np.zeros((4, 1), dtype=np.float64)
-        )
+    def keypoints_on_images(self, faces: List[plugin_result.FaceDTO]) -> np.ndarray:
+        """ Image points of KEYPOINTS_3D for all faces (N, 6, 2), the chin is extrapolated from eyes and mouth """
+        names = self.landmarks_names_ordered()
+        landmarks = np.array([face.box.landmarks for face in faces], dtype=np.float64)
+        points = {name: landmarks[:, names.index(name)]
+                  for name in ('left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right')}
+        nose_bridge = (points['left_eye'] + points['right_eye']) // 2
+        mouth_center = (points['mouth_left'] + points['mouth_right']) // 2
+        points['chin'] = mouth_center + (mouth_center - nose_bridge) // 2
+        return np.stack([points[name] for name in self.KEYPOINTS_3D], axis=1)
 
-        rotation_matrix, jacobian = cv2.Rodrigues(rotation_vector)
-        angles, mtx_r, mtx_q, q_x, q_y, q_z = cv2.RQDecomp3x3(rotation_matrix)
-        return plugin_result.PoseDTO(
-            pitch=np.sign(angles[0]) * 180 - angles[0], 
-            yaw=angles[1], 
-            roll=np.sign(angles[2]) * 180 - angles[2])
+    def __call__(self, face: plugin_result.FaceDTO) -> plugin_result.PoseDTO:
+        return self.process_faces([face])[0]
+
+    def process_faces(self, faces: List[plugin_result.FaceDTO]) -> List[plugin_result.PoseDTO]:
+        keypoints = self.keypoints_on_images(faces)
+        angles = np.empty((len(faces), 3))
+        faces_by_img_size = defaultdict(list)
+        for i, face in enumerate(faces):
+            faces_by_img_size[face._img.shape[:2]].append(i)
+        for (image_height, image_width), indices in faces_by_img_size.items():
+            camera_matrix = pose.camera_matrix_for_image(image_height, image_width, self.FOCAL_COEF)
+            rotations = pose.solve_rotations(self._keypoints_3d_array, keypoints[indices], camera_matrix)
+            angles[indices] = pose.euler_angles(rotations)
+        return [plugin_result.PoseDTO(pitch=np.sign(x) * 180 - x, yaw=y, roll=np.sign(z) * 180 - z)
+                for x, y, z in angles]
@@ -0,0 +1,103 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+from typing import List
+
+import numpy as np
+
+from src.constants import ENV
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.facescan.imgscaler.imgscaler import ImgScaler
+from src.services.facescan.plugins import mixins
+from src.services.imgtools.proc_img import crop_img, squish_img
+from src.services.imgtools.types import Array3D
+from src._endpoints import FaceDetection
+
+logger = logging.getLogger(__name__)
+
+
+class MTCNNDetectorMixin(mixins.FaceDetectorMixin):
+    """ Boxes and alignment of MTCNN detections, subclasses provide `_face_detection_net` (an MTCNN instance) """
+    FACE_MIN_SIZE = 20
+    SCALE_FACTOR = 0.709
+    IMAGE_SIZE = 160
+    IMG_LENGTH_LIMIT = ENV.IMG_LENGTH_LIMIT
+    KEYPOINTS_ORDER = ['left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right']
+
+    # detection settings
+    det_prob_threshold = 0.85
+    det_threshold_a = 0.9436513301
+    det_threshold_b = 0.7059968943
+    det_threshold_c = 0.5506904359
+
+    # face alignment settings (were calculated for current detector)
+    left_margin = 0.2125984251968504
+    right_margin = 0.2230769230769231
+    top_margin = 0.10526315789473684
+    bottom_margin = 0.09868421052631579
+
+    def crop_face(self, img: Array3D, box: BoundingBoxDTO) -> Array3D:
+        return squish_img(crop_img(img, box), (self.IMAGE_SIZE, self.IMAGE_SIZE))
+
+    def find_faces(self, img: Array3D, det_prob_threshold: float = None) -> List[BoundingBoxDTO]:
+        if det_prob_threshold is None:
+            det_prob_threshold = self.det_prob_threshold
+        assert 0 <= det_prob_threshold <= 1
+        scaler = ImgScaler(self.IMG_LENGTH_LIMIT)
+        img = scaler.downscale_img(img)
+
+        if FaceDetection.SKIPPING_FACE_DETECTION:
+            bounding_boxes = []
+            bounding_boxes.append({
+                'box': [0, 0, img.shape[0], img.shape[1]],
+                'confidence': 1.0,
+                'keypoints': {
+                    'left_eye': (),
+                    'right_eye': (),
+                    'nose': (),
+                    'mouth_left': (),
+                    'mouth_right': (),
+                }
+            })
+            det_prob_threshold = self.det_prob_threshold
+            detect_face_result = bounding_boxes
+        else:
+            fdn = self._face_detection_net
+            detect_face_result = fdn.detect_faces(img)
+
+        img_size = np.asarray(img.shape)[0:2]
+        bounding_boxes = []
+
+        for face in detect_face_result:
+            x, y, w, h = face['box']
+            box = BoundingBoxDTO(
+                x_min=int(np.maximum(x - (self.left_margin * w), 0)),
+                y_min=int(np.maximum(y - (self.top_margin * h), 0)),
+                x_max=int(np.minimum(x + w + (self.right_margin * w), img_size[1])),
+                y_max=int(np.minimum(y + h + (self.bottom_margin * h), img_size[0])),
+                np_landmarks=np.array([list(face['keypoints'][point_name]) for point_name in self.KEYPOINTS_ORDER]),
+                probability=face['confidence']
+            )
+            logger.debug(f"Found: {box}")
+            bounding_boxes.append(box)
+
+        filtered_bounding_boxes = []
+        for box in bounding_boxes:
+            box = box.scaled(scaler.upscale_coefficient)
+            if box.probability <= det_prob_threshold:
+                logger.debug(f'Box filtered out because below threshold ({det_prob_threshold}): {box}')
+                continue
+            filtered_bounding_boxes.append(box)
+        return filtered_bounding_boxes
@@ -0,0 +1,182 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+from typing import List, Tuple
+
+import numpy as np
+import cv2
+import onnxruntime as ort
+from cached_property import cached_property
+
+import sys
+sys.path.append('srcext')
+from mtcnn import MTCNN
+
+from src.constants import ENV
+from src.services.dto import plugin_result
+from src.services.facescan.plugins import base, exceptions, mixins
+from src.services.facescan.plugins.mtcnn_detector import MTCNNDetectorMixin
+from src.services.imgtools import preprocessing
+from src.services.imgtools.types import Array3D
+from src.services.utils.buffer_pool import buffer_pool
+from src.services.utils.cpu_threads import init_threads
+
+logger = logging.getLogger(__name__)
+MODEL_FILE = 'model.onnx'
+MTCNN_NETS = ('pnet', 'rnet', 'onet')
+
+
+def _session_options() -> ort.SessionOptions:
+    options = ort.SessionOptions()
+    threads = init_threads()
+    options.intra_op_num_threads = threads.intra_op
+    options.inter_op_num_threads = threads.inter_op
+    if threads.inter_op > 1:
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+class OnnxNet:
+    """ Callable with the same inputs and outputs as the original network """
+
+    def __init__(self, session: ort.InferenceSession):
+        self._session = session
+        self._input_name = session.get_inputs()[0].name
+
+    def __call__(self, data: np.ndarray) -> List[np.ndarray]:
+        return self._session.run(None, {self._input_name: np.asarray(data, dtype=np.float32)})
+
+
+class OnnxMixin:
+    """ Models are converted from the original backends by tools/convert_onnx """
+
+    def _create_net(self, file_name: str = MODEL_FILE) -> OnnxNet:
+        model_file = self.ml_model.path / file_name
+        if not model_file.exists():
+            raise exceptions.ModelImportException(
+                f'Model {model_file} does not exist, run `python -m tools.convert_onnx`')
+        providers = ['CPUExecutionProvider']
+        if ENV.GPU_IDX > -1:
+            providers.insert(0, ('CUDAExecutionProvider', {'device_id': ENV.GPU_IDX}))
+        return OnnxNet(ort.InferenceSession(str(model_file), sess_options=_session_options(), providers=providers))
+
+    @cached_property
+    def _net(self) -> OnnxNet:
+        return self._create_net()
+
+
+class FaceDetector(OnnxMixin, MTCNNDetectorMixin, base.BasePlugin):
+    ml_models = (
+        ('mtcnn', None),
+    )
+
+    @cached_property
+    def _face_detection_net(self):
+        return MTCNN(
+            min_face_size=self.FACE_MIN_SIZE,
+            scale_factor=self.SCALE_FACTOR,
+            steps_threshold=[self.det_threshold_a, self.det_threshold_b, self.det_threshold_c],
+            buffer_pool=buffer_pool,
+            nets=tuple(self._create_net(f'{net}.onnx') for net in MTCNN_NETS)
+        )
+
+
+class Calculator(OnnxMixin, mixins.CalculatorMixin, base.BasePlugin):
+    # the same models as facenet.Calculator and insightface.Calculator
+    ml_models = (
+        ('20180402-114759', None, (1.1817961, 5.291995557), 0.4),
+        ('20180408-102900', None, (1.1362496, 5.803152427), 0.4),
+        ('inception_resnetv1_casia_masked', None, (1.1145709, 4.554903071), 0.6),
+        ('arcface_mobilefacenet', None, (1.26538905, 5.552089201), 200),
+        ('arcface_r100_v1', None, (1.23132175, 6.602259425), 400),
+        ('arcface_resnet34', None, (1.2462842, 5.981636853), 400),
+        ('arcface_resnet50', None, (1.2375747, 5.973354538), 400),
+        ('arcface-r50-msfdrop75', None, (1.2350148, 7.071431642), 400),
+        ('arcface-r100-msfdrop75', None, (1.224676, 6.322647217), 400),
+        ('arcface_mobilefacenet_casia_masked', None, (1.22507105, 7.321198934), 200),
+    )
+
+    @property
+    def is_insightface_model(self) -> bool:
+        """ insightface models expect aligned 112x112 crops of insightface.FaceDetector """
+        return self.ml_model.name.startswith('arcface')
+
+    def calc_embedding(self, face_img: Array3D) -> Array3D:
+        if self.is_insightface_model:
+            # the same input as in insightface FaceRecognition.get_embedding: swapped color channels, NCHW
+            data = np.expand_dims(np.transpose(face_img[:, :, ::-1], (2, 0, 1)), 0)
+        else:
+            data = preprocessing.normalize([face_img], preprocessing.PREWHITEN)
+        return self._net(data)[0][0]
+
+    def __call__(self, face: plugin_result.FaceDTO) -> plugin_result.EmbeddingDTO:
+        if self.is_insightface_model:
+            return super().__call__(face)
+        data = preprocessing.normalized_faces([face], preprocessing.PREWHITEN)
+        return plugin_result.EmbeddingDTO(embedding=self._net(data)[0][0])
+
+
+class BaseAgeGender(OnnxMixin, base.BasePlugin):
+    """ The same models as agegender plugins """
+    LABELS: Tuple
+    CACHE_BY_FACE_IMG = True
+
+    def _get_value(self, face: plugin_result.FaceDTO):
+        output = self._net(preprocessing.normalized_faces([face], preprocessing.PREWHITEN))[0][0]
+        best_i = int(np.argmax(output))
+        return self.LABELS[best_i], output[best_i]
+
+
+class AgeDetector(BaseAgeGender):
+    slug = 'age'
+    LABELS = ((0, 2), (4, 6), (8, 12), (15, 20), (25, 32), (38, 43), (48, 53), (60, 100))
+    ml_models = (
+        ('22801', None),
+    )
+
+    def __call__(self, face: plugin_result.FaceDTO):
+        value, probability = self._get_value(face)
+        return plugin_result.AgeDTO(age=value, age_probability=probability)
+
+
+class GenderDetector(BaseAgeGender):
+    slug = 'gender'
+    LABELS = ('male', 'female')
+    ml_models = (
+        ('21936', None),
+    )
+
+    def __call__(self, face: plugin_result.FaceDTO):
+        value, probability = self._get_value(face)
+        return plugin_result.GenderDTO(gender=value, gender_probability=probability)
+
+
+class MaskDetector(OnnxMixin, base.BasePlugin):
+    """ The same model as facenet.facemask.MaskDetector """
+    slug = 'mask'
+    CACHE_BY_FACE_IMG = True
+    LABELS = ('without_mask', 'with_mask', 'mask_weared_incorrect')
+    ml_models = (
+        ('inception_v3_on_mafa_kaggle123', None),
+    )
+    INPUT_IMAGE_SIZE = 100
+
+    def __call__(self, face: plugin_result.FaceDTO):
+        img = cv2.resize(face._face_img, dsize=(self.INPUT_IMAGE_SIZE, self.INPUT_IMAGE_SIZE),
+                         interpolation=cv2.INTER_CUBIC)
+        scores = self._net(np.expand_dims(img, 0))[0][0]
+        best_i = int(np.argmax(scores))
+        return plugin_result.MaskDTO(mask=self.LABELS[best_i], mask_probability=scores[best_i])
@@ -0,0 +1,107 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import numpy as np
+import pytest
+
+from sample_images import IMG_DIR
+from sample_images.annotations import SAMPLE_IMAGES
+from src.services.facescan.plugins.managers import ML_MODEL_SEPARATOR, create_plugin
+from src.services.facescan.scanner.test._cache import read_img
+
+IMG_NAMES = [row.img_name for row in SAMPLE_IMAGES if row.noses][:6]
+FACE_PLUGINS = [
+    ('facenet.Calculator', 'onnx.Calculator'),
+    ('agegender.AgeDetector', 'onnx.AgeDetector'),
+    ('agegender.GenderDetector', 'onnx.GenderDetector'),
+    ('facenet.facemask.MaskDetector', 'onnx.MaskDetector'),
+    ('insightface.Calculator@arcface_mobilefacenet', 'onnx.Calculator@arcface_mobilefacenet'),
+]
+
+
+def _create_plugin(monkeypatch, plugin_name):
+    """
+    Plugins are singletons that keep the model of their first construction: the plugin is created anew for the
+    requested model, and the singleton is restored after the test
+    """
+    monkeypatch.delattr(type(create_plugin(plugin_name)), 'instance')
+    plugin = create_plugin(plugin_name)
+    if ML_MODEL_SEPARATOR in plugin_name:
+        assert plugin.ml_model.name == plugin_name.split(ML_MODEL_SEPARATOR)[1]
+    return plugin
+
+
+def _create_onnx_plugin(monkeypatch, plugin_name):
+    plugin = _create_plugin(monkeypatch, plugin_name)
+    if not plugin.ml_model.exists():
+        pytest.skip(f'{plugin} model is not converted, run `python -m tools.convert_onnx`')
+    return plugin
+
+
+def _create_source_plugin(monkeypatch, plugin_name):
+    if plugin_name.startswith('insightface.'):
+        pytest.importorskip('mxnet')
+    plugin = _create_plugin(monkeypatch, plugin_name)
+    if plugin.ml_model and not plugin.ml_model.exists():
+        pytest.skip(f'{plugin} model is not downloaded')
+    return plugin
+
+
+@pytest.fixture(scope='module')
+def detect_faces():
+    """ Faces of the sample images by detector name, insightface calculators expect aligned insightface crops """
+    faces = {}
+
+    def detect(detector_name):
+        if detector_name not in faces:
+            detector = create_plugin(detector_name)
+            faces[detector_name] = [face for img_name in IMG_NAMES
+                                    for face in detector(read_img(IMG_DIR / img_name))]
+        return faces[detector_name]
+
+    return detect
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('img_name', IMG_NAMES)
+def test__given_image__when_detected_by_onnx_detector__then_returns_same_boxes(monkeypatch, img_name):
+    onnx_detector = _create_onnx_plugin(monkeypatch, 'onnx.FaceDetector')
+    detector = create_plugin('facenet.FaceDetector')
+    img = read_img(IMG_DIR / img_name)
+
+    boxes = detector.find_faces(img)
+    onnx_boxes = onnx_detector.find_faces(img)
+
+    assert len(onnx_boxes) == len(boxes)
+    for box, onnx_box in zip(boxes, onnx_boxes):
+        assert np.abs(np.array(box.xy) - np.array(onnx_box.xy)).max() <= 1
+        assert onnx_box.probability == pytest.approx(box.probability, abs=1e-4)
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize('plugin_name, onnx_plugin_name', FACE_PLUGINS)
+def test__given_faces__when_processed_by_onnx_plugin__then_returns_same_results(monkeypatch, detect_faces,
+                                                                                 plugin_name, onnx_plugin_name):
+    onnx_plugin = _create_onnx_plugin(monkeypatch, onnx_plugin_name)
+    plugin = _create_source_plugin(monkeypatch, plugin_name)
+    detector_name = 'insightface.FaceDetector' if plugin.backend == 'insightface' else 'facenet.FaceDetector'
+
+    for face in detect_faces(detector_name):
+        expected, actual = plugin(face).to_json(), onnx_plugin(face).to_json()
+        if 'embedding' in expected:
+            assert np.allclose(actual['embedding'], expected['embedding'], atol=1e-4)
+            continue
+        expected_value, actual_value = expected[plugin.slug], actual[plugin.slug]
+        assert actual_value.pop('probability') == pytest.approx(expected_value.pop('probability'), abs=1e-3)
+        assert actual_value == expected_value
@@ -0,0 +1,212 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+"""
+Head pose of all faces of an image at once: perspective-n-point solved with batched Levenberg-Marquardt,
+initialized and minimizing the reprojection error the same way as `cv2.solvePnP` does face by face.
+"""
+
+import functools
+
+import cv2
+import numpy as np
+
+# `cv2.solvePnP` face by face is faster for a few faces
+BATCH_SOLVER_MIN_FACES = 32
+NO_DISTORTION = np.zeros((4, 1), dtype=np.float64)
+LM_ITERATIONS = 100
+LM_INITIAL_DAMPING = 1e-3
+MAX_DAMPING = 1e16
+STEP_EPSILON = np.finfo(np.float32).eps
+COST_EPSILON = 1e-10
+
+
+def camera_matrix(focal_length: float, optical_center) -> np.ndarray:
+    return np.array([[focal_length, 1, optical_center[0]],
+                     [0, focal_length, optical_center[1]],
+                     [0, 0, 1]], dtype=np.float64)
+
+
+@functools.lru_cache(maxsize=32)
+def camera_matrix_for_image(image_height: int, image_width: int, focal_coef: float) -> np.ndarray:
+    """ Shared by all faces of images of the same size, the optical center is (height / 2, width / 2) """
+    matrix = camera_matrix(focal_coef * image_width, (image_height / 2, image_width / 2))
+    matrix.flags.writeable = False
+    return matrix
+
+
+def rodrigues(rvecs: np.ndarray) -> np.ndarray:
+    """
+    Rotation matrices of rotation vectors, (N, 3) -> (N, 3, 3).
+    >>> np.round(rodrigues(np.array([[0, 0, np.pi / 2]])), 6).tolist()
+    [[[0.0, -1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]]
+    """
+    theta = np.linalg.norm(rvecs, axis=1)[:, None, None]
+    axis = rvecs / np.where(theta[:, :, 0] > 0, theta[:, :, 0], 1)
+    cross = np.zeros((len(rvecs), 3, 3))
+    cross[:, 0, 1], cross[:, 0, 2], cross[:, 1, 2] = -axis[:, 2], axis[:, 1], -axis[:, 0]
+    cross -= cross.transpose(0, 2, 1)
+    outer = axis[:, :, None] * axis[:, None, :]
+    return np.cos(theta) * np.eye(3) + (1 - np.cos(theta)) * outer + np.sin(theta) * cross
+
+
+def project(rotations: np.ndarray, translations: np.ndarray, points_3d: np.ndarray,
+            camera: np.ndarray) -> np.ndarray:
+    """ Image points of the model in N poses, (N, 3, 3), (N, 3), (P, 3) -> (N, P, 2) """
+    return _project(_to_camera(rotations, translations, points_3d), camera)
+
+
+def _to_camera(rotations, translations, points_3d):
+    return np.einsum('nij,pj->npi', rotations, points_3d) + translations[:, None, :]
+
+
+def _project(in_camera, camera):
+    # the skew of the camera matrix is ignored, as `cv2.projectPoints` does
+    focal, center = camera[[0, 1], [0, 1]], camera[:2, 2]
+    return in_camera[..., :2] / in_camera[..., 2:] * focal + center
+
+
+def _dlt_poses(points_3d: np.ndarray, points_2d: np.ndarray, camera: np.ndarray):
+    """ Initial poses of non-planar model points by direct linear transform, as in `cv2.solvePnP` """
+    focal, center = camera[[0, 1], [0, 1]], camera[:2, 2]
+    normalized = (points_2d - center) / focal
+    count, point_count = normalized.shape[:2]
+    homogeneous = np.concatenate([points_3d, np.ones((point_count, 1))], axis=1)
+    equations = np.zeros((count, point_count, 2, 12))
+    equations[:, :, 0, :4] = equations[:, :, 1, 4:8] = homogeneous
+    equations[:, :, 0, 8:] = -normalized[..., 0:1] * homogeneous
+    equations[:, :, 1, 8:] = -normalized[..., 1:2] * homogeneous
+    equations = equations.reshape(count, -1, 12)
+    _, _, vt = np.linalg.svd(equations.transpose(0, 2, 1) @ equations)
+    projections = vt[:, -1].reshape(count, 3, 4)
+    projections[np.linalg.det(projections[:, :, :3]) < 0] *= -1
+
+    scale = np.linalg.norm(projections[:, :, :3], axis=(1, 2))
+    u, _, vt = np.linalg.svd(projections[:, :, :3])
+    rotations = u @ vt
+    translations = projections[:, :, 3] * (np.sqrt(3) / scale)[:, None]
+    return rotations, translations
+
+
+def _residuals_and_jacobians(rotations, translations, points_3d, points_2d, camera):
+    """
+    Reprojection errors (N, 2P) and their derivatives (N, 2P, 6)
+    by a rotation increment `R @ rodrigues(w)` and by the translation
+    """
+    focal = camera[[0, 1], [0, 1]]
+    in_camera = _to_camera(rotations, translations, points_3d)
+    residuals = _project(in_camera, camera) - points_2d
+    inv_depth = 1 / in_camera[..., 2]
+    # d(projection)/d(point in camera), (N, P, 2, 3)
+    d_projection = np.zeros(in_camera.shape[:2] + (2, 3))
+    d_projection[..., 0, 0] = focal[0] * inv_depth
+    d_projection[..., 1, 1] = focal[1] * inv_depth
+    d_projection[..., :, 2] = -focal * in_camera[..., :2] * inv_depth[..., None] ** 2
+    # d(R @ (I + [w]x) @ X)/dw = -R @ [X]x
+    skew = np.zeros((len(points_3d), 3, 3))
+    skew[:, 0, 1], skew[:, 0, 2], skew[:, 1, 2] = -points_3d[:, 2], points_3d[:, 1], -points_3d[:, 0]
+    skew -= skew.transpose(0, 2, 1)
+    d_rotation = -np.einsum('nij,pjk->npik', rotations, skew)
+    jacobians = np.concatenate([d_projection @ d_rotation, d_projection], axis=3)
+    count = len(rotations)
+    return residuals.reshape(count, -1), jacobians.reshape(count, -1, 6)
+
+
+def solve_pnp(points_3d: np.ndarray, points_2d: np.ndarray, camera: np.ndarray):
+    """
+    Poses of the model points seen at the image points of N faces, minimizing the reprojection error.
+    (P, 3), (N, P, 2), (3, 3) -> rotation matrices (N, 3, 3), translations (N, 3)
+    """
+    points_2d = np.asarray(points_2d, dtype=np.float64)
+    rotations, translations = _dlt_poses(points_3d, points_2d, camera)
+    residuals, jacobians = _residuals_and_jacobians(rotations, translations, points_3d, points_2d, camera)
+    costs = (residuals ** 2).sum(axis=1)
+    damping = np.full(len(rotations), LM_INITIAL_DAMPING)
+    active = np.ones(len(rotations), dtype=bool)
+
+    for _ in range(LM_ITERATIONS):
+        normal = jacobians.transpose(0, 2, 1) @ jacobians
+        gradient = np.einsum('nij,ni->nj', jacobians, residuals)
+        diagonal = np.eye(6) * normal.diagonal(axis1=1, axis2=2)[:, None, :]
+        step = np.linalg.solve(normal + damping[:, None, None] * diagonal, -gradient[..., None])[..., 0]
+        new_rotations = rotations @ rodrigues(step[:, :3])
+        new_translations = translations + step[:, 3:]
+        new_residuals, new_jacobians = _residuals_and_jacobians(
+            new_rotations, new_translations, points_3d, points_2d, camera)
+        new_costs = (new_residuals ** 2).sum(axis=1)
+
+        improved = active & (new_costs < costs)
+        converged = improved & ((np.linalg.norm(step, axis=1) <= STEP_EPSILON * np.linalg.norm(translations, axis=1))
+                                | (costs - new_costs <= COST_EPSILON * costs))
+        rotations[improved], translations[improved] = new_rotations[improved], new_translations[improved]
+        residuals[improved], jacobians[improved] = new_residuals[improved], new_jacobians[improved]
+        costs[improved] = new_costs[improved]
+        damping = np.where(improved, damping / 10, damping * 10)
+        active &= ~converged & (damping < MAX_DAMPING)
+        if not active.any():
+            break
+    return rotations, translations
+
+
+def solve_rotations(points_3d: np.ndarray, points_2d: np.ndarray, camera: np.ndarray) -> np.ndarray:
+    """ Rotation matrices (N, 3, 3) of the model points seen at the image points (N, P, 2) """
+    if len(points_2d) >= BATCH_SOLVER_MIN_FACES:
+        return solve_pnp(points_3d, points_2d, camera)[0]
+    return np.array([cv2.Rodrigues(cv2.solvePnP(points_3d, face_points, camera, NO_DISTORTION)[1])[0]
+                     for face_points in points_2d]).reshape(-1, 3, 3)
+
+
+def _givens(cos: np.ndarray, sin: np.ndarray):
+    norm = 1 / np.sqrt(cos ** 2 + sin ** 2 + np.finfo(np.float64).eps)
+    return cos * norm, sin * norm
+
+
+def _rotation(count: int, axis: int, cos: np.ndarray, sin: np.ndarray) -> np.ndarray:
+    """ Givens rotations as in `cv2.RQDecomp3x3`, `sin` is above the diagonal except for the y axis """
+    i, j = [k for k in range(3) if k != axis]
+    rotation = np.zeros((count, 3, 3))
+    rotation[:, axis, axis] = 1
+    rotation[:, i, i], rotation[:, j, j], rotation[:, i, j], rotation[:, j, i] = cos, cos, sin, -sin
+    return rotation
+
+
+def euler_angles(rotations: np.ndarray) -> np.ndarray:
+    """
+    Angles in degrees around x, y and z axes, (N, 3, 3) -> (N, 3), computed the same way as `cv2.RQDecomp3x3`.
+    >>> np.round(euler_angles(rodrigues(np.array([[0.1, 0.2, 0.3]]))), 3).tolist()
+    [[7.439, 10.401, 17.938]]
+    """
+    count = len(rotations)
+    cos_x, sin_x = _givens(rotations[:, 2, 2], rotations[:, 2, 1])
+    r = rotations @ _rotation(count, 0, cos_x, sin_x)
+    cos_y, sin_y = _givens(r[:, 2, 2], -r[:, 2, 0])
+    m = r @ _rotation(count, 1, cos_y, -sin_y)
+    cos_z, sin_z = _givens(m[:, 1, 1], m[:, 1, 0])
+    r = m @ _rotation(count, 2, cos_z, sin_z)
+
+    # diagonal entries of the upper triangular matrix, except the last one, have to be positive,
+    # so it is rotated by 180 degrees around z, y or x axis and the Givens rotations are flipped
+    flip_z = (r[:, 0, 0] < 0) & (r[:, 1, 1] < 0)
+    flip_y = (r[:, 0, 0] < 0) & (r[:, 1, 1] >= 0)
+    flip_x = (r[:, 0, 0] >= 0) & (r[:, 1, 1] < 0)
+    cos_z = np.where(flip_z, -cos_z, cos_z)
+    sin_z = np.where(flip_z | flip_y | flip_x, -sin_z, sin_z)
+    cos_y = np.where(flip_y, -cos_y, cos_y)
+    sin_y = np.where(flip_y | flip_x, -sin_y, sin_y)
+    cos_x, sin_x = np.where(flip_x, -cos_x, cos_x), np.where(flip_x, -sin_x, sin_x)
+
+    def angle(cos, sin):
+        return np.degrees(np.arccos(np.clip(cos, -1, 1))) * np.where(sin >= 0, 1, -1)
+
+    return np.stack([angle(cos_x, sin_x), angle(cos_y, sin_y), angle(cos_z, sin_z)], axis=1)
@@ -0,0 +1,41 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from typing import Tuple
+
+FLOAT32 = 'float32'
+FLOAT16 = 'float16'
+INT8 = 'int8'
+PRECISIONS = (FLOAT32, FLOAT16, INT8)
+PRECISION_SEPARATOR = ':'
+
+
+def split_precision(plugin_name: str) -> Tuple[str, str]:
+    """
+    Splits an optional precision suffix from a plugin name.
+    >>> split_precision('insightface.Calculator@arcface_mobilefacenet:int8')
+    ('insightface.Calculator@arcface_mobilefacenet', 'int8')
+    >>> split_precision('facenet.Calculator')
+    ('facenet.Calculator', 'float32')
+    >>> split_precision('facenet.Calculator:int4')
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown precision 'int4', has to be one of ('float32', 'float16', 'int8')
+    """
+    if PRECISION_SEPARATOR not in plugin_name:
+        return plugin_name, FLOAT32
+    plugin_name, precision = plugin_name.rsplit(PRECISION_SEPARATOR, 1)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', has to be one of {PRECISIONS}")
+    return plugin_name, precision
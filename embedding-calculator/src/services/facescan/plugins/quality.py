@@ -0,0 +1,119 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+"""
+Cheap face quality scores of all faces of an image at once, to skip expensive plugins on unusable faces.
+Every score is in [0, 1], the face score is the worst of them.
+"""
+
+from typing import List
+
+import attr
+import cv2
+import numpy as np
+
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.imgtools.types import Array3D
+
+CROP_SIZE = 64
+GREY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+# shorter side of the detected box, in pixels of the original image
+GOOD_FACE_SIZE = 64
+# Laplacian variance of a grey [0, 1] crop that scores 0.5, sharp faces have 0.005 - 0.02
+HALF_SHARPNESS = 0.003
+# horizontal offset of the nose from the middle of the eyes, relative to the eye distance
+MAX_YAW_OFFSET = 0.6
+# vertical position of the nose between the eyes (0) and the mouth (1)
+FRONTAL_PITCH_POSITION = 0.55
+MAX_PITCH_OFFSET = 0.45
+MAX_BRIGHTNESS_OFFSET = 0.4
+GOOD_CONTRAST = 0.1
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class FaceQuality:
+    score: np.ndarray
+    size: np.ndarray
+    sharpness: np.ndarray
+    pose: np.ndarray
+    illumination: np.ndarray
+
+
+def grey_crops(face_imgs: List[Array3D]) -> np.ndarray:
+    """ (N, CROP_SIZE, CROP_SIZE) float32 crops in [0, 1], for [0, 1] float and [0, 255] crops """
+    crops = np.empty((len(face_imgs), CROP_SIZE, CROP_SIZE), dtype=np.float32)
+    for i, face_img in enumerate(face_imgs):
+        grey = face_img.astype(np.float32) @ GREY_WEIGHTS
+        if face_img.dtype == np.uint8 or grey.max() > 1:
+            grey /= 255
+        crops[i] = cv2.resize(grey, (CROP_SIZE, CROP_SIZE), interpolation=cv2.INTER_AREA)
+    return crops
+
+
+def size_scores(boxes: List[BoundingBoxDTO]) -> np.ndarray:
+    """
+    >>> size_scores([BoundingBoxDTO(0, 0, 32, 40, 1), BoundingBoxDTO(0, 0, 100, 100, 1)]).tolist()
+    [0.5, 1.0]
+    """
+    sizes = np.array([min(box.width, box.height) for box in boxes], dtype=np.float32)
+    return np.clip(sizes / GOOD_FACE_SIZE, 0, 1)
+
+
+def sharpness_scores(crops: np.ndarray) -> np.ndarray:
+    """ Variance of the Laplacian, blurred crops have little high-frequency detail """
+    laplacian = (crops[:, :-2, 1:-1] + crops[:, 2:, 1:-1] + crops[:, 1:-1, :-2] + crops[:, 1:-1, 2:]
+                 - 4 * crops[:, 1:-1, 1:-1])
+    variance = laplacian.reshape(len(crops), -1).var(axis=1)
+    return variance / (variance + HALF_SHARPNESS)
+
+
+def pose_scores(boxes: List[BoundingBoxDTO]) -> np.ndarray:
+    """
+    How frontal faces are by their 5-point landmarks (eyes, nose, mouth corners), 1 without 5 (x, y) landmarks.
+    >>> frontal = BoundingBoxDTO(0, 0, 100, 100, 1,
+    ...                          np_landmarks=np.array([[30, 40], [70, 40], [50, 62], [35, 80], [65, 80]]))
+    >>> turned = BoundingBoxDTO(0, 0, 100, 100, 1,
+    ...                         np_landmarks=np.array([[30, 40], [70, 40], [68, 62], [35, 80], [65, 80]]))
+    >>> np.round(pose_scores([frontal, turned, BoundingBoxDTO(0, 0, 100, 100, 1)]), 2).tolist()
+    [1.0, 0.25, 1.0]
+    """
+    scores = np.ones(len(boxes), dtype=np.float32)
+    # faces not re-detected (detect_faces=false) have 5 empty landmarks
+    idx = [i for i, box in enumerate(boxes) if np.asarray(box.landmarks).shape == (5, 2)]
+    if not idx:
+        return scores
+    landmarks = np.array([boxes[i].landmarks for i in idx], dtype=np.float32)
+    left_eye, right_eye, nose, mouth_left, mouth_right = landmarks.transpose(1, 0, 2)
+    eyes, mouth = (left_eye + right_eye) / 2, (mouth_left + mouth_right) / 2
+    eye_distance = np.maximum(np.linalg.norm(right_eye - left_eye, axis=1), 1)
+    yaw_offset = np.abs(nose[:, 0] - eyes[:, 0]) / eye_distance
+    pitch_position = (nose[:, 1] - eyes[:, 1]) / np.maximum(mouth[:, 1] - eyes[:, 1], 1)
+    yaw_score = 1 - yaw_offset / MAX_YAW_OFFSET
+    pitch_score = 1 - np.abs(pitch_position - FRONTAL_PITCH_POSITION) / MAX_PITCH_OFFSET
+    scores[idx] = np.clip(np.minimum(yaw_score, pitch_score), 0, 1)
+    return scores
+
+
+def illumination_scores(crops: np.ndarray) -> np.ndarray:
+    """ Too dark, too bright or flat crops score low """
+    brightness = 1 - np.abs(crops.mean(axis=(1, 2)) - 0.5) / MAX_BRIGHTNESS_OFFSET
+    contrast = crops.std(axis=(1, 2)) / GOOD_CONTRAST
+    return np.clip(np.minimum(brightness, contrast), 0, 1)
+
+
+def face_quality(face_imgs: List[Array3D], boxes: List[BoundingBoxDTO]) -> FaceQuality:
+    crops = grey_crops(face_imgs)
+    scores = dict(size=size_scores(boxes), sharpness=sharpness_scores(crops),
+                  pose=pose_scores(boxes), illumination=illumination_scores(crops))
+    return FaceQuality(score=np.min(list(scores.values()), axis=0), **scores)
@@ -0,0 +1,78 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import numpy as np
+import pytest
+
+from src.services.dto import plugin_result
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.facescan.plugins import base, mixins
+from src.services.facescan.plugins.face_cache import face_plugin_cache
+
+
+class FakeDetector(mixins.FaceDetectorMixin, base.BasePlugin):
+    def find_faces(self, img, det_prob_threshold=None):
+        return [BoundingBoxDTO(x_min=0, y_min=0, x_max=2, y_max=2, probability=1)]
+
+    def crop_face(self, img, box):
+        return img[box.y_min:box.y_max, box.x_min:box.x_max]
+
+
+class FakeCalculator(mixins.CalculatorMixin, base.BasePlugin):
+    calls = 0
+
+    def calc_embedding(self, face_img):
+        FakeCalculator.calls += 1
+        return face_img.flatten().astype(float)
+
+
+class FakePoseEstimator(base.BasePlugin):
+    slug = 'pose'
+    calls = 0
+
+    def __call__(self, face):
+        FakePoseEstimator.calls += 1
+        return plugin_result.PoseDTO(pitch=0, yaw=0, roll=0)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    face_plugin_cache.clear()
+    FakeCalculator.calls = FakePoseEstimator.calls = 0
+    yield
+    face_plugin_cache.clear()
+
+
+def test__given_same_face_crop__when_detecting_again__then_crop_plugins_are_not_recalculated():
+    img = np.random.RandomState(0).randint(0, 255, size=(4, 4, 3), dtype=np.uint8)
+    other_img = img.copy()
+    other_img[3, 3] += 1  # outside of the face box
+
+    first, = FakeDetector()(img, face_plugins=[FakeCalculator(), FakePoseEstimator()])
+    second, = FakeDetector()(other_img, face_plugins=[FakeCalculator(), FakePoseEstimator()])
+
+    assert FakeCalculator.calls == 1
+    assert FakePoseEstimator.calls == 2
+    assert np.array_equal(first.embedding, second.embedding)
+
+
+def test__given_different_face_crop__when_detecting__then_plugins_are_recalculated():
+    img = np.zeros((4, 4, 3), dtype=np.uint8)
+    FakeDetector()(img, face_plugins=[FakeCalculator()])
+    img[0, 0] = 1
+
+    face, = FakeDetector()(img, face_plugins=[FakeCalculator()])
+
+    assert FakeCalculator.calls == 2
+    assert face.embedding[0] == 1
@@ -0,0 +1,122 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import numpy as np
+
+from src.services.dto import plugin_result
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.facescan.plugins import base, mixins
+
+IMG = np.zeros((10, 10, 3), dtype=np.uint8)
+
+
+class FakeDetector(mixins.FaceDetectorMixin, base.BasePlugin):
+    def find_faces(self, img, det_prob_threshold=None):
+        return [BoundingBoxDTO(x_min=0, y_min=0, x_max=size, y_max=size, probability=1) for size in (2, 6, 4)]
+
+    def crop_face(self, img, box):
+        return img[box.y_min:box.y_max, box.x_min:box.x_max]
+
+
+class FakePlugin(base.BasePlugin):
+    slug = 'pose'
+    processed = []
+
+    def __call__(self, face):
+        return self.process_faces([face])[0]
+
+    def process_faces(self, faces):
+        FakePlugin.processed.append([face.box.width for face in faces])
+        return [plugin_result.PoseDTO(pitch=0, yaw=0, roll=0) for _ in faces]
+
+
+class FakePoseEstimator(base.BasePlugin):
+    slug = 'pose'
+    RUNS_ON_LOW_QUALITY_FACES = True
+
+    def __call__(self, face):
+        return FakePlugin.__call__(self, face)
+
+    def process_faces(self, faces):
+        return FakePlugin.process_faces(self, faces)
+
+
+def setup_function():
+    FakePlugin.processed = []
+
+
+def test__given_limit__when_detecting__then_plugins_run_only_on_largest_faces():
+    faces = FakeDetector()(IMG, face_plugins=[FakePlugin()], limit=2)
+
+    assert [face.box.width for face in faces] == [6, 4]
+    assert FakePlugin.processed == [[6, 4]]
+
+
+def test__given_faces__when_iterating__then_each_face_is_processed_before_the_next_is_yielded():
+    faces = FakeDetector().iter_faces(IMG, face_plugins=[FakePlugin()])
+
+    first = next(faces)
+
+    assert first.box.width == 6 and first._plugins_dto
+    assert FakePlugin.processed == [[6]]
+    assert [face.box.width for face in faces] == [4, 2]
+    assert FakePlugin.processed == [[6], [4], [2]]
+
+
+def test__given_max_faces__when_detecting_with_larger_limit__then_max_faces_wins(monkeypatch):
+    monkeypatch.setattr(FakeDetector, 'MAX_FACES', 1)
+
+    faces = FakeDetector()(IMG, face_plugins=[FakePlugin()], limit=2)
+
+    assert [face.box.width for face in faces] == [6]
+    assert FakePlugin.processed == [[6]]
+
+
+class MovingFaceDetector(mixins.FaceDetectorMixin, base.BasePlugin):
+    def find_faces(self, img, det_prob_threshold=None):
+        shift = int(img[0, 0, 0])
+        return [BoundingBoxDTO(x_min=shift, y_min=0, x_max=shift + 4 + shift % 2, y_max=4 + shift % 2, probability=1)]
+
+    def crop_face(self, img, box):
+        return img[box.y_min:box.y_max, box.x_min:box.x_max]
+
+
+def test__given_frames_of_moving_face__when_tracking__then_plugins_run_once_on_best_frame():
+    frames = [np.full((10, 10, 3), shift, dtype=np.uint8) for shift in (0, 1, 2)]
+
+    track, = MovingFaceDetector().track_faces(frames, face_plugins=[FakePlugin()])
+
+    assert (track.frames, track.best_frame) == ([0, 1, 2], 1)
+    assert FakePlugin.processed == [[5]]
+    assert track.to_json()['pose'] == {'pitch': 0, 'yaw': 0, 'roll': 0}
+
+
+class FakeCalculator(mixins.CalculatorMixin, base.BasePlugin):
+    processed = []
+
+    def calc_embedding(self, face_img):
+        FakeCalculator.processed.append(face_img.shape[0])
+        return np.zeros(2)
+
+
+def test__given_quality_threshold__when_detecting__then_expensive_plugins_skip_low_quality_faces():
+    FakeCalculator.processed = []
+    img = np.random.RandomState(0).randint(0, 255, size=(10, 10, 3)).astype(np.uint8)
+    # sizes 6, 4 and 2 pixels score 6/64, 4/64 and 2/64 for the face size
+    faces = FakeDetector()(img, face_plugins=[FakeCalculator(), FakePoseEstimator()], quality_threshold=5 / 64)
+
+    assert [face.to_json()['quality']['size'] for face in faces] == [6 / 64, 4 / 64, 2 / 64]
+    assert FakeCalculator.processed == [6]
+    assert FakePlugin.processed == [[6, 4, 2]]
+    assert ['embedding' in face.to_json() for face in faces] == [True, False, False]
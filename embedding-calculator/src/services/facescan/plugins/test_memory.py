@@ -0,0 +1,53 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import os
+
+import numpy as np
+import pytest
+
+from sample_images import IMG_DIR
+from sample_images.annotations import SAMPLE_IMAGES
+from src.services.facescan.plugins.managers import plugin_manager
+from src.services.facescan.scanner.test._cache import read_img
+from src.services.utils.buffer_pool import buffer_pool
+
+SOAK_IMAGES = 4
+SOAK_ROUNDS = 40
+MAX_RSS_GROWTH_MB = 5
+
+
+def _rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+@pytest.mark.performance
+def test__given_sustained_load__when_detecting_faces__then_rss_stays_flat():
+    imgs = [read_img(IMG_DIR / row.img_name) for row in SAMPLE_IMAGES[:SOAK_IMAGES]]
+    for img in imgs:
+        plugin_manager.detector(img)
+    reuses_before = buffer_pool.stats.reuses
+
+    rss = []
+    for _ in range(SOAK_ROUNDS):
+        for img in imgs:
+            plugin_manager.detector(img)
+        rss.append(_rss_mb())
+
+    # medians, as RSS of each round also includes transient allocations of the runtime
+    quarter = SOAK_ROUNDS // 4
+    assert np.median(rss[-quarter:]) - np.median(rss[:quarter]) < MAX_RSS_GROWTH_MB
+    assert buffer_pool.stats.reuses > reuses_before
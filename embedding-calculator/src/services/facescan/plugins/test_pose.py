@@ -0,0 +1,91 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import cv2
+import numpy as np
+import pytest
+
+from src.services.dto import plugin_result
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.facescan.plugins import base, mixins, pose
+
+KEYPOINTS_ORDER = ['left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right']
+IMG = np.zeros((480, 640, 3), dtype=np.uint8)
+
+
+class PoseEstimator(mixins.PoseEstimatorMixin, base.BasePlugin):
+    @staticmethod
+    def landmarks_names_ordered():
+        return KEYPOINTS_ORDER
+
+
+def _reference_pose(face: plugin_result.FaceDTO) -> plugin_result.PoseDTO:
+    """ Face by face implementation the batched one replaced """
+    keypoints = dict(zip(KEYPOINTS_ORDER, face.box.landmarks))
+    keypoints['nose_bridge'] = ((keypoints['left_eye'][0] + keypoints['right_eye'][0]) // 2,
+                                (keypoints['left_eye'][1] + keypoints['right_eye'][1]) // 2)
+    keypoints['mouth_center'] = ((keypoints['mouth_left'][0] + keypoints['mouth_right'][0]) // 2,
+                                 (keypoints['mouth_left'][1] + keypoints['mouth_right'][1]) // 2)
+    keypoints['chin'] = (
+        keypoints['mouth_center'][0] + (keypoints['mouth_center'][0] - keypoints['nose_bridge'][0]) // 2,
+        keypoints['mouth_center'][1] + (keypoints['mouth_center'][1] - keypoints['nose_bridge'][1]) // 2)
+    keypoints_on_image = np.array([keypoints[name] for name in PoseEstimator.KEYPOINTS_3D], dtype=np.float64)
+    keypoints_3d = np.array(list(PoseEstimator.KEYPOINTS_3D.values()), dtype=np.float64)
+
+    image_height, image_width, _ = face._img.shape
+    camera_matrix = np.array([[image_width, 1, image_height / 2], [0, image_width, image_width / 2], [0, 0, 1]],
+                             dtype=np.float64)
+    _, rotation_vector, _ = cv2.solvePnP(keypoints_3d, keypoints_on_image, camera_matrix, np.zeros((4, 1)))
+    angles = cv2.RQDecomp3x3(cv2.Rodrigues(rotation_vector)[0])[0]
+    return plugin_result.PoseDTO(pitch=np.sign(angles[0]) * 180 - angles[0], yaw=angles[1],
+                                 roll=np.sign(angles[2]) * 180 - angles[2])
+
+
+def _faces(count, seed=0):
+    """ Faces with landmarks of the 3D model in random head poses """
+    rng = np.random.RandomState(seed)
+    keypoints_3d = np.array([PoseEstimator.KEYPOINTS_3D[name] for name in KEYPOINTS_ORDER])
+    camera_matrix = pose.camera_matrix_for_image(*IMG.shape[:2], PoseEstimator.FOCAL_COEF)
+    faces = []
+    for _ in range(count):
+        pitch, yaw, roll = np.radians([rng.uniform(-25, 25), rng.uniform(-40, 40), rng.uniform(-20, 20)])
+        rotation = cv2.Rodrigues(np.array([np.pi, 0, 0]))[0] @ cv2.Rodrigues(np.array([pitch, yaw, roll]))[0]
+        translation = np.array([rng.uniform(-40, 40), rng.uniform(-30, 30), rng.uniform(60, 500)])
+        landmarks = pose.project(rotation[None], translation[None], keypoints_3d, camera_matrix)[0]
+        landmarks += rng.normal(size=landmarks.shape)
+        box = BoundingBoxDTO(x_min=0, y_min=0, x_max=1, y_max=1, probability=1, np_landmarks=landmarks)
+        faces.append(plugin_result.FaceDTO(box=box, img=IMG, face_img=None))
+    return faces
+
+
+@pytest.mark.parametrize('face_count', [1, 5, pose.BATCH_SOLVER_MIN_FACES, 200])
+def test__given_faces__when_estimating_pose_at_once__then_returns_same_angles_as_face_by_face(face_count):
+    faces = _faces(face_count)
+
+    poses = PoseEstimator().process_faces(faces)
+
+    expected = [_reference_pose(face).pose for face in faces]
+    for actual, expected_pose in zip(poses, expected):
+        for angle in ('pitch', 'yaw', 'roll'):
+            assert actual.pose[angle] == pytest.approx(expected_pose[angle], abs=0.01)
+
+
+def test__given_rotations__when_calculating_euler_angles__then_returns_same_angles_as_opencv():
+    rotation_vectors = np.random.RandomState(0).normal(size=(1000, 3)) * 1.5
+    rotations = pose.rodrigues(rotation_vectors)
+
+    angles = pose.euler_angles(rotations)
+
+    expected = [cv2.RQDecomp3x3(rotation)[0] for rotation in rotations]
+    assert np.allclose(angles, expected, atol=1e-6)
@@ -0,0 +1,32 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from src.services.facescan.plugins import base
+from src.services.facescan.plugins.precision import INT8
+
+
+class Int8Plugin(base.BasePlugin):
+    slug = 'calculator'
+    ml_models = (('model_name', 'google_drive_id'),)
+
+    def __call__(self, face):
+        raise NotImplementedError
+
+
+def test__given_reduced_precision_plugin__then_version_and_model_path_include_precision():
+    plugin = Int8Plugin(ml_model_name='model_name', precision=INT8)
+
+    assert plugin.is_reduced_precision
+    assert str(plugin) == 'test_precision.Int8Plugin@model_name:int8'
+    assert plugin.ml_model.converted_path(INT8) == plugin.ml_model.path.parent / 'model_name:int8'
@@ -0,0 +1,65 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import cv2
+import numpy as np
+
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.facescan.plugins import quality
+
+BOX = BoundingBoxDTO(0, 0, 100, 100, 1)
+
+
+def _textured_face(seed=0):
+    pixels = np.random.RandomState(seed).randint(0, 255, size=(20, 20, 3)).astype(np.uint8)
+    return cv2.resize(pixels, (160, 160), interpolation=cv2.INTER_NEAREST)
+
+
+def test__given_blurred_face__when_scoring__then_sharpness_is_lower():
+    face = _textured_face()
+    blurred = cv2.GaussianBlur(face, (0, 0), 4)
+
+    result = quality.face_quality([face, blurred], [BOX, BOX])
+
+    assert result.sharpness[0] > 0.9 > 0.5 > result.sharpness[1]
+    assert result.score[1] == result.sharpness[1]
+
+
+def test__given_dark_and_flat_faces__when_scoring__then_illumination_is_low():
+    dark = (_textured_face() // 16).astype(np.uint8)
+    flat = np.full((160, 160, 3), 128, dtype=np.uint8)
+
+    result = quality.face_quality([_textured_face(), dark, flat], [BOX] * 3)
+
+    assert result.illumination[0] > 0.9
+    assert result.illumination[1] < 0.1 and result.illumination[2] == 0
+
+
+def test__given_float_and_uint8_crops__when_scoring__then_scores_are_equal():
+    face = _textured_face()
+
+    result = quality.face_quality([face, face / 255], [BOX, BOX])
+
+    assert np.allclose(result.score[0], result.score[1], atol=1e-5)
+
+
+def test__given_empty_or_degenerate_landmarks__when_scoring_pose__then_pose_is_1():
+    frontal = BoundingBoxDTO(0, 0, 100, 100, 1,
+                             np_landmarks=np.array([[30, 40], [70, 40], [50, 62], [35, 80], [65, 80]]))
+    empty = BoundingBoxDTO(0, 0, 100, 100, 1, np_landmarks=np.zeros((5, 0)))
+    three_points = BoundingBoxDTO(0, 0, 100, 100, 1, np_landmarks=np.array([[30, 40], [70, 40], [50, 62]]))
+
+    scores = quality.pose_scores([empty, three_points, frontal, BOX])
+
+    assert scores.tolist() == [1, 1, 1, 1]
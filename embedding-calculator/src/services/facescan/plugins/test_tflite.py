@@ -0,0 +1,80 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from time import perf_counter
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+import tensorflow.compat.v1 as tf1  # noqa: E402
+
+from src.services.facescan.plugins import tflite  # noqa: E402
+from src.services.facescan.plugins.precision import FLOAT16, INT8  # noqa: E402
+
+IMG_SIZE = 64
+BATCH_SIZE = 16
+
+
+def _imgs(count):
+    return [np.random.RandomState(seed).rand(IMG_SIZE, IMG_SIZE, 3).astype(np.float32) for seed in range(count)]
+
+
+def _convert(precision, path):
+    """ A small conv net with a flatten, converted like the plugin models """
+    weights = np.random.RandomState(0)
+    with tf1.Graph().as_default() as graph:
+        images = tf1.placeholder(tf.float32, (None, IMG_SIZE, IMG_SIZE, 3))
+        net = images
+        for channels in (16, 32, 64):
+            kernel = weights.randn(3, 3, net.shape[-1], channels).astype(np.float32) * 0.1
+            net = tf.nn.relu(tf.nn.conv2d(net, kernel, 2, 'SAME'))
+        net = tf1.layers.flatten(net)
+        output = tf.nn.softmax(tf.matmul(net, weights.randn(net.shape[-1], 8).astype(np.float32) * 0.1))
+        with tf1.Session(graph=graph) as sess:
+            tflite.convert_session(sess, images, output, precision, _imgs(4), path)
+    return tflite.TFLiteModel(path)
+
+
+@pytest.mark.parametrize('precision', [FLOAT16, INT8])
+def test__given_batch__when_run__then_returns_same_results_as_one_by_one(tmp_path, precision):
+    model = _convert(precision, tmp_path)
+    imgs = _imgs(5)
+
+    batched = model(imgs)
+    one_by_one = np.concatenate([model([img]) for img in imgs])
+
+    assert batched.shape == (5, 8)
+    assert np.allclose(batched, one_by_one, atol=1e-5)
+    assert model([]).shape == (0,)
+
+
+@pytest.mark.performance
+def test__given_float16_model__when_run_in_batches__then_faster_than_one_by_one(tmp_path):
+    model = _convert(FLOAT16, tmp_path)
+    imgs = _imgs(BATCH_SIZE)
+    model(imgs), model(imgs[:1])
+
+    start = perf_counter()
+    for img in imgs:
+        model([img])
+    one_by_one = perf_counter() - start
+    model(imgs)
+    start = perf_counter()
+    model(imgs)
+    batched = perf_counter() - start
+
+    print(f"float16 TFLite: {one_by_one / BATCH_SIZE * 1000:.2f} ms/img one by one, "
+          f"{batched / BATCH_SIZE * 1000:.2f} ms/img in batches of {BATCH_SIZE}")
+    assert batched < one_by_one
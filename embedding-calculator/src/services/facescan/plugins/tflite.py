@@ -0,0 +1,95 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+import threading
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import tensorflow as tf
+import tensorflow.compat.v1 as tf1
+
+from src.services.facescan.plugins import exceptions
+from src.services.facescan.plugins.precision import FLOAT16, INT8
+from src.services.imgtools.types import Array3D
+
+logger = logging.getLogger(__name__)
+MODEL_FILE = 'model.tflite'
+
+
+def convert_session(sess: tf1.Session, input_tensor: tf1.Tensor, output_tensor: tf1.Tensor,
+                    precision: str, calibration_inputs: List[Array3D], path: Path):
+    """
+    Converts a TF1 graph to TFLite with post-training quantization:
+    float16 - weights are stored in float16, halving the model size only: the CPU interpreter dequantizes them
+    to float32, so it is not faster than float32,
+    int8 - weights and activations are int8, activation ranges are calibrated on `calibration_inputs`.
+    Inputs and outputs stay float32, so the model is called the same way as the original graph.
+    The model is converted for batches of 1, TFLiteModel resizes the input to the batch.
+    """
+    assert precision in (FLOAT16, INT8), precision
+    input_tensor.set_shape((1,) + calibration_inputs[0].shape)
+    converter = tf1.lite.TFLiteConverter.from_session(sess, [input_tensor], [output_tensor])
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if precision == FLOAT16:
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        converter.representative_dataset = lambda: (
+            [np.expand_dims(img, 0).astype(np.float32)] for img in calibration_inputs)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / MODEL_FILE).write_bytes(converter.convert())
+    logger.info(f'Saved {precision} model to {path}')
+
+
+class TFLiteModel:
+    """
+    Runs a converted model on a batch of images at once, resizing the input tensor when the batch size changes.
+    The interpreter is not thread-safe, calls are serialized
+    """
+
+    def __init__(self, path: Path):
+        if not (path / MODEL_FILE).exists():
+            raise exceptions.ModelImportException(
+                f'Converted model {path} does not exist, run `python -m tools.calibrate_precision`')
+        self._interpreter = tf.lite.Interpreter(model_path=str(path / MODEL_FILE))
+        self._interpreter.allocate_tensors()
+        self._input_index = self._interpreter.get_input_details()[0]['index']
+        self._output_index = self._interpreter.get_output_details()[0]['index']
+        self._batch_size = 1
+        self._batching = True  # False when the graph only runs batches of 1
+        self._lock = threading.Lock()
+
+    def __call__(self, imgs: List[Array3D]) -> np.ndarray:
+        batch = np.asarray(imgs, dtype=np.float32)
+        if not len(batch):
+            return batch
+        with self._lock:
+            if self._batching:
+                try:
+                    return self._invoke(batch)
+                except (RuntimeError, ValueError) as e:
+                    logger.warning(f'Converted model does not run batches, running images one by one: {e}')
+                    self._batching = False
+                    self._batch_size = 0  # the input is resized back to 1 image
+            return np.concatenate([self._invoke(batch[i:i + 1]) for i in range(len(batch))])
+
+    def _invoke(self, batch: np.ndarray) -> np.ndarray:
+        if len(batch) != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input_index, batch.shape)
+            self._interpreter.allocate_tensors()
+            self._batch_size = len(batch)
+        self._interpreter.set_tensor(self._input_index, batch)
+        self._interpreter.invoke()
+        return self._interpreter.get_tensor(self._output_index).copy()
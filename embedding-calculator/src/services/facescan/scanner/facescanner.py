@@ -35,8 +35,8 @@ class FaceScanner(ABC):
         return cls.instance
 
     @abstractmethod
-    def scan(self, img: Array3D, det_prob_threshold: float = None) -> List[FaceDTO]:
-        """ Find face bounding boxes and calculate embeddings"""
+    def scan(self, img: Array3D, det_prob_threshold: float = None, limit: int = 0) -> List[FaceDTO]:
+        """ Find face bounding boxes and calculate embeddings of the `limit` largest faces (0 - all)"""
         raise NotImplementedError
 
     @abstractmethod
@@ -58,9 +58,9 @@ class ScannerWithPluggins(FaceScanner):
     """
     ID = "ScannerWithPlugins"
 
-    def scan(self, img: Array3D, det_prob_threshold: float = None):
+    def scan(self, img: Array3D, det_prob_threshold: float = None, limit: int = 0):
         return plugin_manager.detector(img, det_prob_threshold,
-                                       [plugin_manager.calculator])
+                                       [plugin_manager.calculator], limit)
 
     def find_faces(self, img: Array3D, det_prob_threshold: float = None) -> List[BoundingBoxDTO]:
         return plugin_manager.detector.find_faces(img, det_prob_threshold)
@@ -73,7 +73,7 @@ class ScannerWithPluggins(FaceScanner):
 class MockScanner(FaceScanner):
     ID = 'MockScanner'
 
-    def scan(self, img: Array3D, det_prob_threshold: float = None) -> List[FaceDTO]:
+    def scan(self, img: Array3D, det_prob_threshold: float = None, limit: int = 0) -> List[FaceDTO]:
         return [FaceDTO(box=BoundingBoxDTO(0, 0, 0, 0, 0),
                         plugins_dto=[EmbeddingDTO(embedding=np.random.rand(1))],
                         img=img, face_img=img)]
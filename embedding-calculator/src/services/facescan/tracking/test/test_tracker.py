@@ -0,0 +1,64 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import numpy as np
+
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.facescan.tracking.tracker import FaceTracker
+
+
+def _box(x, y, size=20, probability=1.0, landmarks=None):
+    return BoundingBoxDTO(x_min=x, y_min=y, x_max=x + size, y_max=y + size, probability=probability,
+                          np_landmarks=np.array(landmarks if landmarks is not None else np.zeros((0, 2))))
+
+
+def test__given_two_moving_faces__when_tracking__then_each_face_keeps_its_track():
+    tracker = FaceTracker()
+
+    for frame in range(5):
+        tracker.update(frame, [_box(100 - 3 * frame, 0), _box(3 * frame, 0)])
+
+    assert len(tracker.tracks) == 2
+    assert [track.frames for track in tracker.tracks] == [[0, 1, 2, 3, 4]] * 2
+    assert [box.x_min for box in tracker.tracks[1].boxes] == [0, 3, 6, 9, 12]
+
+
+def test__given_face_lost_for_too_long__when_it_reappears__then_starts_new_track():
+    tracker = FaceTracker(max_missed_frames=1)
+
+    tracker.update(0, [_box(0, 0)])
+    tracker.update(2, [_box(0, 0)])
+    tracker.update(5, [_box(0, 0)])
+
+    assert [track.frames for track in tracker.tracks] == [[0, 2], [5]]
+
+
+def test__given_overlapping_box_with_jumped_landmarks__when_tracking__then_starts_new_track():
+    tracker = FaceTracker(max_landmarks_shift=0.3)
+
+    tracker.update(0, [_box(0, 0, landmarks=[[5, 5], [15, 5]])])
+    tracker.update(1, [_box(2, 0, landmarks=[[16, 18], [20, 18]])])
+
+    assert len(tracker.tracks) == 2
+
+
+def test__given_track__when_asking_best_frame__then_returns_largest_confident_detection():
+    tracker = FaceTracker()
+
+    for frame, (size, probability) in enumerate([(20, 1.0), (22, 0.99), (24, 0.5), (21, 1.0)]):
+        tracker.update(frame, [_box(0, 0, size, probability)])
+
+    track, = tracker.tracks
+    assert track.best_frame == 1
+    assert track.best_box.width == 22
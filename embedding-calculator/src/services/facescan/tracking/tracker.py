@@ -0,0 +1,132 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from typing import List
+
+import attr
+import numpy as np
+
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.dto.json_encodable import JSONEncodable
+from src.services.dto.plugin_result import FaceDTO
+
+
+def box_quality(box: BoundingBoxDTO) -> float:
+    """ Larger and more confident detections give better face crops """
+    return box.width * box.height * box.probability
+
+
+def landmarks_shift(box: BoundingBoxDTO, other: BoundingBoxDTO) -> float:
+    """
+    Mean landmark displacement relative to the box size, 0 when landmarks are unknown.
+    >>> box = BoundingBoxDTO(0, 0, 10, 10, 1, np_landmarks=np.array([[2, 3], [8, 3]]))
+    >>> landmarks_shift(box, BoundingBoxDTO(1, 0, 11, 10, 1, np_landmarks=np.array([[3, 3], [9, 3]])))
+    0.1
+    >>> landmarks_shift(box, BoundingBoxDTO(1, 0, 11, 10, 1))
+    0.0
+    """
+    landmarks, other_landmarks = np.array(box.landmarks), np.array(other.landmarks)
+    if not len(landmarks) or landmarks.shape != other_landmarks.shape:
+        return 0.0
+    return float(np.linalg.norm(landmarks - other_landmarks, axis=1).mean() / max(box.width, box.height, 1))
+
+
+@attr.s(auto_attribs=True)
+class FaceTrack:
+    track_id: int
+    frames: List[int] = attr.Factory(list)
+    boxes: List[BoundingBoxDTO] = attr.Factory(list)
+
+    def add(self, frame: int, box: BoundingBoxDTO):
+        self.frames.append(frame)
+        self.boxes.append(box)
+
+    @property
+    def last_frame(self) -> int:
+        return self.frames[-1]
+
+    @property
+    def last_box(self) -> BoundingBoxDTO:
+        return self.boxes[-1]
+
+    @property
+    def best_idx(self) -> int:
+        return max(range(len(self.boxes)), key=lambda i: box_quality(self.boxes[i]))
+
+    @property
+    def best_frame(self) -> int:
+        return self.frames[self.best_idx]
+
+    @property
+    def best_box(self) -> BoundingBoxDTO:
+        return self.boxes[self.best_idx]
+
+
+class FaceTracker:
+    """
+    Associates face boxes of consecutive frames into tracks, greedily by box IoU.
+    A pair is not associated when its landmarks moved more than `max_landmarks_shift` of the box size,
+    a track not seen for more than `max_missed_frames` frames is not continued.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_landmarks_shift: float = 0.5, max_missed_frames: int = 2):
+        self.iou_threshold = iou_threshold
+        self.max_landmarks_shift = max_landmarks_shift
+        self.max_missed_frames = max_missed_frames
+        self.tracks: List[FaceTrack] = []
+
+    def update(self, frame: int, boxes: List[BoundingBoxDTO]) -> List[FaceTrack]:
+        """ Adds boxes of the next frame, returns their tracks """
+        active = [track for track in self.tracks if frame - track.last_frame <= self.max_missed_frames + 1]
+        pairs = sorted(((track.last_box.iou(box), track_i, box_i)
+                        for track_i, track in enumerate(active)
+                        for box_i, box in enumerate(boxes)), reverse=True)
+
+        box_tracks = [None] * len(boxes)
+        matched_tracks = set()
+        for iou, track_i, box_i in pairs:
+            if iou < self.iou_threshold:
+                break
+            if track_i in matched_tracks or box_tracks[box_i] is not None:
+                continue
+            if landmarks_shift(active[track_i].last_box, boxes[box_i]) > self.max_landmarks_shift:
+                continue
+            matched_tracks.add(track_i)
+            box_tracks[box_i] = active[track_i]
+
+        for box_i, box in enumerate(boxes):
+            if box_tracks[box_i] is None:
+                box_tracks[box_i] = FaceTrack(track_id=len(self.tracks))
+                self.tracks.append(box_tracks[box_i])
+            box_tracks[box_i].add(frame, box)
+        return box_tracks
+
+
+@attr.s(auto_attribs=True)
+class FaceTrackDTO(JSONEncodable):
+    """ Face plugin results of the best frame of a track, and boxes of the track in all its frames """
+    track_id: int
+    best_frame: int
+    frames: List[int]
+    boxes: List[BoundingBoxDTO]
+    _face: FaceDTO
+
+    @property
+    def face(self) -> FaceDTO:
+        return self._face
+
+    def to_json(self):
+        data = super().to_json()
+        data.update(self._face.to_json())
+        return data
@@ -13,9 +13,13 @@
 #  permissions and limitations under the License.
 
 API_KEY_HEADER = 'X-Api-Key'
+CACHE_BYPASS_HEADER = 'X-Cache-Bypass'
+CACHE_STATUS_HEADER = 'X-Cache'
 
 
 class ARG:
     LIMIT = 'limit'
     DET_PROB_THRESHOLD = 'det_prob_threshold'
-    FACE_PLUGINS = 'face_plugins'
\ No newline at end of file
+    FACE_PLUGINS = 'face_plugins'
+    STREAM = 'stream'
+    QUALITY_THRESHOLD = 'quality_threshold'
\ No newline at end of file
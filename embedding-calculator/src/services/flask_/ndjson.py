@@ -0,0 +1,29 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from typing import Any, Iterable
+
+from flask import Response, current_app, json, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def ndjson_response(records: Iterable[Any]) -> Response:
+    """ Streams JSON-encodable records one per line, each is sent as soon as it is produced """
+
+    def generate():
+        for record in records:
+            yield json.dumps(record) + '\n'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
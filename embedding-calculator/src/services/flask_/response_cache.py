@@ -0,0 +1,59 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+from typing import Callable, Dict
+
+from flask import Response
+
+from src.constants import ENV
+from src.services.cache.bounded_cache import BoundedCache
+from src.services.cache.hashing import hash_img
+from src.services.flask_.constants import CACHE_BYPASS_HEADER, CACHE_STATUS_HEADER
+from src.services.imgtools.types import Array3D
+
+response_cache = BoundedCache(max_bytes=ENV.RESPONSE_CACHE_SIZE_MB * 1024 * 1024,
+                              ttl_seconds=ENV.RESPONSE_CACHE_TTL_SECONDS)
+
+
+def _is_bypassed(request) -> bool:
+    return request.headers.get(CACHE_BYPASS_HEADER, '').lower() in ('true', '1')
+
+
+def cached_response(img: Array3D, plugins_versions: Dict[str, str],
+                    create_response: Callable[[], Response]) -> Response:
+    """
+    Returns the serialized response of a previous identical request (same decoded image,
+    endpoint, request arguments and plugin versions) or creates and caches a new one.
+    """
+    from flask import current_app, request
+
+    if not response_cache.enabled or _is_bypassed(request):
+        response = create_response()
+        response.headers[CACHE_STATUS_HEADER] = 'BYPASS'
+        return response
+
+    key = (request.path, hash_img(img),
+           tuple(sorted(request.values.items(multi=True))),
+           tuple(sorted(plugins_versions.items())))
+    data = response_cache.get(key)
+    if data is not None:
+        response = current_app.response_class(data, mimetype='application/json')
+        response.headers[CACHE_STATUS_HEADER] = 'HIT'
+        return response
+
+    response = create_response()
+    if response.status_code == 200:
+        response_cache.put(key, response.get_data())
+    response.headers[CACHE_STATUS_HEADER] = 'MISS'
+    return response
@@ -0,0 +1,44 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import json
+
+from src.services.dto.json_encodable import JSONEncodable
+from src.services.flask_.ndjson import NDJSON_MIMETYPE, ndjson_response
+
+
+class Record(JSONEncodable):
+    def __init__(self, value):
+        self.value = value
+
+
+def test__given_records__when_streaming__then_sends_one_json_line_per_record_as_produced(app):
+    produced = []
+
+    def records():
+        for value in range(3):
+            produced.append(value)
+            yield Record(value)
+
+    @app.route('/stream')
+    def stream():
+        return ndjson_response(records())
+
+    response = app.test_client().get('/stream', buffered=False)
+    lines = response.response
+
+    assert response.mimetype == NDJSON_MIMETYPE
+    assert json.loads(next(lines)) == {'value': 0}
+    assert produced == [0]
+    assert [json.loads(line) for line in lines] == [{'value': 1}, {'value': 2}]
@@ -0,0 +1,58 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import numpy as np
+import pytest
+from flask import jsonify
+
+from src.services.flask_.constants import CACHE_BYPASS_HEADER, CACHE_STATUS_HEADER
+from src.services.flask_.response_cache import cached_response, response_cache
+
+ENDPOINT = '/endpoint'
+IMG = np.zeros((4, 4, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def client_with_cached_endpoint(app):
+    calls = []
+
+    @app.route(ENDPOINT, methods=['POST'])
+    def endpoint():
+        def create_response():
+            calls.append(1)
+            return jsonify(result=len(calls))
+
+        return cached_response(IMG, {'calculator': 'v1'}, create_response)
+
+    response_cache.clear()
+    yield app.test_client()
+    response_cache.clear()
+
+
+def test__given_same_request__when_requesting_twice__then_second_response_is_cached(client_with_cached_endpoint):
+    first = client_with_cached_endpoint.post(ENDPOINT, data={'limit': '1'})
+    second = client_with_cached_endpoint.post(ENDPOINT, data={'limit': '1'})
+    other_args = client_with_cached_endpoint.post(ENDPOINT, data={'limit': '2'})
+
+    assert (first.headers[CACHE_STATUS_HEADER], first.json) == ('MISS', {'result': 1})
+    assert (second.headers[CACHE_STATUS_HEADER], second.json) == ('HIT', {'result': 1})
+    assert (other_args.headers[CACHE_STATUS_HEADER], other_args.json) == ('MISS', {'result': 2})
+
+
+def test__given_bypass_header__when_requesting__then_response_is_not_cached(client_with_cached_endpoint):
+    client_with_cached_endpoint.post(ENDPOINT)
+
+    res = client_with_cached_endpoint.post(ENDPOINT, headers={CACHE_BYPASS_HEADER: 'true'})
+
+    assert (res.headers[CACHE_STATUS_HEADER], res.json) == ('BYPASS', {'result': 2})
@@ -0,0 +1,172 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+import threading
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import attr
+import numpy as np
+
+from src.constants import ENV
+from src.services.dto.json_encodable import JSONEncodable
+from src.services.facescan.plugins import base
+from src.services.gallery.index import ExactIndex, IVFIndex
+from src.services.gallery.storage import EmbeddingStorage, l2_normalize
+
+logger = logging.getLogger(__name__)
+INDEX_TYPES = ('auto', ExactIndex.name, IVFIndex.name)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class GalleryMatch(JSONEncodable):
+    subject: str
+    similarity: float = attr.ib(converter=float)
+    distance: float = attr.ib(converter=float)
+    is_match: bool = attr.ib(converter=bool)
+
+
+class Gallery:
+    """
+    In-process 1:N gallery of subject embeddings.
+    Similarity follows the API classifier: euclidean distance between L2-normalized embeddings
+    converted with the calculator's `similarity_coefficients`; `is_match` compares the raw squared
+    distance with the calculator's `difference_threshold`, the same way as the scanner tests do.
+    """
+    CANDIDATES_PER_RESULT = 4
+    COMPACT_DEAD_RATIO = 0.25
+    RETRAIN_GROWTH = 4
+
+    def __init__(self, similarity_coefficients: Tuple[float, float] = (0, 1),
+                 difference_threshold: float = 0.4,
+                 index_type: str = ENV.GALLERY_INDEX,
+                 approx_min_size: int = ENV.GALLERY_APPROX_MIN_SIZE,
+                 storage: EmbeddingStorage = None):
+        assert index_type in INDEX_TYPES, f"Index type has to be one of {INDEX_TYPES}"
+        self.similarity_coefficients = similarity_coefficients
+        self.difference_threshold = difference_threshold
+        self.index_type = index_type
+        self.approx_min_size = approx_min_size
+        self._storage = storage
+        self._index = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def for_calculator(cls, calculator_model: base.CalculatorModel, **kwargs) -> 'Gallery':
+        return cls(similarity_coefficients=tuple(calculator_model.similarity_coefficients),
+                   difference_threshold=calculator_model.difference_threshold, **kwargs)
+
+    def __len__(self):
+        return self._storage.alive_count if self._storage else 0
+
+    @property
+    def subjects(self) -> List[str]:
+        if not self._storage:
+            return []
+        return sorted({s for s, alive in zip(self._storage.subjects, self._storage.alive) if alive})
+
+    @property
+    def index(self) -> ExactIndex:
+        return self._index
+
+    def add(self, subject: str, embedding: np.ndarray):
+        self.add_many([subject], np.atleast_2d(embedding))
+
+    def add_many(self, subjects: List[str], embeddings: np.ndarray):
+        with self._lock:
+            if self._storage is None:
+                self._storage = EmbeddingStorage(dim=np.atleast_2d(embeddings).shape[1])
+            rows = self._storage.append(list(subjects), embeddings)
+            if self._index is not None:
+                self._index.add(rows)
+
+    def remove(self, subject: str) -> int:
+        """ Removes all embeddings of the subject, returns the count of removed embeddings """
+        with self._lock:
+            if not self._storage:
+                return 0
+            rows = np.array([i for i, s in enumerate(self._storage.subjects) if s == subject], dtype=int)
+            dead_before = self._storage.dead_count
+            self._storage.kill(rows)
+            removed = self._storage.dead_count - dead_before
+            if self._storage.dead_count > self.COMPACT_DEAD_RATIO * len(self._storage):
+                self._compact()
+            return removed
+
+    def search(self, embedding: np.ndarray, k: int = 1) -> List[GalleryMatch]:
+        """ Returns up to k best matching subjects, most similar first """
+        with self._lock:
+            if not len(self):
+                return []
+            query, (query_norm,) = l2_normalize(embedding)
+            query = query[0]
+            rows, cosines = self._get_index().search(query, k * self.CANDIDATES_PER_RESULT)
+
+            matches, seen = [], set()
+            for row, cosine in zip(rows, cosines):
+                subject = self._storage.subjects[row]
+                if subject in seen:
+                    continue
+                seen.add(subject)
+                matches.append(self._to_match(subject, cosine, self._storage.norms[row], query_norm))
+                if len(matches) == k:
+                    break
+            return matches
+
+    def _to_match(self, subject: str, cosine: float, norm: float, query_norm: float) -> GalleryMatch:
+        distance = np.sqrt(max(2 - 2 * cosine, 0))
+        coef0, coef1 = self.similarity_coefficients
+        raw_sq_distance = norm ** 2 + query_norm ** 2 - 2 * norm * query_norm * cosine
+        return GalleryMatch(subject=subject,
+                            similarity=(np.tanh((coef0 - distance) * coef1) + 1) / 2,
+                            distance=distance,
+                            is_match=raw_sq_distance < self.difference_threshold)
+
+    def _get_index(self) -> ExactIndex:
+        index_type = self.index_type
+        if index_type == 'auto':
+            index_type = IVFIndex.name if len(self) >= self.approx_min_size else ExactIndex.name
+        if self._index is None or self._index.name != index_type:
+            self._index = IVFIndex(self._storage) if index_type == IVFIndex.name else ExactIndex(self._storage)
+            logger.debug(f"Gallery of {len(self)} embeddings uses '{index_type}' index")
+        if isinstance(self._index, IVFIndex) and (
+                not self._index.is_trained or len(self) > self.RETRAIN_GROWTH * self._index.trained_size):
+            self._index.train()
+        return self._index
+
+    def _compact(self):
+        keep = self._storage.compact()
+        if self._index is not None:
+            self._index.compact(keep)
+
+    def save(self, path: Union[str, Path]):
+        """ Saves a snapshot that `load` memory-maps for a fast restart """
+        with self._lock:
+            if self._storage is None:
+                raise ValueError("Cannot save an empty gallery")
+            if self._storage.dead_count:
+                self._compact()
+            self._storage.save(path)
+            if self._index is not None:
+                self._index.save(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True, **kwargs) -> 'Gallery':
+        gallery = cls(storage=EmbeddingStorage.load(path, mmap=mmap), **kwargs)
+        index = IVFIndex(gallery._storage)
+        index.load(path)
+        if index.is_trained:
+            gallery._index = index
+        return gallery
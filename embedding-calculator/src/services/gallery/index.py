@@ -0,0 +1,185 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+import math
+from pathlib import Path
+from typing import Tuple, Union
+
+import numpy as np
+
+from src.services.gallery.storage import EmbeddingStorage
+
+logger = logging.getLogger(__name__)
+CENTROIDS_FILE = 'ivf_centroids.npy'
+ASSIGNMENTS_FILE = 'ivf_assignments.npy'
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indexes of the k highest scores, best first.
+    >>> top_k(np.array([0.1, 0.9, 0.5, 0.7]), 2).tolist()
+    [1, 3]
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=int)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+class ExactIndex:
+    """ Brute-force cosine search over every stored embedding """
+    name = 'exact'
+
+    def __init__(self, storage: EmbeddingStorage):
+        self.storage = storage
+
+    def add(self, rows: np.ndarray):
+        pass
+
+    def compact(self, keep: np.ndarray):
+        pass
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns row ids and cosine similarities of the k nearest alive embeddings """
+        return self._search_rows(None, query, k)
+
+    def _search_rows(self, rows, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        vectors, alive = self.storage.vectors, self.storage.alive
+        if rows is not None:
+            vectors, alive = vectors[rows], alive[rows]
+        scores = vectors @ query
+        if self.storage.dead_count:
+            scores[~alive] = -np.inf
+        best = top_k(scores, k)
+        best = best[np.isfinite(scores[best])]
+        return (best if rows is None else rows[best]), scores[best]
+
+    def save(self, path: Union[str, Path]):
+        pass
+
+    def load(self, path: Union[str, Path]):
+        pass
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted file index: embeddings are clustered with spherical k-means and only
+    the `nprobe` clusters closest to the query are scanned.
+    Rows added after training are kept in a pending tail that is always scanned,
+    and are merged into the inverted lists once the tail grows big enough.
+    """
+    name = 'ivf'
+    KMEANS_ITERATIONS = 10
+    TRAIN_SAMPLES_PER_LIST = 64
+    PENDING_MERGE_RATIO = 0.1
+    CHUNK_SIZE = 16384
+
+    def __init__(self, storage: EmbeddingStorage, nlist: int = None, nprobe: int = None):
+        super().__init__(storage)
+        self._nlist, self._nprobe = nlist, nprobe
+        self.centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._list_offsets = None
+        self._sorted_rows = None
+        self._pending_from = 0
+        self.trained_size = 0
+
+    @property
+    def nlist(self) -> int:
+        return self._nlist or max(1, int(math.sqrt(max(self.storage.alive_count, 1))))
+
+    @property
+    def nprobe(self) -> int:
+        nlist = len(self.centroids) if self.centroids is not None else self.nlist
+        return min(nlist, self._nprobe or max(1, nlist // 16))
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, seed: int = 0):
+        vectors = self.storage.vectors[self.storage.alive]
+        nlist = min(self.nlist, len(vectors))
+        if nlist == 0:
+            return
+        rng = np.random.RandomState(seed)
+        sample_size = min(len(vectors), nlist * self.TRAIN_SAMPLES_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.KMEANS_ITERATIONS):
+            labels = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            centroids[~empty] = sums[~empty] / norms[~empty, None]
+        self.centroids = centroids
+        self.trained_size = len(vectors)
+        self._assignments = self._assign(self.storage.vectors, centroids)
+        self._rebuild_lists()
+        logger.debug(f"Trained IVF index with {nlist} lists on {sample_size} samples")
+
+    def add(self, rows: np.ndarray):
+        if not self.is_trained:
+            return
+        self._assignments = np.concatenate([self._assignments, self._assign(self.storage.vectors[rows],
+                                                                            self.centroids)])
+        pending = len(self.storage) - self._pending_from
+        if pending > self.PENDING_MERGE_RATIO * max(self._pending_from, 1):
+            self._rebuild_lists()
+
+    def compact(self, keep: np.ndarray):
+        if not self.is_trained:
+            return
+        self._assignments = self._assignments[keep]
+        self._rebuild_lists()
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.is_trained:
+            return super().search(query, k)
+        probes = top_k(self.centroids @ query, self.nprobe)
+        candidates = [self._sorted_rows[self._list_offsets[i]:self._list_offsets[i + 1]] for i in probes]
+        candidates.append(np.arange(self._pending_from, len(self.storage)))
+        return self._search_rows(np.concatenate(candidates), query, k)
+
+    def _rebuild_lists(self):
+        self._sorted_rows = np.argsort(self._assignments, kind='stable')
+        counts = np.bincount(self._assignments, minlength=len(self.centroids))
+        self._list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._pending_from = len(self._assignments)
+
+    @classmethod
+    def _assign(cls, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), cls.CHUNK_SIZE):
+            chunk = vectors[start:start + cls.CHUNK_SIZE]
+            labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return labels
+
+    def save(self, path: Union[str, Path]):
+        if not self.is_trained:
+            return
+        np.save(str(Path(path) / CENTROIDS_FILE), self.centroids)
+        np.save(str(Path(path) / ASSIGNMENTS_FILE), self._assignments)
+
+    def load(self, path: Union[str, Path]):
+        path = Path(path)
+        if not (path / CENTROIDS_FILE).exists():
+            return
+        self.centroids = np.load(str(path / CENTROIDS_FILE))
+        self._assignments = np.load(str(path / ASSIGNMENTS_FILE))
+        self.trained_size = len(self._assignments)
+        self._rebuild_lists()
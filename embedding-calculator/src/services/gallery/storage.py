@@ -0,0 +1,133 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import json
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+VECTORS_FILE = 'vectors.npy'
+NORMS_FILE = 'norms.npy'
+SUBJECTS_FILE = 'subjects.json'
+
+
+def l2_normalize(embeddings: np.ndarray):
+    """
+    Returns float32 unit vectors and the original norms.
+    >>> vectors, norms = l2_normalize(np.array([[3, 4], [0, 0]]))
+    >>> vectors.tolist(), norms.tolist()
+    ([[0.6000000238418579, 0.800000011920929], [0.0, 0.0]], [5.0, 0.0])
+    """
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(embeddings, axis=1)
+    safe_norms = np.where(norms > 0, norms, 1).astype(np.float32)
+    return embeddings / safe_norms[:, None], norms.astype(np.float32)
+
+
+class EmbeddingStorage:
+    """
+    Append-only float32 matrix of unit-length embeddings with their original norms.
+    Removed rows are only marked as dead until `compact` is called, so row ids stay stable for indexes.
+    """
+    MIN_CAPACITY = 1024
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.subjects: List[str] = []
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self.dead_count = 0
+
+    def __len__(self):
+        return len(self.subjects)
+
+    @property
+    def alive_count(self) -> int:
+        return len(self) - self.dead_count
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self)]
+
+    @property
+    def norms(self) -> np.ndarray:
+        return self._norms[:len(self)]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[:len(self)]
+
+    def append(self, subjects: List[str], embeddings: np.ndarray) -> np.ndarray:
+        vectors, norms = l2_normalize(embeddings)
+        assert vectors.shape == (len(subjects), self.dim), \
+            f"Expected {len(subjects)} embeddings of size {self.dim}, got {vectors.shape}"
+        start, end = len(self), len(self) + len(subjects)
+        self._reserve(end)
+        self._vectors[start:end] = vectors
+        self._norms[start:end] = norms
+        self._alive[start:end] = True
+        self.subjects.extend(subjects)
+        return np.arange(start, end)
+
+    def kill(self, rows: np.ndarray):
+        rows = rows[self._alive[rows]]
+        self._alive[rows] = False
+        self.dead_count += len(rows)
+
+    def compact(self) -> np.ndarray:
+        """ Drops dead rows, returns the mask of rows that were kept """
+        keep = self.alive.copy()
+        self._vectors = self.vectors[keep]
+        self._norms = self.norms[keep]
+        self._alive = np.ones(len(self._norms), dtype=bool)
+        self.subjects = [subject for subject, alive in zip(self.subjects, keep) if alive]
+        self.dead_count = 0
+        return keep
+
+    def _reserve(self, size: int):
+        capacity = len(self._norms)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, self.MIN_CAPACITY)
+        self._vectors = self._grow(self._vectors, (capacity, self.dim))
+        self._norms = self._grow(self._norms, (capacity,))
+        self._alive = self._grow(self._alive, (capacity,))
+
+    def _grow(self, arr: np.ndarray, shape) -> np.ndarray:
+        # also detaches memory-mapped snapshots, so they are never written to
+        grown = np.zeros(shape, dtype=arr.dtype)
+        grown[:len(self)] = arr[:len(self)]
+        return grown
+
+    def save(self, path: Union[str, Path]):
+        assert not self.dead_count, "Storage has to be compacted before saving"
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(str(path / VECTORS_FILE), self.vectors)
+        np.save(str(path / NORMS_FILE), self.norms)
+        (path / SUBJECTS_FILE).write_text(json.dumps(self.subjects))
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> 'EmbeddingStorage':
+        """ With `mmap` the vectors stay on disk (read-only) until the storage grows """
+        path = Path(path)
+        vectors = np.load(str(path / VECTORS_FILE), mmap_mode='r' if mmap else None)
+        storage = cls(vectors.shape[1])
+        storage._vectors = vectors
+        storage._norms = np.load(str(path / NORMS_FILE))
+        storage._alive = np.ones(len(storage._norms), dtype=bool)
+        storage.subjects = json.loads((path / SUBJECTS_FILE).read_text())
+        return storage
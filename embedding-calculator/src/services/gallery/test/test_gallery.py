@@ -0,0 +1,104 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import numpy as np
+import pytest
+
+from src.services.gallery.gallery import Gallery
+from src.services.gallery.index import IVFIndex, ExactIndex
+
+DIM = 64
+
+
+def _random_embeddings(count, seed=0):
+    return np.random.RandomState(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+def _gallery(count, **kwargs):
+    gallery = Gallery(**kwargs)
+    gallery.add_many([f'subject_{i}' for i in range(count)], _random_embeddings(count))
+    return gallery
+
+
+@pytest.mark.parametrize('index_type', ['exact', 'ivf'])
+def test__given_gallery__when_searching_noisy_embedding__then_returns_its_subject(index_type):
+    gallery = _gallery(2000, index_type=index_type)
+    query = _random_embeddings(2000)[42] + _random_embeddings(1, seed=1)[0] * 0.1
+
+    matches = gallery.search(query, k=3)
+
+    assert matches[0].subject == 'subject_42'
+    assert len(matches) == 3
+    assert matches[0].similarity >= matches[1].similarity >= matches[2].similarity
+
+
+def test__given_same_embedding__when_searching__then_matches_with_zero_distance():
+    gallery = _gallery(10, similarity_coefficients=(1.1817961, 5.291995557), difference_threshold=0.4)
+
+    match, = gallery.search(_random_embeddings(10)[3])
+
+    assert match.subject == 'subject_3'
+    assert match.distance == pytest.approx(0, abs=1e-3)
+    assert match.similarity == pytest.approx((np.tanh(1.1817961 * 5.291995557) + 1) / 2, abs=1e-3)
+    assert match.is_match
+
+
+def test__given_several_embeddings_per_subject__when_searching__then_returns_unique_subjects():
+    gallery = _gallery(5)
+    embedding = _random_embeddings(5)[0]
+    gallery.add('subject_0', embedding * 1.01)
+
+    matches = gallery.search(embedding, k=2)
+
+    assert [m.subject for m in matches][0] == 'subject_0'
+    assert len({m.subject for m in matches}) == 2
+
+
+@pytest.mark.parametrize('index_type', ['exact', 'ivf'])
+def test__given_removed_subject__when_searching__then_it_is_not_returned(index_type):
+    gallery = _gallery(500, index_type=index_type)
+    embedding = _random_embeddings(500)[7]
+    gallery.search(embedding)
+
+    removed = gallery.remove('subject_7')
+
+    assert removed == 1
+    assert len(gallery) == 499
+    assert 'subject_7' not in [m.subject for m in gallery.search(embedding, k=5)]
+
+
+def test__given_auto_index__when_gallery_grows__then_switches_to_approximate_index():
+    gallery = _gallery(100, index_type='auto', approx_min_size=200)
+    gallery.search(_random_embeddings(1)[0])
+    assert isinstance(gallery.index, ExactIndex) and not isinstance(gallery.index, IVFIndex)
+
+    gallery.add_many([f'other_{i}' for i in range(100)], _random_embeddings(100, seed=2))
+    gallery.search(_random_embeddings(1)[0])
+
+    assert isinstance(gallery.index, IVFIndex)
+
+
+def test__given_saved_gallery__when_loaded__then_returns_same_results(tmp_path):
+    gallery = _gallery(1000, index_type='ivf')
+    gallery.remove('subject_1')
+    query = _random_embeddings(1000)[500]
+    expected = gallery.search(query, k=3)
+    gallery.save(tmp_path)
+
+    loaded = Gallery.load(tmp_path, index_type='ivf')
+    loaded.add('new_subject', _random_embeddings(1, seed=3)[0])
+
+    assert loaded.search(query, k=3) == expected
+    assert len(loaded) == 1000
+    assert 'subject_1' not in loaded.subjects
@@ -0,0 +1,112 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+"""
+Normalization of face crops shared by plugins: each face of a detection is normalized once per scheme,
+into float32 buffers of the thread's buffer pool that are reused by the next detections.
+"""
+
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from src.services.imgtools.types import Array3D
+from src.services.utils.buffer_pool import buffer_pool
+
+PREWHITEN = 'prewhiten'
+PREPROCESSING_FIELD = '_preprocessing'
+
+
+def prewhiten_batch(imgs: np.ndarray) -> np.ndarray:
+    """
+    In-place float32 `proc_img.prewhiten` of every image of the batch, without temporary arrays.
+    >>> from src.services.imgtools.proc_img import prewhiten
+    >>> imgs = np.random.RandomState(0).rand(2, 4, 4, 3).astype(np.float32)
+    >>> np.allclose(prewhiten_batch(imgs.copy())[1], prewhiten(imgs[1].astype(np.float64)), atol=1e-5)
+    True
+    """
+    flat = imgs.reshape(len(imgs), -1)
+    size = flat.shape[1]
+    for row in flat:
+        row -= row.mean()
+        std = np.sqrt(np.dot(row, row) / size)
+        row *= 1 / max(std, 1 / np.sqrt(size))
+    return imgs
+
+
+SCHEMES: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    PREWHITEN: prewhiten_batch,
+}
+
+
+def normalize(imgs: List[Array3D], scheme: str) -> np.ndarray:
+    """ (N, H, W, C) float32 normalized images, for images that are not faces of a detection """
+    return SCHEMES[scheme](np.array(imgs, dtype=np.float32))
+
+
+class FacePreprocessing:
+    """ Normalized crops of the faces of one detection, computed on first use per face and scheme """
+
+    def __init__(self, faces: List):
+        self._faces = faces
+        self._rows = {id(face): row for row, face in enumerate(faces)}
+        self._batches = {}
+
+    def contains(self, faces: List) -> bool:
+        return all(id(face) in self._rows for face in faces)
+
+    def get(self, faces: List, scheme: str) -> np.ndarray:
+        """ Valid until the end of the detection, plugins must not keep it """
+        if scheme not in self._batches:
+            batch = buffer_pool.acquire((len(self._faces),) + self._faces[0]._face_img.shape)
+            self._batches[scheme] = batch, np.zeros(len(self._faces), dtype=bool)
+        batch, is_done = self._batches[scheme]
+
+        rows = [self._rows[id(face)] for face in faces]
+        for row in rows:
+            if not is_done[row]:
+                batch[row] = self._faces[row]._face_img
+                SCHEMES[scheme](batch[row:row + 1])
+                is_done[row] = True
+        if rows == list(range(rows[0], rows[0] + len(rows))):
+            return batch[rows[0]:rows[0] + len(rows)]
+        return batch[rows]
+
+    def release(self):
+        for batch, _ in self._batches.values():
+            buffer_pool.release(batch)
+        self._batches.clear()
+
+
+@contextmanager
+def face_preprocessing(faces: List):
+    """ Shares normalized crops between plugins run on the faces inside the context """
+    preprocessing = FacePreprocessing(faces)
+    for face in faces:
+        setattr(face, PREPROCESSING_FIELD, preprocessing)
+    try:
+        yield preprocessing
+    finally:
+        preprocessing.release()
+        for face in faces:
+            setattr(face, PREPROCESSING_FIELD, None)
+
+
+def normalized_faces(faces: List, scheme: str) -> np.ndarray:
+    """ (N, H, W, C) float32 normalized face crops, shared by plugins when run inside `face_preprocessing` """
+    preprocessing = getattr(faces[0], PREPROCESSING_FIELD, None)
+    if preprocessing is None or not preprocessing.contains(faces):
+        return normalize([face._face_img for face in faces], scheme)
+    return preprocessing.get(faces, scheme)
@@ -14,6 +14,7 @@
 
 from typing import Tuple
 
+import numpy as np
 from skimage import transform
 
 from src.services.dto.bounding_box import BoundingBoxDTO
@@ -26,3 +27,12 @@ def crop_img(img: Array3D, box: BoundingBoxDTO) -> Array3D:
 
 def squish_img(img: Array3D, dimensions: Tuple[int, int]) -> Array3D:
     return transform.resize(img, dimensions)
+
+
+def prewhiten(img):
+    """ Normalize image."""
+    mean = np.mean(img)
+    std = np.std(img)
+    std_adj = np.maximum(std, 1.0 / np.sqrt(img.size))
+    y = np.multiply(np.subtract(img, mean), 1 / std_adj)
+    return y
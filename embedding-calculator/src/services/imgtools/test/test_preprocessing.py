@@ -0,0 +1,66 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import numpy as np
+
+from src.services.dto.bounding_box import BoundingBoxDTO
+from src.services.dto.plugin_result import FaceDTO
+from src.services.imgtools import preprocessing
+from src.services.imgtools.preprocessing import PREWHITEN, face_preprocessing, normalized_faces
+from src.services.imgtools.proc_img import prewhiten
+from src.services.utils.buffer_pool import buffer_pool
+
+
+def _faces(count):
+    rng = np.random.RandomState(0)
+    return [FaceDTO(box=BoundingBoxDTO(0, 0, 1, 1, 1), img=None, face_img=rng.rand(8, 8, 3)) for _ in range(count)]
+
+
+def test__given_faces__when_normalizing__then_equals_prewhiten_of_each_crop():
+    faces = _faces(3)
+
+    with face_preprocessing(faces):
+        normalized = normalized_faces(faces, PREWHITEN)
+
+        assert normalized.dtype == np.float32
+        for face, img in zip(faces, normalized):
+            assert np.allclose(img, prewhiten(face._face_img), atol=1e-5)
+
+
+def test__given_several_plugins__when_normalizing_same_faces__then_each_face_is_normalized_once(monkeypatch):
+    normalized_rows = []
+    monkeypatch.setitem(preprocessing.SCHEMES, PREWHITEN,
+                        lambda imgs: normalized_rows.append(len(imgs)) or imgs)
+    faces = _faces(4)
+
+    with face_preprocessing(faces):
+        first = normalized_faces(faces[1:3], PREWHITEN)
+        second = normalized_faces(faces, PREWHITEN)
+        third = normalized_faces([faces[3], faces[0]], PREWHITEN)
+
+    assert sum(normalized_rows) == 4
+    assert np.shares_memory(first, second) and not np.shares_memory(third, second)
+    assert np.array_equal(third[1], faces[0]._face_img.astype(np.float32))
+
+
+def test__given_finished_detection__when_detecting_again__then_reuses_pooled_buffer():
+    buffer_pool.clear()
+    before = buffer_pool.stats
+    for _ in range(3):
+        faces = _faces(3)
+        with face_preprocessing(faces):
+            normalized_faces(faces, PREWHITEN)
+
+    after = buffer_pool.stats
+    assert (after.allocations - before.allocations, after.reuses - before.reuses) == (1, 2)
@@ -0,0 +1,91 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import attr
+import numpy as np
+
+from src.constants import ENV
+
+
+@attr.s(auto_attribs=True)
+class BufferPoolStats:
+    allocations: int = 0
+    reuses: int = 0
+    bytes: int = 0
+
+
+class BufferPool:
+    """
+    Reusable buffers of each thread, keyed by shape and dtype, so per-request arrays of detectors
+    and plugins are not allocated again and the heap is not fragmented by them under sustained load.
+    The first dimension (batch size) is rounded up to a power of two, `acquire` returns a view of the needed rows.
+    At most `max_bytes` of released buffers are kept per thread (0 - every buffer is allocated anew).
+    >>> pool = BufferPool(max_bytes=1024)
+    >>> first = pool.acquire((3, 4)); pool.release(first)
+    >>> second = pool.acquire((4, 4))
+    >>> second.shape, np.shares_memory(first, second), pool.stats
+    ((4, 4), True, BufferPoolStats(allocations=1, reuses=1, bytes=0))
+    >>> pool.release(second); pool.acquire((4, 4), dtype=np.uint8).dtype, pool.stats.allocations
+    (dtype('uint8'), 2)
+    """
+
+    def __init__(self, max_bytes: int = ENV.BUFFER_POOL_SIZE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _state(self) -> Tuple[Dict[Tuple[Tuple[int, ...], np.dtype], List[np.ndarray]], BufferPoolStats]:
+        if not hasattr(self._local, 'free'):
+            self._local.free = defaultdict(list)
+            self._local.stats = BufferPoolStats()
+        return self._local.free, self._local.stats
+
+    @property
+    def stats(self) -> BufferPoolStats:
+        """ Counters of the current thread """
+        return attr.evolve(self._state()[1])
+
+    def acquire(self, shape: Tuple[int, ...], dtype=np.float32) -> np.ndarray:
+        """ Uninitialized array """
+        free, stats = self._state()
+        rows, item_shape, dtype = shape[0], tuple(shape[1:]), np.dtype(dtype)
+        capacity = 1 << max(rows - 1, 0).bit_length()
+        buffers = free[((capacity,) + item_shape, dtype)]
+        if buffers:
+            buffer = buffers.pop()
+            stats.reuses += 1
+            stats.bytes -= buffer.nbytes
+        else:
+            buffer = np.empty((capacity,) + item_shape, dtype=dtype)
+            stats.allocations += 1
+        return buffer[:rows]
+
+    def release(self, array: np.ndarray):
+        """ Returns an array of `acquire` to the pool, it must not be used after """
+        free, stats = self._state()
+        buffer = array if array.base is None else array.base
+        if stats.bytes + buffer.nbytes <= self.max_bytes:
+            free[(buffer.shape, buffer.dtype)].append(buffer)
+            stats.bytes += buffer.nbytes
+
+    def clear(self):
+        free, stats = self._state()
+        free.clear()
+        stats.bytes = 0
+
+
+buffer_pool = BufferPool()
@@ -0,0 +1,124 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+import os
+from typing import List, Tuple
+
+import attr
+import cv2
+from threadpoolctl import threadpool_limits
+
+from src.constants import ENV
+from src.services.utils.pyutils import run_once_fork_safe
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ThreadsConfig:
+    cpus: Tuple[int, ...]
+    intra_op: int
+    inter_op: int
+    opencv: int
+    blas: int
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_worker() -> Tuple[int, int]:
+    """ Returns the index of the current uWSGI worker (from 0) and the count of workers """
+    try:
+        import uwsgi
+    except ImportError:
+        return 0, 1
+    return max(uwsgi.worker_id() - 1, 0), max(uwsgi.numproc, 1)
+
+
+def split_cpus(cpus: List[int], worker_idx: int, workers: int) -> List[int]:
+    """
+    Returns the CPUs of the worker, workers share CPUs only if there are more workers than CPUs.
+    >>> split_cpus([0, 1, 2, 3, 4], 1, 2), split_cpus([0, 1], 2, 3)
+    ([2, 3], [0])
+    """
+    per_worker = max(len(cpus) // workers, 1)
+    start = worker_idx * per_worker % len(cpus)
+    return cpus[start:start + per_worker]
+
+
+def get_threads_config(cpus: List[int], workers: int = 1) -> ThreadsConfig:
+    """
+    Thread counts from ENV, `0` means a thread per CPU of the worker (one inter-op thread).
+    >>> get_threads_config([0, 1, 2, 3], workers=2)
+    ThreadsConfig(cpus=(0, 1, 2, 3), intra_op=2, inter_op=1, opencv=2, blas=2)
+    """
+    cpu_count = max(len(cpus) // workers, 1)
+    return ThreadsConfig(cpus=tuple(cpus),
+                         intra_op=ENV.INTRA_OP_THREADS or cpu_count,
+                         inter_op=ENV.INTER_OP_THREADS or 1,
+                         opencv=ENV.OPENCV_THREADS or cpu_count,
+                         blas=ENV.BLAS_THREADS or cpu_count)
+
+
+@run_once_fork_safe
+def init_threads() -> ThreadsConfig:
+    """
+    Sets thread pools of Tensorflow, MXNet, OpenCV and BLAS libraries and pins the worker to its CPUs.
+    Runs again in forked workers, plugins call it before creating their sessions.
+    """
+    worker_idx, workers = get_worker()
+    cpus, sharing_workers = available_cpus(), workers
+    if ENV.CPU_AFFINITY and hasattr(os, 'sched_setaffinity'):
+        cpus, sharing_workers = split_cpus(cpus, worker_idx, workers), 1
+        os.sched_setaffinity(0, cpus)
+    config = get_threads_config(cpus, sharing_workers)
+
+    # read by libraries that are not loaded yet (MXNet engine, OpenMP and BLAS runtimes)
+    os.environ['OMP_NUM_THREADS'] = str(config.intra_op)
+    os.environ['MXNET_CPU_WORKER_NTHREADS'] = str(config.inter_op)
+    for blas_variable in ('OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[blas_variable] = str(config.blas)
+    # runtimes that are already loaded, e.g. BLAS of numpy
+    threadpool_limits(limits=config.blas, user_api='blas')
+    threadpool_limits(limits=config.intra_op, user_api='openmp')
+    cv2.setNumThreads(config.opencv)
+    _set_tensorflow_threads(config)
+
+    logger.debug(f"Worker {worker_idx + 1}/{workers} threads: {config}")
+    return config
+
+
+def _set_tensorflow_threads(config: ThreadsConfig):
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(config.intra_op)
+        tf.config.threading.set_inter_op_parallelism_threads(config.inter_op)
+    except RuntimeError:
+        # the eager context has been initialized, only new sessions get the thread counts
+        logger.debug("Tensorflow eager context is already initialized")
+
+
+def tf_session_config(**kwargs):
+    """ `ConfigProto` for Tensorflow 1 sessions, they don't use thread settings of the eager context """
+    import tensorflow.compat.v1 as tf1
+    config = init_threads()
+    return tf1.ConfigProto(intra_op_parallelism_threads=config.intra_op,
+                           inter_op_parallelism_threads=config.inter_op, **kwargs)
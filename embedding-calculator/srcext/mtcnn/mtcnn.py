@@ -33,7 +33,6 @@ import numpy as np
 import pkg_resources
 
 from mtcnn.exceptions import InvalidImage
-from mtcnn.network.factory import NetworkFactory
 
 __author__ = "Iván de Paz Centeno"
 
@@ -56,6 +55,21 @@ class StageStatus(object):
         s.dy, s.edy, s.dx, s.edx, s.y, s.ey, s.x, s.ex, s.tmpw, s.tmph = pad_result
 
 
+class NewArrays(object):
+    """
+    Allocates every array anew. A buffer pool with the same methods can be given to MTCNN instead,
+    so the arrays of each frame are reused
+    """
+
+    @staticmethod
+    def acquire(shape: tuple, dtype=np.float32):
+        return np.empty(shape, dtype=dtype)
+
+    @staticmethod
+    def release(array):
+        pass
+
+
 class MTCNN(object):
     """
     Allows to perform MTCNN Detection ->
@@ -64,7 +78,7 @@ class MTCNN(object):
     """
 
     def __init__(self, weights_file: str = None, min_face_size: int = 20, steps_threshold: list = None,
-                 scale_factor: float = 0.709):
+                 scale_factor: float = 0.709, nets: tuple = None, buffer_pool=None):
         """
         Initializes the MTCNN.
         :param weights_file: file uri with the weights of the P, R and O networks from MTCNN. By default it will load
@@ -72,18 +86,25 @@ class MTCNN(object):
         :param min_face_size: minimum size of the face to detect
         :param steps_threshold: step's thresholds values
         :param scale_factor: scale factor
+        :param nets: callables to use as P, R and O networks instead of the Keras networks built from weights
+        :param buffer_pool: `acquire(shape, dtype)`/`release(array)` provider of the per-frame arrays
         """
         if steps_threshold is None:
             steps_threshold = [0.6, 0.7, 0.7]
 
-        if weights_file is None:
-            weights_file = pkg_resources.resource_stream('mtcnn', 'data/mtcnn_weights.npy')
-
         self._min_face_size = min_face_size
         self._steps_threshold = steps_threshold
         self._scale_factor = scale_factor
+        self._buffer_pool = buffer_pool or NewArrays()
 
-        self._pnet, self._rnet, self._onet = NetworkFactory().build_P_R_O_nets_from_file(weights_file)
+        if nets is None:
+            # imported here so that networks from other runtimes do not need Tensorflow
+            from mtcnn.network.factory import NetworkFactory
+
+            if weights_file is None:
+                weights_file = pkg_resources.resource_stream('mtcnn', 'data/mtcnn_weights.npy')
+            nets = NetworkFactory().build_P_R_O_nets_from_file(weights_file)
+        self._pnet, self._rnet, self._onet = nets
 
     @property
     def min_face_size(self):
@@ -106,13 +127,12 @@ class MTCNN(object):
             factor_count += 1
         return scales
 
-    @staticmethod
-    def __scale_image(image, scale: float):
+    def __scale_image(self, image, scale: float):
         """
         Scales the image to a given scale.
         :param image:
         :param scale:
-        :return:
+        :return: normalized image batch (1, height, width, 3) of the buffer pool
         """
 
         height, width, _ = image.shape
@@ -122,8 +142,10 @@ class MTCNN(object):
 
         im_data = cv2.resize(image, (width_scaled, height_scaled), interpolation=cv2.INTER_AREA)
 
-        # Normalize the image's pixels
-        im_data_normalized = (im_data - 127.5) * 0.0078125
+        # Normalize the image's pixels, in a single float32 array
+        im_data_normalized = self._buffer_pool.acquire((1,) + im_data.shape)
+        np.subtract(im_data, 127.5, out=im_data_normalized[0], dtype=np.float32)
+        im_data_normalized *= 0.0078125
 
         return im_data_normalized
 
@@ -335,11 +357,11 @@ class MTCNN(object):
 
         for scale in scales:
             scaled_image = self.__scale_image(image, scale)
-
-            img_x = np.expand_dims(scaled_image, 0)
-            img_y = np.transpose(img_x, (0, 2, 1, 3))
-
-            out = self._pnet(img_y)
+            try:
+                img_y = np.transpose(scaled_image, (0, 2, 1, 3))
+                out = self._pnet(img_y)
+            finally:
+                self._buffer_pool.release(scaled_image)
 
             out0 = np.transpose(out[0], (0, 2, 1, 3))
             out1 = np.transpose(out[1], (0, 2, 1, 3))
@@ -375,6 +397,39 @@ class MTCNN(object):
                                  width=stage_status.width, height=stage_status.height)
         return total_boxes, status
 
+    def __crop_boxes(self, img, status: StageStatus, num_boxes: int, size: int):
+        """
+        Crops the padded boxes and resizes them to the input of the next network.
+        :param img:
+        :param status: padding of the boxes
+        :param num_boxes:
+        :param size: input size of the network
+        :return: normalized batch (num_boxes, size, size, 3) of the buffer pool, None if a box is invalid
+        """
+        tempimg = self._buffer_pool.acquire((num_boxes, size, size, 3))
+        # one zero-padded crop buffer for all boxes, sized up to powers of two to be reused by next frames
+        max_h, max_w = (1 << (int(np.max(sizes)) - 1).bit_length() for sizes in (status.tmph, status.tmpw))
+        crop_buffer = self._buffer_pool.acquire((1, max_h, max_w, 3), dtype=np.float64)
+        try:
+            for k in range(0, num_boxes):
+                tmp = crop_buffer[0, :int(status.tmph[k]), :int(status.tmpw[k])]
+                tmp.fill(0)
+
+                tmp[status.dy[k] - 1:status.edy[k], status.dx[k] - 1:status.edx[k], :] = \
+                    img[status.y[k] - 1:status.ey[k], status.x[k] - 1:status.ex[k], :]
+
+                if tmp.shape[0] > 0 and tmp.shape[1] > 0 or tmp.shape[0] == 0 and tmp.shape[1] == 0:
+                    tempimg[k] = cv2.resize(tmp, (size, size), interpolation=cv2.INTER_AREA)
+                else:
+                    self._buffer_pool.release(tempimg)
+                    return None
+        finally:
+            self._buffer_pool.release(crop_buffer)
+
+        tempimg -= 127.5
+        tempimg *= 0.0078125
+        return tempimg
+
     def __stage2(self, img, total_boxes, stage_status: StageStatus):
         """
         Second stage of the MTCNN.
@@ -388,24 +443,15 @@ class MTCNN(object):
             return total_boxes, stage_status
 
         # second stage
-        tempimg = np.zeros(shape=(24, 24, 3, num_boxes))
-
-        for k in range(0, num_boxes):
-            tmp = np.zeros((int(stage_status.tmph[k]), int(stage_status.tmpw[k]), 3))
-
-            tmp[stage_status.dy[k] - 1:stage_status.edy[k], stage_status.dx[k] - 1:stage_status.edx[k], :] = \
-                img[stage_status.y[k] - 1:stage_status.ey[k], stage_status.x[k] - 1:stage_status.ex[k], :]
-
-            if tmp.shape[0] > 0 and tmp.shape[1] > 0 or tmp.shape[0] == 0 and tmp.shape[1] == 0:
-                tempimg[:, :, :, k] = cv2.resize(tmp, (24, 24), interpolation=cv2.INTER_AREA)
-
-            else:
-                return np.empty(shape=(0,)), stage_status
+        tempimg = self.__crop_boxes(img, stage_status, num_boxes, 24)
+        if tempimg is None:
+            return np.empty(shape=(0,)), stage_status
 
-        tempimg = (tempimg - 127.5) * 0.0078125
-        tempimg1 = np.transpose(tempimg, (3, 1, 0, 2))
-
-        out = self._rnet(tempimg1)
+        try:
+            tempimg1 = np.transpose(tempimg, (0, 2, 1, 3))
+            out = self._rnet(tempimg1)
+        finally:
+            self._buffer_pool.release(tempimg)
 
         out0 = np.transpose(out[0])
         out1 = np.transpose(out[1])
@@ -445,24 +491,15 @@ class MTCNN(object):
         status = StageStatus(self.__pad(total_boxes.copy(), stage_status.width, stage_status.height),
                              width=stage_status.width, height=stage_status.height)
 
-        tempimg = np.zeros((48, 48, 3, num_boxes))
-
-        for k in range(0, num_boxes):
-
-            tmp = np.zeros((int(status.tmph[k]), int(status.tmpw[k]), 3))
-
-            tmp[status.dy[k] - 1:status.edy[k], status.dx[k] - 1:status.edx[k], :] = \
-                img[status.y[k] - 1:status.ey[k], status.x[k] - 1:status.ex[k], :]
+        tempimg = self.__crop_boxes(img, status, num_boxes, 48)
+        if tempimg is None:
+            return np.empty(shape=(0,)), np.empty(shape=(0,))
 
-            if tmp.shape[0] > 0 and tmp.shape[1] > 0 or tmp.shape[0] == 0 and tmp.shape[1] == 0:
-                tempimg[:, :, :, k] = cv2.resize(tmp, (48, 48), interpolation=cv2.INTER_AREA)
-            else:
-                return np.empty(shape=(0,)), np.empty(shape=(0,))
-
-        tempimg = (tempimg - 127.5) * 0.0078125
-        tempimg1 = np.transpose(tempimg, (3, 1, 0, 2))
-
-        out = self._onet(tempimg1)
+        try:
+            tempimg1 = np.transpose(tempimg, (0, 2, 1, 3))
+            out = self._onet(tempimg1)
+        finally:
+            self._buffer_pool.release(tempimg)
         out0 = np.transpose(out[0])
         out1 = np.transpose(out[1])
         out2 = np.transpose(out[2])
@@ -0,0 +1,69 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+import tracemalloc
+
+import numpy as np
+
+from sample_images import IMG_DIR
+from sample_images.annotations import SAMPLE_IMAGES
+from src.constants import ENV_MAIN, LOGGING_LEVEL
+from src.init_runtime import init_runtime
+from src.services.facescan.plugins.face_cache import face_plugin_cache
+from src.services.facescan.plugins.managers import plugin_manager
+from src.services.imgtools.read_img import read_img
+from src.services.utils.buffer_pool import buffer_pool
+from src.services.utils.pyutils import Constants, get_env, get_env_split
+
+logger = logging.getLogger(__name__)
+
+
+class ENV(Constants):
+    LOGGING_LEVEL_NAME = ENV_MAIN.LOGGING_LEVEL_NAME
+    IMG_NAMES = get_env_split('IMG_NAMES', ' '.join(row.img_name for row in SAMPLE_IMAGES[:5]))
+    REPEATS = int(get_env('REPEATS', '3'))
+    POOL_SIZES_MB = [int(size) for size in get_env_split('POOL_SIZES_MB', f'0 {ENV_MAIN.BUFFER_POOL_SIZE_MB}')]
+
+
+def _measure(images):
+    """ Returns pooled buffer allocations per request and the average peak of traced memory in MB """
+    before = buffer_pool.stats
+    peaks = []
+    for _ in range(ENV.REPEATS):
+        for img in images:
+            face_plugin_cache.clear()
+            tracemalloc.start()
+            plugin_manager.detector(img, face_plugins=plugin_manager.face_plugins)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    requests = ENV.REPEATS * len(images)
+    return (buffer_pool.stats.allocations - before.allocations) / requests, np.mean(peaks) / 2 ** 20
+
+
+if __name__ == '__main__':
+    init_runtime(logging_level=LOGGING_LEVEL)
+    logger.info(ENV.to_json() if ENV_MAIN.IS_DEV_ENV else ENV.to_str())
+
+    images = [read_img(IMG_DIR / img_name) for img_name in ENV.IMG_NAMES]
+    plugin_manager.detector(images[0], face_plugins=plugin_manager.face_plugins)  # loads the models
+    print(f"Plugins: {', '.join(str(plugin) for plugin in plugin_manager.face_plugins)}")
+
+    for pool_size_mb in ENV.POOL_SIZES_MB:
+        buffer_pool.max_bytes = pool_size_mb * 2 ** 20
+        buffer_pool.clear()
+        plugin_manager.detector(images[0], face_plugins=plugin_manager.face_plugins)
+        allocations, peak_mb = _measure(images)
+        print(f"BUFFER_POOL_SIZE_MB={pool_size_mb}: {allocations:.2f} buffer allocations per request, "
+              f"peak traced memory {peak_mb:.1f} MB")
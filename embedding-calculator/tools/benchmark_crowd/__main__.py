@@ -0,0 +1,81 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+from time import time
+
+import cv2
+import numpy as np
+
+from sample_images import IMG_DIR
+from sample_images.annotations import SAMPLE_IMAGES
+from src.constants import ENV_MAIN, LOGGING_LEVEL
+from src.init_runtime import init_runtime
+from src.services.facescan.plugins.face_cache import face_plugin_cache
+from src.services.facescan.plugins.managers import plugin_manager
+from src.services.imgtools.read_img import read_img
+from src.services.utils.pyutils import Constants, get_env, get_env_split
+
+logger = logging.getLogger(__name__)
+
+
+class ENV(Constants):
+    LOGGING_LEVEL_NAME = ENV_MAIN.LOGGING_LEVEL_NAME
+    IMG_NAMES = get_env_split('IMG_NAMES', ' '.join(row.img_name for row in SAMPLE_IMAGES if len(row.noses) >= 5))
+    LIMITS = [int(limit) for limit in get_env_split('LIMITS', '0 1 5')]
+    REPEATS = int(get_env('REPEATS', '3'))
+    TILE_WIDTH = 640
+
+
+def _crowd_img():
+    """ Group photos side by side, in rows of two """
+    tiles = []
+    for img_name in ENV.IMG_NAMES:
+        img = read_img(IMG_DIR / img_name)
+        height = round(img.shape[0] * ENV.TILE_WIDTH / img.shape[1])
+        tiles.append(cv2.resize(img, (ENV.TILE_WIDTH, height)))
+    if len(tiles) % 2:
+        tiles.append(np.zeros_like(tiles[-1]))
+    rows = []
+    for left, right in zip(tiles[::2], tiles[1::2]):
+        height = max(left.shape[0], right.shape[0])
+        rows.append(np.hstack([np.pad(tile, ((0, height - tile.shape[0]), (0, 0), (0, 0))) for tile in (left, right)]))
+    return np.vstack(rows)
+
+
+def _benchmark(img, limit: int):
+    """ Returns the count of processed faces and seconds per image """
+    faces = []
+    start = time()
+    for _ in range(ENV.REPEATS):
+        face_plugin_cache.clear()
+        faces = plugin_manager.detector(img, face_plugins=plugin_manager.face_plugins, limit=limit)
+    return len(faces), (time() - start) / ENV.REPEATS
+
+
+if __name__ == '__main__':
+    init_runtime(logging_level=LOGGING_LEVEL)
+    logger.info(ENV.to_json() if ENV_MAIN.IS_DEV_ENV else ENV.to_str())
+
+    img = _crowd_img()
+    plugin_manager.detector(img, face_plugins=plugin_manager.face_plugins)  # loads the models
+    print(f"Crowd image {img.shape[1]}x{img.shape[0]} of {len(ENV.IMG_NAMES)} photos, "
+          f"plugins: {', '.join(str(plugin) for plugin in plugin_manager.face_plugins)}")
+
+    all_faces_time = None
+    for limit in ENV.LIMITS:
+        face_count, seconds = _benchmark(img, limit)
+        all_faces_time = all_faces_time or (seconds if not limit else None)
+        speedup = f", x{all_faces_time / seconds:.1f} faster than all faces" if all_faces_time and limit else ''
+        print(f"limit={limit}: {face_count} faces processed in {seconds * 1000:.0f} ms{speedup}")
@@ -0,0 +1,103 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+import tempfile
+from time import time
+
+import numpy as np
+
+from src.constants import ENV_MAIN, LOGGING_LEVEL
+from src.init_runtime import init_runtime
+from src.services.gallery.gallery import Gallery
+from src.services.utils.pyutils import Constants, get_env, get_env_split
+
+logger = logging.getLogger(__name__)
+
+
+class ENV(Constants):
+    LOGGING_LEVEL_NAME = ENV_MAIN.LOGGING_LEVEL_NAME
+    GALLERY_SIZES = [int(size) for size in get_env_split('GALLERY_SIZES', '10000 100000 1000000')]
+    EMBEDDING_SIZE = int(get_env('EMBEDDING_SIZE', '512'))
+    QUERY_COUNT = int(get_env('QUERY_COUNT', '200'))
+    QUERY_NOISE = float(get_env('QUERY_NOISE', '0.5'))
+    CHUNK_SIZE = 100000
+
+
+def _embeddings(count, seed):
+    return np.random.RandomState(seed).normal(size=(count, ENV.EMBEDDING_SIZE)).astype(np.float32)
+
+
+def _fill(gallery: Gallery, size: int):
+    for start in range(0, size, ENV.CHUNK_SIZE):
+        count = min(ENV.CHUNK_SIZE, size - start)
+        gallery.add_many([str(i) for i in range(start, start + count)], _embeddings(count, seed=start))
+
+
+def _queries(size: int):
+    rng = np.random.RandomState(size)
+    subjects = rng.choice(size, ENV.QUERY_COUNT, replace=False)
+    queries, chunks = [], {}
+    for subject in subjects:
+        chunk_start = subject // ENV.CHUNK_SIZE * ENV.CHUNK_SIZE
+        if chunk_start not in chunks:
+            chunks[chunk_start] = _embeddings(min(ENV.CHUNK_SIZE, size - chunk_start), seed=chunk_start)
+        embedding = chunks[chunk_start][subject - chunk_start]
+        queries.append(embedding + rng.normal(size=embedding.shape).astype(np.float32) * ENV.QUERY_NOISE)
+    return [str(s) for s in subjects], queries
+
+
+def _run_queries(gallery: Gallery, queries):
+    gallery.search(queries[0])  # builds/trains the index
+    start = time()
+    found = [gallery.search(query)[0].subject for query in queries]
+    return found, len(queries) / (time() - start)
+
+
+def _benchmark(size: int):
+    gallery = Gallery(index_type='exact')
+    start = time()
+    _fill(gallery, size)
+    print(f"[{size}] Added {size} embeddings in {time() - start:.1f}s")
+    subjects, queries = _queries(size)
+
+    exact_found, exact_qps = _run_queries(gallery, queries)
+    exact_recall = np.mean([a == b for a, b in zip(exact_found, subjects)])
+    print(f"[{size}] exact: {exact_qps:.1f} queries/s, recall@1 {exact_recall:.3f}")
+
+    gallery.index_type = 'ivf'
+    start = time()
+    gallery.search(queries[0])
+    print(f"[{size}] ivf: trained {gallery.index.nlist} lists in {time() - start:.1f}s, "
+          f"nprobe {gallery.index.nprobe}")
+    ivf_found, ivf_qps = _run_queries(gallery, queries)
+    ivf_recall = np.mean([a == b for a, b in zip(ivf_found, exact_found)])
+    print(f"[{size}] ivf: {ivf_qps:.1f} queries/s, recall@1 vs exact {ivf_recall:.3f}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time()
+        gallery.save(tmp_dir)
+        saved_in = time() - start
+        start = time()
+        loaded = Gallery.load(tmp_dir, index_type='ivf')
+        loaded.search(queries[0])
+        print(f"[{size}] snapshot: saved in {saved_in:.1f}s, loaded and searched in {time() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    init_runtime(logging_level=LOGGING_LEVEL)
+    logger.info(ENV.to_json() if ENV_MAIN.IS_DEV_ENV else ENV.to_str())
+
+    for gallery_size in ENV.GALLERY_SIZES:
+        _benchmark(gallery_size)
@@ -0,0 +1,104 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import json
+import logging
+import os
+import subprocess
+import sys
+from itertools import product
+from time import time
+
+from sample_images import IMG_DIR
+from sample_images.annotations import SAMPLE_IMAGES
+from src.constants import ENV_MAIN, LOGGING_LEVEL
+from src.init_runtime import init_runtime
+from src.services.facescan.plugins.managers import plugin_manager
+from src.services.imgtools.read_img import read_img
+from src.services.utils.cpu_threads import available_cpus, split_cpus
+from src.services.utils.pyutils import Constants, get_env, get_env_split
+
+logger = logging.getLogger(__name__)
+
+
+class ENV(Constants):
+    LOGGING_LEVEL_NAME = ENV_MAIN.LOGGING_LEVEL_NAME
+    IMG_NAMES = get_env_split('IMG_NAMES', ' '.join(row.img_name for row in SAMPLE_IMAGES[:5]))
+    CORE_COUNTS = [int(count) for count in get_env_split('CORE_COUNTS', '1 2 4 8')]
+    WORKER_COUNTS = [int(count) for count in get_env_split('WORKER_COUNTS', '1 2 4')]
+    INTRA_OP_THREADS = [int(count) for count in get_env_split('SWEEP_INTRA_OP_THREADS', '1 2 4')]
+    INTER_OP_THREADS = [int(count) for count in get_env_split('SWEEP_INTER_OP_THREADS', '1 2')]
+    REPEATS = int(get_env('REPEATS', '3'))
+    WORKER_CPUS = get_env('WORKER_CPUS', '')
+
+
+def _run_worker():
+    """ Runs in a subprocess pinned to WORKER_CPUS, waits for the parent to start all workers at once """
+    os.sched_setaffinity(0, [int(cpu) for cpu in ENV.WORKER_CPUS.split(',')])
+    init_runtime(logging_level=logging.WARNING)
+    images = [read_img(IMG_DIR / img_name) for img_name in ENV.IMG_NAMES]
+    plugin_manager.detector(images[0], face_plugins=plugin_manager.face_plugins)  # loads the models
+    print('ready', flush=True)
+    sys.stdin.readline()
+
+    start = time()
+    for _ in range(ENV.REPEATS):
+        for img in images:
+            plugin_manager.detector(img, face_plugins=plugin_manager.face_plugins)
+    print(json.dumps({'images_per_second': ENV.REPEATS * len(images) / (time() - start)}), flush=True)
+
+
+def _benchmark(cpus, workers, intra_op, inter_op) -> float:
+    """ Returns the throughput of all workers sharing the CPUs, in images per second """
+    processes = []
+    for worker_idx in range(workers):
+        env = dict(os.environ,
+                   WORKER_CPUS=','.join(str(cpu) for cpu in split_cpus(cpus, worker_idx, workers)),
+                   INTRA_OP_THREADS=str(intra_op), INTER_OP_THREADS=str(inter_op),
+                   OPENCV_THREADS=str(intra_op), BLAS_THREADS=str(intra_op),
+                   CPU_AFFINITY='false', FACE_PLUGIN_CACHE_SIZE_MB='0')
+        processes.append(subprocess.Popen([sys.executable, '-m', 'tools.benchmark_threads'], env=env,
+                                          stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+    for process in processes:
+        assert process.stdout.readline().strip() == 'ready', "Worker failed to load the models"
+    for process in processes:
+        process.stdin.write('\n')
+        process.stdin.flush()
+    results = [json.loads(process.communicate()[0]) for process in processes]
+    return sum(result['images_per_second'] for result in results)
+
+
+if __name__ == '__main__':
+    if ENV.WORKER_CPUS:
+        _run_worker()
+        sys.exit()
+
+    init_runtime(logging_level=LOGGING_LEVEL)
+    logger.info(ENV.to_json() if ENV_MAIN.IS_DEV_ENV else ENV.to_str())
+    all_cpus = available_cpus()
+
+    for core_count in [count for count in ENV.CORE_COUNTS if count <= len(all_cpus)]:
+        cpus = all_cpus[:core_count]
+        best = None
+        for workers, intra_op, inter_op in product(ENV.WORKER_COUNTS, ENV.INTRA_OP_THREADS, ENV.INTER_OP_THREADS):
+            if workers > core_count or workers * intra_op > core_count:
+                continue
+            throughput = _benchmark(cpus, workers, intra_op, inter_op)
+            print(f"[{core_count} cores] workers={workers} intra_op={intra_op} inter_op={inter_op}: "
+                  f"{throughput:.2f} images/s")
+            if best is None or throughput > best[0]:
+                best = throughput, workers, intra_op, inter_op
+        if best:
+            print(f"[{core_count} cores] best: {best[0]:.2f} images/s with workers={best[1]} "
+                  f"intra_op={best[2]} inter_op={best[3]}\n")
@@ -0,0 +1,141 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+from contextlib import contextmanager
+from time import time
+
+import numpy as np
+
+from sample_images import IMG_DIR
+from sample_images.annotations import SAMPLE_IMAGES, name_2_person
+from src.constants import ENV_MAIN, LOGGING_LEVEL
+from src.init_runtime import init_runtime
+from src.services.facescan.plugins import base, mixins
+from src.services.facescan.plugins.managers import plugin_manager
+from src.services.facescan.plugins.precision import FLOAT32
+from src.services.imgtools.read_img import read_img
+from src.services.utils.pyutils import Constants, get_env_bool, get_env_split
+
+logger = logging.getLogger(__name__)
+
+
+class ENV(Constants):
+    LOGGING_LEVEL_NAME = ENV_MAIN.LOGGING_LEVEL_NAME
+    IMG_NAMES = get_env_split('IMG_NAMES', ' '.join(row.img_name for row in SAMPLE_IMAGES))
+    SKIP_CONVERSION = get_env_bool('SKIP_CONVERSION')
+
+
+def _detect_faces():
+    """ Returns detected faces and their persons, if an image is annotated with a single person """
+    faces, persons = [], []
+    for img_name in ENV.IMG_NAMES:
+        img_faces = plugin_manager.detector(read_img(IMG_DIR / img_name))
+        faces += img_faces
+        person = name_2_person.get(img_name) if len(img_faces) == 1 else None
+        persons += [person] * len(img_faces)
+    return faces, persons
+
+
+@contextmanager
+def _float32(plugin: base.BasePlugin):
+    precision = plugin.precision
+    plugin.precision = FLOAT32
+    try:
+        yield
+    finally:
+        plugin.precision = precision
+
+
+def _run(plugin: base.BasePlugin, faces):
+    plugin(faces[0])  # loads the model
+    start = time()
+    results = [plugin(face) for face in faces]
+    return results, (time() - start) * 1000 / len(faces)
+
+
+def _pairs(embeddings: np.ndarray, coefficients, difference_threshold):
+    """ Similarities of all embedding pairs as in the API and matches as in the scanner tests """
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    distances = np.linalg.norm(normalized[:, None] - normalized[None], axis=2)
+    similarities = (np.tanh((coefficients[0] - distances) * coefficients[1]) + 1) / 2
+    matches = ((embeddings[:, None] - embeddings[None]) ** 2).sum(axis=2) < difference_threshold
+    upper = np.triu_indices(len(embeddings), k=1)
+    return similarities[upper], matches[upper]
+
+
+def _verification_errors(matches, persons):
+    upper = np.triu_indices(len(persons), k=1)
+    known = [(m, persons[i] is persons[j]) for m, i, j in zip(matches, *upper) if persons[i] and persons[j]]
+    return sum(match != same_person for match, same_person in known), len(known)
+
+
+def _report_calculator(plugin: mixins.CalculatorMixin, reference, converted, persons):
+    reference = np.array([dto.embedding for dto in reference], dtype=np.float64)
+    converted = np.array([dto.embedding for dto in converted], dtype=np.float64)
+    cosines = (reference * converted).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(converted, axis=1))
+    print(f"[{plugin}] cosine similarity to float32 embeddings: min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+
+    ml_model = plugin.ml_model
+    ref_similarities, ref_matches = _pairs(reference, ml_model.similarity_coefficients, ml_model.difference_threshold)
+    similarities, matches = _pairs(converted, ml_model.similarity_coefficients, ml_model.difference_threshold)
+    diff = np.abs(similarities - ref_similarities)
+    print(f"[{plugin}] similarity difference over {len(diff)} face pairs: max {diff.max():.4f}, "
+          f"mean {diff.mean():.4f}; match decisions changed: {int((matches != ref_matches).sum())}")
+    ref_errors, known = _verification_errors(ref_matches, persons)
+    errors, _ = _verification_errors(matches, persons)
+    print(f"[{plugin}] verification errors on annotated persons: {errors}/{known} (float32: {ref_errors}/{known})")
+
+
+def _report_classifier(plugin: base.BasePlugin, reference, converted):
+    agreed, probability_diff = 0, 0.0
+    for ref_dto, dto in zip(reference, converted):
+        ref_value, value = ref_dto.to_json()[plugin.slug], dto.to_json()[plugin.slug]
+        ref_probability, probability = ref_value.pop('probability'), value.pop('probability')
+        agreed += ref_value == value
+        probability_diff = max(probability_diff, abs(probability - ref_probability))
+    print(f"[{plugin}] same labels as float32: {agreed}/{len(reference)}, "
+          f"max probability difference {probability_diff:.4f}")
+
+
+def _calibrate(plugin: base.BasePlugin, faces, persons):
+    with _float32(plugin):
+        reference, reference_ms = _run(plugin, faces)
+    if not ENV.SKIP_CONVERSION:
+        start = time()
+        plugin.convert_precision([face._face_img for face in faces])
+        print(f"[{plugin}] converted in {time() - start:.1f}s using {len(faces)} faces")
+    converted, converted_ms = _run(plugin, faces)
+
+    print(f"[{plugin}] {reference_ms:.1f} ms/face in float32, {converted_ms:.1f} ms/face in {plugin.precision} "
+          f"(x{reference_ms / converted_ms:.2f})")
+    if isinstance(plugin, mixins.CalculatorMixin):
+        _report_calculator(plugin, reference, converted, persons)
+    else:
+        _report_classifier(plugin, reference, converted)
+
+
+if __name__ == '__main__':
+    init_runtime(logging_level=LOGGING_LEVEL)
+    logger.info(ENV.to_json() if ENV_MAIN.IS_DEV_ENV else ENV.to_str())
+
+    plugins = [plugin for plugin in plugin_manager.face_plugins if plugin.is_reduced_precision]
+    if not plugins:
+        logger.error("No plugins with reduced precision, e.g. set "
+                     "CALCULATION_PLUGIN=insightface.Calculator@arcface_mobilefacenet:int8")
+        exit(1)
+    faces, persons = _detect_faces()
+    for reduced_precision_plugin in plugins:
+        _calibrate(reduced_precision_plugin, faces, persons)
@@ -0,0 +1,133 @@
+#  Copyright (c) 2020 the original author or authors
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#       https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+#  or implied. See the License for the specific language governing
+#  permissions and limitations under the License.
+
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from src.constants import ENV_MAIN, LOGGING_LEVEL
+from src.init_runtime import init_runtime
+from src.services.facescan.plugins import base
+from src.services.facescan.plugins.managers import ML_MODEL_SEPARATOR, create_plugin, import_classes
+from src.services.facescan.plugins.onnx import onnx as onnx_plugins
+from src.services.utils.pyutils import Constants, get_env, get_env_split
+
+logger = logging.getLogger(__name__)
+
+
+class ENV(Constants):
+    LOGGING_LEVEL_NAME = ENV_MAIN.LOGGING_LEVEL_NAME
+    SOURCE_PLUGINS = get_env_split('SOURCE_PLUGINS', 'facenet.FaceDetector facenet.Calculator agegender.AgeDetector '
+                                                     'agegender.GenderDetector facenet.facemask.MaskDetector')
+    OPSET = int(get_env('OPSET', '11'))
+
+
+def _convert_keras(model, output_file: Path):
+    import tensorflow as tf
+    import tf2onnx
+
+    input_signature = [tf.TensorSpec(model.inputs[0].shape, tf.float32, name='input')]
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=ENV.OPSET,
+                               output_path=str(output_file))
+
+
+def _convert_graph_def(graph_def, input_names, output_names, output_file: Path):
+    import tf2onnx
+
+    tf2onnx.convert.from_graph_def(graph_def, input_names=input_names, output_names=output_names,
+                                   opset=ENV.OPSET, output_path=str(output_file))
+
+
+def _convert_mtcnn(plugin, path: Path):
+    from mtcnn.network.factory import NetworkFactory
+    import pkg_resources
+
+    weights_file = pkg_resources.resource_stream('mtcnn', 'data/mtcnn_weights.npy')
+    nets = NetworkFactory().build_P_R_O_nets_from_file(weights_file)
+    for name, net in zip(onnx_plugins.MTCNN_NETS, nets):
+        _convert_keras(net, path / f'{name}.onnx')
+
+
+def _convert_facenet_calculator(plugin, path: Path):
+    import tensorflow.compat.v1 as tf1
+
+    with tf1.Graph().as_default() as graph:
+        # the training-phase switch becomes a constant, ONNX models are for inference only
+        tf1.import_graph_def(plugin._read_graph_def(), name='', input_map={'phase_train:0': tf1.constant(False)})
+    _convert_graph_def(graph.as_graph_def(), ['input:0'], ['embeddings:0'], path / onnx_plugins.MODEL_FILE)
+
+
+def _convert_agegender(plugin, path: Path):
+    import tensorflow.compat.v1 as tf1
+
+    sess, images, softmax_output = plugin._restore_graph()
+    with sess:
+        graph_def = tf1.graph_util.convert_variables_to_constants(
+            sess, sess.graph.as_graph_def(), [softmax_output.op.name])
+    _convert_graph_def(graph_def, [images.name], [softmax_output.name], path / onnx_plugins.MODEL_FILE)
+
+
+def _convert_facemask(plugin, path: Path):
+    import tensorflow as tf
+
+    _convert_keras(tf.keras.models.load_model(str(plugin.ml_model.path)), path / onnx_plugins.MODEL_FILE)
+
+
+def _convert_insightface_calculator(plugin, path: Path):
+    import mxnet as mx
+
+    prefix, epoch = plugin.get_model_file(plugin.ml_model).rsplit('.', 1)[0].rsplit('-', 1)
+    sym, arg_params, aux_params = mx.model.load_checkpoint(prefix, int(epoch))
+    sym = sym.get_internals()[plugin.EMBEDDING_LAYER]
+    mx.onnx.export_model(sym, {**arg_params, **aux_params}, in_shapes=[(1, 3, 112, 112)], in_types=[np.float32],
+                         onnx_file_path=str(path / onnx_plugins.MODEL_FILE), dynamic=True,
+                         dynamic_input_shapes=[(None, 3, 112, 112)])
+
+
+CONVERTERS = {
+    'facenet.FaceDetector': _convert_mtcnn,
+    'facenet.Calculator': _convert_facenet_calculator,
+    'insightface.Calculator': _convert_insightface_calculator,
+    'agegender.AgeDetector': _convert_agegender,
+    'agegender.GenderDetector': _convert_agegender,
+    'facenet.facemask.MaskDetector': _convert_facemask,
+}
+
+
+def _onnx_model_path(plugin: base.BasePlugin) -> Path:
+    """ Path of the ONNX plugin model with the same name as the source plugin model """
+    onnx_class = import_classes(f'{onnx_plugins.__name__}.{type(plugin).__name__}')
+    model_names = [ml_model[0] for ml_model in onnx_class.ml_models]
+    model_name = plugin.ml_model.name if plugin.ml_model else model_names[0]
+    assert model_name in model_names, f"onnx.{onnx_class.__name__} does not support model '{model_name}'"
+    return Path(base.MODELS_ROOT) / 'onnx' / onnx_class.slug / model_name
+
+
+def convert(plugin_name: str):
+    plugin = create_plugin(plugin_name)
+    if plugin.ml_model:
+        plugin.ml_model.download_if_not_exists()
+    path = _onnx_model_path(plugin)
+    path.mkdir(parents=True, exist_ok=True)
+    CONVERTERS[plugin_name.split(ML_MODEL_SEPARATOR)[0]](plugin, path)
+    logger.info(f'Converted {plugin} to {path}')
+
+
+if __name__ == '__main__':
+    init_runtime(logging_level=LOGGING_LEVEL)
+    logger.info(ENV.to_json() if ENV_MAIN.IS_DEV_ENV else ENV.to_str())
+
+    for source_plugin_name in ENV.SOURCE_PLUGINS:
+        convert(source_plugin_name)